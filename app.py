@@ -0,0 +1,93 @@
+"""
+Online prediction server.
+
+The preprocessing object, trained model and target encoder are loaded once when the app is
+created and kept in memory. Concurrent /predict requests are coalesced into micro-batches,
+so that one vectorized transform/predict runs per batch. GET /drift reports the drift of
+the scored rows against the train data.
+
+    python app.py
+    gunicorn --workers 2 --threads 32 "app:create_app()"
+
+Micro-batches are formed per worker process, so gunicorn workers should serve many threads.
+"""
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from credit_score.config.Configuration import Configuration
+from credit_score.pipeline.batch_prediction import BatchPrediction
+from credit_score.pipeline.online_prediction import MicroBatcher
+from credit_score.pipeline.online_prediction import ServingMetrics
+from flask import Flask, request, jsonify
+import os, sys
+import time
+
+REQUEST_TIMEOUT_SECONDS = 30
+
+
+def create_app(prediction_config=None, data_validation_config=None) -> Flask:
+    try:
+        if prediction_config is None or data_validation_config is None:
+            config = Configuration()
+            prediction_config = prediction_config or config.get_prediction_config()
+            data_validation_config = data_validation_config or config.get_data_validation_config()
+
+        predictor = BatchPrediction(prediction_config=prediction_config,
+                                    data_validation_config=data_validation_config)
+        metrics = ServingMetrics(max_batch_size=prediction_config.max_batch_size)
+        batcher = MicroBatcher(predict_function=predictor.predict,
+                               max_batch_size=prediction_config.max_batch_size,
+                               max_batch_delay_ms=prediction_config.max_batch_delay_ms,
+                               metrics=metrics,
+                               batch_callback=predictor.drift_monitor.update
+                               if predictor.drift_monitor is not None else None)
+
+        app = Flask(__name__)
+        app.json.sort_keys = False
+
+        @app.route("/predict", methods=["POST"])
+        def predict():
+            start_time = time.perf_counter()
+            payload = request.get_json(silent=True)
+            records = payload if isinstance(payload, list) else [payload]
+            casted_records = []
+            for index, record in enumerate(records):
+                if not isinstance(record, dict):
+                    return jsonify({"error": "Request body must be a json object or a list of json objects"}), 400
+                try:
+                    casted_records.append(predictor.cast_record(record))
+                except ValueError as e:
+                    error = str(e) if not isinstance(payload, list) else f"Record {index}: {e}"
+                    return jsonify({"error": error}), 400
+
+            futures = [batcher.submit(record) for record in casted_records]
+            try:
+                predictions = [str(future.result(timeout=REQUEST_TIMEOUT_SECONDS)) for future in futures]
+            except Exception as e:
+                # The exception text has server paths and tracebacks, it is only logged
+                logging.error(f"Prediction request failed: {e}")
+                return jsonify({"error": "Prediction failed"}), 500
+            metrics.add_request(time.perf_counter() - start_time)
+
+            if isinstance(payload, list):
+                return jsonify({"predictions": predictions})
+            return jsonify({"prediction": predictions[0]})
+
+        @app.route("/metrics", methods=["GET"])
+        def get_metrics():
+            # Batches the drift monitor skipped, while it was too far behind the scoring
+            return jsonify({**metrics.to_dict(), "skipped_drift_batches": batcher.n_skipped_callbacks})
+
+        @app.route("/drift", methods=["GET"])
+        def get_drift():
+            # Drift of the rows scored since the server started against the train data
+            if predictor.drift_monitor is None:
+                return jsonify({"error": "No drift reference found, run the training pipeline first"}), 404
+            return jsonify(predictor.drift_monitor.get_report())
+
+        return app
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+if __name__ == "__main__":
+    create_app().run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), threaded=True)
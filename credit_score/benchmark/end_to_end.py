@@ -0,0 +1,386 @@
+"""
+End-to-end benchmark of the training pipeline and of batch scoring on synthetic data.
+
+For every size, credit data is generated from schema.yaml (`credit_score.benchmark.synthetic_data`)
+and given to the data ingestion as a file:// dataset url. Every size then runs in a fresh process
+working in <work dir>/<size>, with its own config, artifacts, prediction_files and logs:
+
+    pipeline : wall time of every stage of Pipeline.run_pipeline and the instrumentation summary
+               of the run, MongoDB being replaced by the in-memory stand-in (no network access)
+    scoring  : BatchPrediction of a synthetic file of the same size
+    micro    : load_data, column_check and the preprocessor (fit_transform, compiled transform),
+               fastest and median of --repeats calls
+
+The config of the runs is config.yaml with BENCHMARK_CONFIG and the --set values applied. Results
+are written to one json file with the environment and settings, and compared with a previous
+one given with --baseline (ratio of every timing, > 1 is slower).
+
+    python -m credit_score.benchmark.end_to_end [--sizes 10k,100k,1M,10M] [--output baseline.json]
+                                                [--baseline previous.json] [--work-dir dir]
+                                                [--set model_trainer_config.optuna_n_trials=50]
+"""
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from credit_score.benchmark.synthetic_data import SyntheticDataGenerator
+from credit_score.benchmark.synthetic_data import parse_size
+from credit_score.benchmark.synthetic_data import format_size
+from credit_score.utils.utils import read_yaml_file
+from credit_score.utils.utils import write_yaml_file
+from credit_score.utils.utils import get_peak_rss_mb
+from credit_score.constant import *
+from importlib import metadata
+from pathlib import Path
+import numpy as np
+import argparse
+import copy
+import json
+import os, sys
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import yaml
+
+# Changes to config.yaml for every run: every stage has to run, the searches get a small time
+# budget (the model training is compared by seconds per search trial), nothing is mirrored into the DB stand-in, which keeps the
+# documents in the memory of the benchmarked process, and the html drift page, only made
+# when evidently is installed, is left out
+BENCHMARK_CONFIG = {
+    TRAINING_PIPELINE_CONFIG_KEY: {TRAINING_PIPELINE_USE_STAGE_CACHE_KEY: False},
+    DATA_INGESTION_CONFIG_KEY: {DATA_INGESTION_MIRROR_TO_DB_KEY: False},
+    DATA_VALIDATION_CONFIG_KEY: {DATA_VALIDATION_SAVE_REPORT_PAGE_KEY: False},
+    MODEL_TRAINER_CONFIG_KEY: {MODEL_TRAINER_SEARCH_CV_KEY: 3,
+                               MODEL_TRAINER_SEARCH_TIME_BUDGET_KEY: 60,
+                               MODEL_TRAINER_OPTUNA_N_TRIALS_KEY: 20,
+                               MODEL_TRAINER_OPTUNA_TIMEOUT_KEY: 60},
+}
+GENERATION_CHUNK_SIZE = 100000
+SETTINGS_FILE_NAME = "settings.json"
+RESULT_FILE_NAME = "result.json"
+LIBRARIES = ("numpy", "pandas", "scikit-learn", "xgboost", "optuna", "pyarrow", "pymongo")
+
+
+def get_environment() -> dict:
+    environment = {"python": platform.python_version(), "platform": platform.platform(),
+                   "machine": platform.machine(), "cpu_count": os.cpu_count()}
+    for library in LIBRARIES:
+        try:
+            environment[library] = metadata.version(library)
+        except metadata.PackageNotFoundError:
+            environment[library] = None
+    return environment
+
+
+def get_run_config(config_info: dict, overrides: dict, dataset_download_url: str) -> dict:
+    """
+    Returns config.yaml with the benchmark changes and the overrides ({section: {key: value}}) applied
+    """
+    try:
+        run_config = copy.deepcopy(config_info)
+        for section_overrides in (BENCHMARK_CONFIG, overrides):
+            for section, values in section_overrides.items():
+                run_config[section].update(values)
+        run_config[DATA_INGESTION_CONFIG_KEY][DATA_INGESTION_DOWNLOAD_URL_KEY] = dataset_download_url
+        return run_config
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def parse_overrides(values: list) -> dict:
+    """
+    Returns the {section: {key: value}} of --set section.key=value arguments, values parsed as yaml
+    """
+    try:
+        overrides = {}
+        for value in values or []:
+            name, _, raw_value = value.partition("=")
+            section, _, key = name.partition(".")
+            if not section or not key or not _:
+                raise Exception(f"Config override: [{value}] is not of the form section.key=value")
+            overrides.setdefault(section, {})[key] = yaml.safe_load(raw_value)
+        return overrides
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def time_repeats(function, repeats: int) -> dict:
+    """
+    Calls function repeats times and returns the fastest and median wall time
+    """
+    seconds = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start_time)
+    return {"min_seconds": float(np.min(seconds)), "median_seconds": float(np.median(seconds)),
+            "repeats": repeats}
+
+
+def run_micro_benchmarks(config, artifacts: dict, repeats: int) -> dict:
+    """
+    Times load_data, column_check and the preprocessor on the data of the pipeline run
+    """
+    try:
+        from credit_score.components.data_validation import DataValidaton
+        from credit_score.components.data_transformation import DataTransformation
+        from credit_score.components.compiled_transformer import CompiledTransformer
+        from credit_score.components.archive_reader import ArchiveReader
+        from credit_score.entity.artifact_entity import DataIngestionArtifact
+        from credit_score.entity.artifact_entity import DataValidationArtifact
+        from credit_score.utils.utils import load_data
+        from credit_score.utils.utils import get_schema_columns
+
+        data_ingestion_artifact = DataIngestionArtifact(**artifacts["data_ingestion"])
+        data_validation_artifact = DataValidationArtifact(**artifacts["data_validation"])
+        schema_file_path = data_validation_artifact.schema_file_path
+        dataset_schema = read_yaml_file(schema_file_path)
+        target_column = dataset_schema[TARGET_COLUMN_KEY]
+        drop_columns = get_schema_columns(dataset_schema, DROP_COLUMN_KEY)
+        columns = [column for column in dataset_schema[DATASET_SCHEMA_COLUMNS_KEY] if column not in drop_columns]
+        results = {}
+
+        train_df = load_data(data_ingestion_artifact.train_file_path, schema_file_path, columns=columns)
+        results["load_data"] = {"rows": len(train_df), **time_repeats(
+            lambda: load_data(data_ingestion_artifact.train_file_path, schema_file_path, columns=columns), repeats)}
+
+        data_validation = DataValidaton(data_validation_config=config.get_data_validation_config(),
+                                        data_ingestion_config=config.get_data_ingestion_config(),
+                                        data_ingestion_artifact=data_ingestion_artifact)
+        # The raw data file is checked as the pipeline does, streamed out of the archive
+        archive_reader = ArchiveReader(data_ingestion_artifact.archive_file_path)
+        raw_member = [member for member in archive_reader.get_data_members()
+                      if os.path.basename(member) == dataset_schema["SampleFileName"]][0]
+
+        def column_check():
+            with archive_reader.open_member(raw_member) as member_file:
+                data_validation.column_check(member_file)
+
+        results["column_check"] = time_repeats(column_check, repeats)
+        results["column_check"]["rows"] = data_validation.schema_validator.n_rows_
+
+        data_transformation = DataTransformation(data_transformation_config=config.get_data_transformation_config(),
+                                                 data_ingestion_artifact=data_ingestion_artifact,
+                                                 data_validation_artifact=data_validation_artifact)
+        features = train_df.drop(columns=[target_column])
+        preprocessors = []
+
+        def fit_transform():
+            preprocessors.append(data_transformation.get_data_transformer_object())
+            preprocessors[-1].fit_transform(features)
+
+        results["preprocessor_fit_transform"] = {"rows": len(features), **time_repeats(fit_transform, repeats)}
+        compiled_preprocessor = CompiledTransformer(preprocessors[-1])
+        results["preprocessor_transform"] = {"rows": len(features), **time_repeats(
+            lambda: preprocessors[-1].transform(features), repeats)}
+        results["compiled_preprocessor_transform"] = {"rows": len(features), **time_repeats(
+            lambda: compiled_preprocessor.transform(features), repeats)}
+
+        for result in results.values():
+            result["rows_per_second"] = result["rows"] / result["min_seconds"] if result["min_seconds"] > 0 else None
+        return results
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def run_benchmark_process(run_dir: str) -> None:
+    """
+    Runs the benchmark of one size, in the process started by `run_size` in run_dir:
+    config.yaml and schema.yaml are read from run_dir/config like in a project checkout
+    """
+    try:
+        from credit_score.config.Configuration import Configuration
+        from credit_score.pipeline.training_pipeline import Pipeline
+        from credit_score.pipeline.batch_prediction import BatchPrediction
+        from credit_score.components.db_operation import MongoDB
+        from credit_score.benchmark.in_memory_mongo import InMemoryMongoClient
+        from credit_score.instrumentation import metrics
+
+        with open(os.path.join(run_dir, SETTINGS_FILE_NAME)) as settings_file:
+            settings = json.load(settings_file)
+        config = Configuration()
+        result = {"rows": settings["rows"]}
+
+        start_time = time.perf_counter()
+        pipeline = Pipeline(config=config, db=MongoDB(client=InMemoryMongoClient()))
+        summary = pipeline.run_pipeline()
+        result["pipeline"] = {"seconds": time.perf_counter() - start_time,
+                              "stages": {stage_name: stage["seconds"] for stage_name, stage in summary["stages"].items()},
+                              "trials_per_second": summary["stages"]["model_training"]["artifact"]["trials_per_second"],
+                              "instrumentation": metrics.get_summary(),
+                              "peak_rss_mb": get_peak_rss_mb()}
+        artifacts = {stage_name: stage["artifact"] for stage_name, stage in summary["stages"].items()}
+        logging.info(f"Benchmark of {settings['rows']} rows, pipeline: {result['pipeline']['stages']}")
+
+        start_time = time.perf_counter()
+        batch_prediction = BatchPrediction(prediction_config=config.get_prediction_config(),
+                                           data_validation_config=config.get_data_validation_config())
+        prediction_artifact = batch_prediction.initiate_batch_prediction(
+            input_file_path=settings["features_file_path"],
+            prediction_file_path=os.path.join(run_dir, "prediction", "features_prediction.csv"))
+        result["scoring"] = {"seconds": time.perf_counter() - start_time, "rows": prediction_artifact.n_rows,
+                             "rows_per_second": prediction_artifact.rows_per_second,
+                             "mean_chunk_latency_ms": prediction_artifact.mean_chunk_latency_ms}
+
+        result["micro"] = run_micro_benchmarks(config, artifacts, settings["repeats"])
+        result["peak_rss_mb"] = get_peak_rss_mb()
+        with open(os.path.join(run_dir, RESULT_FILE_NAME), "w") as result_file:
+            json.dump(result, result_file, indent=4, default=str)
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def prepare_data(generator: SyntheticDataGenerator, data_dir: str, n_rows: int) -> tuple:
+    """
+    Returns the dataset archive and the file to predict on of n_rows rows, generating
+    them unless an earlier run in the same work dir did
+    """
+    try:
+        size, random_state = format_size(n_rows), generator.random_state
+        archive_file_path = os.path.join(data_dir, f"dataset_clean_{size}_{random_state}.zip")
+        features_file_path = os.path.join(data_dir, f"features_{size}_{random_state}.csv")
+        if not os.path.exists(archive_file_path):
+            generator.save_dataset_archive(f"{archive_file_path}.part", n_rows, chunk_size=GENERATION_CHUNK_SIZE)
+            os.replace(f"{archive_file_path}.part", archive_file_path)
+        if not os.path.exists(features_file_path):
+            # The rows following the training data, new customers from the same distribution
+            generator.save_features_file(f"{features_file_path}.part", n_rows, chunk_size=GENERATION_CHUNK_SIZE,
+                                         start=n_rows)
+            os.replace(f"{features_file_path}.part", features_file_path)
+        return archive_file_path, features_file_path
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def run_size(n_rows: int, work_dir: str, config_info: dict, schema_file_path: str, settings: dict) -> dict:
+    """
+    Generates the data of n_rows rows and benchmarks it in a new process working in <work_dir>/<size>
+    """
+    try:
+        size = format_size(n_rows)
+        generator = SyntheticDataGenerator(read_yaml_file(schema_file_path), random_state=settings["random_state"])
+        start_time = time.perf_counter()
+        archive_file_path, features_file_path = prepare_data(generator, os.path.join(work_dir, "data"), n_rows)
+        data_seconds = time.perf_counter() - start_time
+
+        # Runs start from scratch, e.g. without the optuna study of an earlier run
+        run_dir = os.path.join(work_dir, size)
+        shutil.rmtree(run_dir, ignore_errors=True)
+        run_config = get_run_config(config_info, settings["config_overrides"], Path(archive_file_path).as_uri())
+        write_yaml_file(os.path.join(run_dir, CONFIG_DIR, CONFIG_FILE_NAME), run_config)
+        # Copied as it is, the order of the columns in the schema matters
+        data_validation_info = run_config[DATA_VALIDATION_CONFIG_KEY]
+        run_schema_file_path = os.path.join(run_dir, data_validation_info[DATA_VALIDATION_SCHEMA_DIR_KEY],
+                                            data_validation_info[DATA_VALIDATION_SCHEMA_FILE_NAME_KEY])
+        os.makedirs(os.path.dirname(run_schema_file_path), exist_ok=True)
+        shutil.copyfile(schema_file_path, run_schema_file_path)
+        with open(os.path.join(run_dir, SETTINGS_FILE_NAME), "w") as settings_file:
+            json.dump({**settings, "rows": n_rows, "features_file_path": features_file_path}, settings_file, indent=4)
+
+        logging.info(f"Benchmarking {n_rows} rows in: [{run_dir}]")
+        package_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [package_dir, os.environ.get("PYTHONPATH")]))}
+        process = subprocess.run([sys.executable, "-m", "credit_score.benchmark.end_to_end", "--run", run_dir],
+                                 cwd=run_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        result_file_path = os.path.join(run_dir, RESULT_FILE_NAME)
+        if process.returncode != 0 or not os.path.exists(result_file_path):
+            logging.error(f"Benchmark of {n_rows} rows failed: {process.stdout[-2000:]}")
+            return {"rows": n_rows, "error": process.stdout[-2000:]}
+        with open(result_file_path) as result_file:
+            result = json.load(result_file)
+        result["data_generation_seconds"] = data_seconds
+        return result
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def get_timings(result: dict) -> dict:
+    """
+    Returns every timing of the result of one size, as {name: seconds}
+    """
+    if "error" in result:
+        return {}
+    timings = {"pipeline": result["pipeline"]["seconds"], "scoring": result["scoring"]["seconds"]}
+    timings.update((f"pipeline.{stage_name}", seconds) for stage_name, seconds in result["pipeline"]["stages"].items())
+    timings.update((f"pipeline.model_training.{model}_seconds_per_trial", 1 / trials_per_second)
+                   for model, trials_per_second in (result["pipeline"].get("trials_per_second") or {}).items()
+                   if trials_per_second)
+    timings.update((f"micro.{name}", micro["min_seconds"]) for name, micro in result["micro"].items())
+    return timings
+
+
+def compare_results(results: dict, baseline: dict) -> dict:
+    """
+    Returns {size: {name: {seconds, baseline_seconds, ratio}}} of the timings found in both results
+    """
+    comparison = {}
+    for size, result in results.items():
+        if size not in baseline.get("results", {}):
+            continue
+        baseline_timings = get_timings(baseline["results"][size])
+        for name, seconds in get_timings(result).items():
+            if baseline_timings.get(name):
+                comparison.setdefault(size, {})[name] = {"seconds": seconds,
+                                                         "baseline_seconds": baseline_timings[name],
+                                                         "ratio": seconds / baseline_timings[name]}
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the pipeline on synthetic data")
+    parser.add_argument("--sizes", default="10k,100k", help="comma separated row counts, e.g. 10k,100k,1M,10M")
+    parser.add_argument("--config", default=CONFIG_FILE_PATH)
+    parser.add_argument("--schema", default=None, help="schema.yaml, the one of the config by default")
+    parser.add_argument("--work-dir", default=None, help="where data and runs are kept, a new temporary dir by default")
+    parser.add_argument("--output", default=None, help="json results, <work dir>/benchmark.json by default")
+    parser.add_argument("--baseline", default=None, help="json results of an earlier run to compare with")
+    parser.add_argument("--repeats", type=int, default=3, help="calls of every micro-benchmark")
+    parser.add_argument("--random-state", type=int, default=42)
+    parser.add_argument("--set", dest="overrides", action="append", metavar="SECTION.KEY=VALUE",
+                        help="config.yaml value of the runs, can be repeated")
+    parser.add_argument("--run", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        run_benchmark_process(args.run)
+        return
+
+    config_info = read_yaml_file(args.config)
+    schema_file_path = args.schema or os.path.join(
+        ROOT_DIR, config_info[DATA_VALIDATION_CONFIG_KEY][DATA_VALIDATION_SCHEMA_DIR_KEY],
+        config_info[DATA_VALIDATION_CONFIG_KEY][DATA_VALIDATION_SCHEMA_FILE_NAME_KEY])
+    work_dir = os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix="credit_score_benchmark_"))
+    settings = {"repeats": args.repeats, "random_state": args.random_state,
+                "config_overrides": parse_overrides(args.overrides),
+                "benchmark_config": BENCHMARK_CONFIG}
+
+    results = {}
+    for size in args.sizes.split(","):
+        n_rows = parse_size(size)
+        results[format_size(n_rows)] = run_size(n_rows, work_dir, config_info, schema_file_path, settings)
+
+    benchmark = {"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": get_environment(),
+                 "settings": settings, "results": results}
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            benchmark["comparison"] = compare_results(results, json.load(baseline_file))
+
+    output_file_path = args.output or os.path.join(work_dir, "benchmark.json")
+    with open(output_file_path, "w") as output_file:
+        json.dump(benchmark, output_file, indent=4, default=str)
+
+    for size, result in results.items():
+        if "error" in result:
+            print(f"{size:>6} failed: {result['error'][-300:]}")
+            continue
+        comparison = benchmark.get("comparison", {}).get(size, {})
+        for name, seconds in get_timings(result).items():
+            change = f"  x{comparison[name]['ratio']:.2f} of baseline" if name in comparison else ""
+            print(f"{size:>6} {name:<56} {seconds:10.3f}s{change}")
+        if result["peak_rss_mb"] is not None:
+            print(f"{size:>6} {'peak RSS':<56} {result['peak_rss_mb']:9.1f}MB")
+    print(f"Results saved at: {output_file_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Local HTTP server stand-in for the dataset host, to run and test downloads offline.
+
+Serves the files of a directory like a static file host: HEAD and GET with Content-Length,
+a strong ETag and Last-Modified, single byte ranges (206 Partial Content, 416 when not
+satisfiable) and If-Range. Failures of a real network can be simulated:
+
+    fail_after_bytes : the connection is closed after that many bytes of the body, for the
+                       first `failures` GET requests
+    accept_ranges    : False to serve the whole file to every request, as some hosts do
+
+    with serve_directory(data_dir) as server:
+        DownloadCache(cache_dir).get(f"{server.base_url}/dataset_clean.zip")
+"""
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import argparse
+import contextlib
+import email.utils
+import functools
+import os
+import re
+import shutil
+import threading
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def get_file_range(self, size: int, etag: str, last_modified: str):
+        """
+        Returns the (start, end) range of the file requested, None for the whole file
+        """
+        range_header = self.headers.get("Range")
+        if range_header is None or not self.server.accept_ranges:
+            return None
+        if_range = self.headers.get("If-Range")
+        if if_range is not None and if_range not in (etag, last_modified):
+            return None
+        match = RANGE_PATTERN.match(range_header.strip())
+        if match is None or match.group(1) == match.group(2) == "":
+            return None
+        if match.group(1) == "":
+            # Suffix range, the last n bytes
+            return max(size - int(match.group(2)), 0), size - 1
+        start = int(match.group(1))
+        end = size - 1 if match.group(2) == "" else min(int(match.group(2)), size - 1)
+        return start, end
+
+    def send_file_headers(self):
+        """
+        Sends the status and headers of the requested file, returns the open file and the
+        number of bytes of the body, None when there is no body to send
+        """
+        file_path = self.translate_path(self.path)
+        if not os.path.isfile(file_path):
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None, 0
+        stat = os.stat(file_path)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+
+        file_range = self.get_file_range(stat.st_size, etag, last_modified)
+        if file_range is not None and file_range[0] >= stat.st_size:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header("Content-Range", f"bytes */{stat.st_size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None, 0
+
+        start, end = (0, stat.st_size - 1) if file_range is None else file_range
+        self.send_response(HTTPStatus.OK if file_range is None else HTTPStatus.PARTIAL_CONTENT)
+        if file_range is not None:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+        self.send_header("Content-Type", self.guess_type(file_path))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        if self.server.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+        file_obj = open(file_path, "rb")
+        file_obj.seek(start)
+        return file_obj, end - start + 1
+
+    def do_HEAD(self):
+        file_obj, _ = self.send_file_headers()
+        if file_obj is not None:
+            file_obj.close()
+
+    def do_GET(self):
+        file_obj, length = self.send_file_headers()
+        if file_obj is None:
+            return
+        with file_obj:
+            with self.server.lock:
+                self.server.n_requests += 1
+                fail = self.server.failures > 0
+                self.server.failures -= int(fail)
+            if fail and self.server.fail_after_bytes < length:
+                # Simulated network failure: part of the body, then the connection is closed
+                self.wfile.write(file_obj.read(self.server.fail_after_bytes))
+                self.close_connection = True
+                return
+            try:
+                shutil.copyfileobj(file_obj, self.wfile, length=1024 * 1024)
+            except ConnectionError:
+                # The client stopped reading, e.g. on a timeout
+                self.close_connection = True
+
+
+class LocalHTTPServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, directory: str, port: int = 0, accept_ranges: bool = True,
+                 fail_after_bytes: int = 0, failures: int = 0):
+        super().__init__(("127.0.0.1", port), functools.partial(RangeRequestHandler, directory=directory))
+        self.accept_ranges = accept_ranges
+        self.fail_after_bytes = fail_after_bytes
+        self.failures = failures
+        self.n_requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+@contextlib.contextmanager
+def serve_directory(directory: str, **kwargs):
+    """
+    Serves the directory on a free local port in a background thread, yields the LocalHTTPServer
+    """
+    server = LocalHTTPServer(directory, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, name="local-http-server", daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves a directory with byte range support")
+    parser.add_argument("directory")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--no-ranges", action="store_true", help="serve the whole file to range requests")
+    args = parser.parse_args()
+
+    server = LocalHTTPServer(os.path.abspath(args.directory), port=args.port, accept_ranges=not args.no_ranges)
+    print(f"Serving [{args.directory}] at: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
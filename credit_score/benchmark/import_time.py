@@ -0,0 +1,104 @@
+"""
+Import time benchmark of the credit_score entry points.
+
+Every module is imported in a fresh interpreter, a few times, and the fastest import time, the
+peak RSS and the heavy libraries it pulled in are reported. The run fails (exit code 1) when a
+module goes over its time budget or, for the scoring modules, loads one of the training-only
+libraries.
+
+    python -m credit_score.benchmark.import_time [--repeat 3] [--output import_time.json]
+"""
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+import argparse
+import json
+import os, sys
+import subprocess
+import tempfile
+
+
+# Module -> import time budget in seconds
+IMPORT_TIME_BUDGETS = {
+    "credit_score.pipeline.batch_prediction": 0.5,
+    "credit_score.pipeline.online_prediction": 0.5,
+    "credit_score.pipeline.training_pipeline": 0.5,
+    "credit_score.components.data_validation": 0.5,
+    "credit_score.components.model_trainer": 0.5,
+}
+
+# Modules which must be importable without any of the heavy libraries
+SCORING_MODULES = ["credit_score.pipeline.batch_prediction", "credit_score.pipeline.online_prediction"]
+
+HEAVY_MODULES = ["sklearn", "scipy", "xgboost", "optuna", "evidently", "imblearn", "pymongo"]
+
+_MEASURE_CODE = """
+import importlib, json, resource, sys, time
+start_time = time.perf_counter()
+importlib.import_module({module_name!r})
+elapsed = time.perf_counter() - start_time
+peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"seconds": elapsed,
+                   "peak_rss_mb": peak_rss_kb / (1024 * 1024 if sys.platform == "darwin" else 1024),
+                   "heavy_modules": [name for name in {heavy_modules!r} if name in sys.modules]}}))
+"""
+
+
+def measure_import(module_name: str, repeat: int = 3) -> dict:
+    """
+    Imports the module in `repeat` fresh interpreters and returns the fastest run
+    """
+    try:
+        package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get("PYTHONPATH")])))
+        runs = []
+        # Run from a scratch dir, so that the log files created by the imports don't mix with the real ones
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            for _ in range(repeat):
+                completed = subprocess.run(
+                    [sys.executable, "-c", _MEASURE_CODE.format(module_name=module_name, heavy_modules=HEAVY_MODULES)],
+                    cwd=scratch_dir, env=env, capture_output=True, text=True)
+                if completed.returncode != 0:
+                    raise Exception(f"Import of [{module_name}] failed:\n{completed.stderr}")
+                runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        return min(runs, key=lambda run: run["seconds"])
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def run_benchmark(repeat: int = 3) -> dict:
+    """
+    Measures every budgeted module and returns module -> result, with the budget checks
+    """
+    try:
+        results = {}
+        for module_name, budget in IMPORT_TIME_BUDGETS.items():
+            result = measure_import(module_name, repeat=repeat)
+            forbidden = result["heavy_modules"] if module_name in SCORING_MODULES else []
+            result.update({"budget_seconds": budget,
+                           "within_budget": result["seconds"] <= budget and len(forbidden) == 0})
+            results[module_name] = result
+            logging.info(f"Import of [{module_name}]: {result}")
+        return results
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time budget check of the credit_score entry points")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="json file to write the results to")
+    args = parser.parse_args()
+
+    results = run_benchmark(repeat=args.repeat)
+    for module_name, result in results.items():
+        status = "ok" if result["within_budget"] else "OVER BUDGET"
+        print(f"{module_name:<45} {result['seconds']:6.3f}s / {result['budget_seconds']:.2f}s "
+              f"{result['peak_rss_mb']:7.1f}MB  {status}  {','.join(result['heavy_modules'])}")
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+    sys.exit(0 if all(result["within_budget"] for result in results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+In-memory stand-in for the MongoDB server, to run the pipeline and its benchmarks offline.
+
+Implements the part of the pymongo client api used by `credit_score.components.db_operation.MongoDB`:
+
+    client[database_name][collection_name]
+    database.list_collection_names() / database.drop_collection(name)
+    collection.insert_many(documents, ordered=True)
+    collection.find(filter, projection) / collection.find_raw_batches(filter, projection, batch_size)
+
+Documents are kept BSON encoded, as a server would store them, so inserts and fetches pay the
+same encoding and decoding cost as with the real client. Only the empty filter is supported.
+
+    MongoDB(client=InMemoryMongoClient())
+"""
+from credit_score.exception import CustomException
+import bson
+import threading
+import sys
+
+
+def _project(document: dict, projection: dict) -> dict:
+    """
+    Applies an inclusion ({field: 1, "_id": 0}) or exclusion ({field: 0}) projection to a
+    decoded document
+    """
+    if not projection:
+        return document
+    fields = [field for field, include in projection.items() if include and field != "_id"]
+    if len(fields) == 0:
+        # Exclusion projection, every field but the excluded ones
+        return {field: value for field, value in document.items() if projection.get(field, 1)}
+    projected = {"_id": document["_id"]} if projection.get("_id", 1) and "_id" in document else {}
+    projected.update((field, document[field]) for field in fields if field in document)
+    return projected
+
+
+class InMemoryCollection:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.documents = []
+        self.lock = threading.Lock()
+
+    def insert_many(self, documents, ordered: bool = True) -> None:
+        try:
+            encoded = []
+            for document in documents:
+                # The client adds the _id to the inserted documents, as pymongo does
+                document.setdefault("_id", bson.ObjectId())
+                encoded.append(bson.encode(document))
+            with self.lock:
+                self.documents.extend(encoded)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_documents(self, filter: dict = None) -> list:
+        if filter:
+            raise NotImplementedError("Only the empty filter is supported by the in-memory collection")
+        with self.lock:
+            return list(self.documents)
+
+    def find(self, filter: dict = None, projection: dict = None):
+        for document in self.get_documents(filter):
+            yield _project(bson.decode(document), projection)
+
+    def find_raw_batches(self, filter: dict = None, projection: dict = None, batch_size: int = 1000):
+        """
+        Yields the documents as bytes of `batch_size` concatenated BSON documents
+        """
+        documents = self.get_documents(filter)
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+            if projection:
+                batch = [bson.encode(_project(bson.decode(document), projection)) for document in batch]
+            yield b"".join(batch)
+
+    def count_documents(self, filter: dict = None) -> int:
+        return len(self.get_documents(filter))
+
+
+class InMemoryDatabase:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, collection_name: str) -> InMemoryCollection:
+        with self.lock:
+            if collection_name not in self.collections:
+                self.collections[collection_name] = InMemoryCollection(collection_name)
+            return self.collections[collection_name]
+
+    def list_collection_names(self) -> list:
+        with self.lock:
+            return list(self.collections)
+
+    def drop_collection(self, collection_name: str) -> None:
+        with self.lock:
+            self.collections.pop(collection_name, None)
+
+
+class InMemoryMongoClient:
+
+    def __init__(self, *args, **kwargs):
+        self.databases = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, database_name: str) -> InMemoryDatabase:
+        with self.lock:
+            if database_name not in self.databases:
+                self.databases[database_name] = InMemoryDatabase(database_name)
+            return self.databases[database_name]
+
+    def close(self) -> None:
+        self.databases = {}
@@ -0,0 +1,99 @@
+"""
+Per-call overhead of logging in serving mode.
+
+Every variant logs the same short message from the calling thread `--calls` times into a
+temporary file and reports the latency of the call (not of the disk write, which the queued
+variants do in the writer thread):
+
+    sync_text              : previous setup, text line written to the file in the calling thread
+    queue_json             : json record put on the queue, written by the writer thread
+    queue_json_sampled     : same, logged with extra={"sample": 100} as served batches are
+    debug_eager_dataframe  : disabled debug call with an f-string of a dataframe
+    debug_lazy_dataframe   : disabled debug call with the dataframe as %-style argument
+
+    python -m credit_score.benchmark.logging_overhead [--calls 20000] [--output logging_overhead.json]
+"""
+from credit_score.logger import logging
+from credit_score.logger import setup_logging
+from credit_score.logger import stop_logging
+import credit_score.logger as logger
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import os, sys
+import tempfile
+import time
+
+
+def time_calls(log_call, n_calls: int) -> dict:
+    """
+    Returns the mean, median and 99th percentile latency of log_call in microseconds
+    """
+    latencies = np.empty(n_calls)
+    for i in range(n_calls):
+        start_time = time.perf_counter_ns()
+        log_call(i)
+        latencies[i] = time.perf_counter_ns() - start_time
+    return {"mean_us": float(latencies.mean() / 1000),
+            "p50_us": float(np.percentile(latencies, 50) / 1000),
+            "p99_us": float(np.percentile(latencies, 99) / 1000)}
+
+
+def run_benchmark(n_calls: int = 20000) -> dict:
+    dataframe = pd.DataFrame(np.random.RandomState(0).rand(1000, 20))
+    results = {}
+    with tempfile.TemporaryDirectory() as log_dir:
+        def log_batch(i):
+            logging.info("Scored micro-batch of %d rows in %.2fms", 32, 1.5)
+
+        def log_sampled_batch(i):
+            logging.info("Scored micro-batch of %d rows in %.2fms", 32, 1.5, extra={"sample": 100})
+
+        def log_eager_dataframe(i):
+            logging.debug(f"{dataframe}")
+
+        def log_lazy_dataframe(i):
+            logging.debug("%s", dataframe)
+
+        try:
+            # The previous backend: logging.basicConfig FileHandler with the text format
+            stop_logging()
+            root_logger = logging.getLogger()
+            handler = logging.FileHandler(os.path.join(log_dir, "sync_text.log"))
+            handler.setFormatter(logging.Formatter(logger.TEXT_LOG_FORMAT))
+            root_logger.removeHandler(logger._handler)
+            root_logger.addHandler(handler)
+            results["sync_text"] = time_calls(log_batch, n_calls)
+            root_logger.removeHandler(handler)
+            handler.close()
+            logger._handler = None
+
+            setup_logging(file_path=os.path.join(log_dir, "queue_json.log"))
+            results["queue_json"] = time_calls(log_batch, n_calls)
+            results["queue_json_sampled"] = time_calls(log_sampled_batch, n_calls)
+            results["debug_eager_dataframe"] = time_calls(log_eager_dataframe, max(1, n_calls // 100))
+            results["debug_lazy_dataframe"] = time_calls(log_lazy_dataframe, n_calls)
+            stop_logging()
+        finally:
+            setup_logging()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-call overhead of logging in serving mode")
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--output", default=None, help="json file to write the results to")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.calls)
+    for variant, result in results.items():
+        print(f"{variant:<24} mean {result['mean_us']:9.2f}us  p50 {result['p50_us']:9.2f}us  "
+              f"p99 {result['p99_us']:9.2f}us")
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
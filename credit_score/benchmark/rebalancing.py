@@ -0,0 +1,108 @@
+"""
+Runtime and memory benchmark of the class rebalancing strategies.
+
+Every strategy of REBALANCING_STRATEGIES is run on the same train data, together with the
+imblearn SMOTEENN the transformation used before as the baseline. The train data is either a
+synthetic imbalanced set or the transformed train arrays of a pipeline run.
+
+    python -m credit_score.benchmark.rebalancing [--rows 50000] [--features 40] [--n-jobs -1]
+    python -m credit_score.benchmark.rebalancing --train-file train.npy --target-file train_target.npy
+"""
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from credit_score.components.rebalancing import Rebalancer
+from credit_score.components.rebalancing import REBALANCING_STRATEGIES
+from credit_score.utils.utils import load_numpy_array_data
+import numpy as np
+import argparse
+import json
+import os, sys
+import time
+import tracemalloc
+
+BASELINE_STRATEGY = "imblearn_smoteenn"
+# Class mix of the credit score target (Standard, Poor, Good)
+CLASS_WEIGHTS = [0.53, 0.29, 0.18]
+
+
+def get_synthetic_data(n_rows: int, n_features: int, random_state: int = 42) -> tuple:
+    try:
+        from sklearn.datasets import make_classification
+
+        x, y = make_classification(n_samples=n_rows, n_features=n_features, n_informative=n_features // 2,
+                                   n_classes=len(CLASS_WEIGHTS), weights=CLASS_WEIGHTS, flip_y=0.05,
+                                   random_state=random_state)
+        return x, y
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def run_strategy(strategy: str, x: np.ndarray, y: np.ndarray, n_jobs: int, chunk_size: int) -> dict:
+    """
+    Rebalances x, y with the strategy and returns its wall time, peak traced memory and output size
+    """
+    try:
+        tracemalloc.start()
+        start_time = time.perf_counter()
+        if strategy == BASELINE_STRATEGY:
+            from imblearn.combine import SMOTEENN
+            x_resampled, y_resampled = SMOTEENN(random_state=42, sampling_strategy="all").fit_resample(x, y)
+        else:
+            x_resampled, y_resampled = Rebalancer(strategy=strategy, n_jobs=n_jobs,
+                                                  chunk_size=chunk_size).fit_resample(x, y)
+        elapsed = time.perf_counter() - start_time
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"seconds": elapsed,
+                "peak_memory_mb": peak_memory / 1024 ** 2,
+                "output_rows": int(len(y_resampled)),
+                "class_counts": np.bincount(np.asarray(y_resampled)).tolist()}
+    except Exception as e:
+        tracemalloc.stop()
+        raise CustomException(e, sys) from e
+
+
+def run_benchmark(x: np.ndarray, y: np.ndarray, n_jobs: int = -1, chunk_size: int = 10000,
+                  strategies: list = None) -> dict:
+    try:
+        strategies = strategies or [BASELINE_STRATEGY, *REBALANCING_STRATEGIES]
+        results = {}
+        for strategy in strategies:
+            results[strategy] = run_strategy(strategy, x, y, n_jobs=n_jobs, chunk_size=chunk_size)
+            logging.info(f"Rebalancing strategy [{strategy}]: {results[strategy]}")
+        return results
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runtime and memory of the class rebalancing strategies")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--features", type=int, default=40)
+    parser.add_argument("--train-file", dest="train_file", default=None, help="transformed train features .npy")
+    parser.add_argument("--target-file", dest="target_file", default=None, help="transformed train target .npy")
+    parser.add_argument("--n-jobs", dest="n_jobs", type=int, default=-1)
+    parser.add_argument("--chunk-size", dest="chunk_size", type=int, default=10000)
+    parser.add_argument("--strategies", nargs="+", default=None)
+    parser.add_argument("--output", default=None, help="json file to write the results to")
+    args = parser.parse_args()
+
+    if args.train_file is not None and args.target_file is not None:
+        x, y = load_numpy_array_data(args.train_file), load_numpy_array_data(args.target_file)
+    else:
+        x, y = get_synthetic_data(args.rows, args.features)
+    # The baseline ran on the float64 output of the preprocessor
+    x = np.asarray(x, dtype=np.float64)
+
+    print(f"{len(y)} rows, {x.shape[1]} features, class counts: {np.bincount(y).tolist()}")
+    results = run_benchmark(x, y, n_jobs=args.n_jobs, chunk_size=args.chunk_size, strategies=args.strategies)
+    for strategy, result in results.items():
+        print(f"{strategy:<20} {result['seconds']:8.2f}s {result['peak_memory_mb']:9.1f}MB "
+              f"{result['output_rows']:>9} rows  {result['class_counts']}")
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Synthetic credit data generated from schema.yaml, to benchmark the pipeline at any size.
+
+Every column of the `Columns` section is generated, in order, from the `Domains` section:
+
+    target     : drawn with `target_shares`, its position in target_shares (Good < Standard < Poor)
+                 gives the latent risk of the row
+    ranges     : numeric columns, spread between min and max around the median and correlated with
+                 the risk of the row by `risk`, integer values when the bounds are integers
+    categories : drawn with `shares` (uniform by default), ordered by the risk of the row when they
+                 have a `risk`, or lists of `count_column` values
+    identifiers: ID, Customer_ID, Month, Name and SSN, one row per customer and month
+
+Rows are generated in chunks of `chunk_size` with a random state derived from the first row of the
+chunk, so the memory used doesn't depend on the number of rows. The data is written as the dataset
+archive of the data ingestion (<archive>/dataset_clean/clean_df.csv) and/or as a file to predict on,
+made of the rows following those of the archive.
+
+    python -m credit_score.benchmark.synthetic_data 100k --archive dataset_clean.zip [--features features.csv]
+"""
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from credit_score.utils.utils import read_yaml_file
+from credit_score.constant import *
+from scipy.special import ndtr
+import numpy as np
+import pandas as pd
+import argparse
+import io
+import math
+import os, sys
+import time
+import zipfile
+
+# The real data has one row per customer for 8 consecutive months
+MONTHS_PER_CUSTOMER = 8
+IDENTIFIER_COLUMNS = ("ID", "Customer_ID", "Month", "Name", "SSN")
+SIZE_SUFFIXES = {"k": 1000, "m": 1000000}
+
+
+def parse_size(size: str) -> int:
+    """
+    Returns the number of rows of a size written as 10000, 10k or 1M
+    """
+    try:
+        size = str(size).strip().lower()
+        if size[-1:] in SIZE_SUFFIXES:
+            return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+        return int(size)
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+def format_size(n_rows: int) -> str:
+    for suffix, factor in sorted(SIZE_SUFFIXES.items(), key=lambda item: -item[1]):
+        if n_rows >= factor and n_rows % factor == 0:
+            return f"{n_rows // factor}{suffix.upper() if suffix == 'm' else suffix}"
+    return str(n_rows)
+
+
+class SyntheticDataGenerator:
+
+    def __init__(self, dataset_schema: dict, random_state: int = 42):
+        try:
+            self.schema_columns = dict(dataset_schema[DATASET_SCHEMA_COLUMNS_KEY])
+            self.target_column = dataset_schema[TARGET_COLUMN_KEY]
+            if DATASET_SCHEMA_DOMAINS_KEY not in dataset_schema:
+                raise Exception(f"Schema has no [{DATASET_SCHEMA_DOMAINS_KEY}] section to generate data from")
+            domains = dataset_schema[DATASET_SCHEMA_DOMAINS_KEY]
+            self.ranges = domains.get("ranges", {})
+            self.categories = domains.get("categories", {})
+            self.random_state = random_state
+
+            self.target_classes = np.array(list(domains["target_shares"]), dtype=object)
+            target_shares = np.array(list(domains["target_shares"].values()), dtype=np.float64)
+            self.target_shares = target_shares / target_shares.sum()
+            # Standardized position of the classes, so that `risk` is a correlation
+            positions = np.arange(len(self.target_classes))
+            mean = (positions * self.target_shares).sum()
+            std = math.sqrt((((positions - mean) ** 2) * self.target_shares).sum())
+            self.class_risk = (positions - mean) / std
+
+            # Exponent of the min-max spread putting half of the values below the median
+            self.exponents = {}
+            for column, domain in self.ranges.items():
+                share_below_median = (domain["median"] - domain["min"]) / (domain["max"] - domain["min"])
+                self.exponents[column] = math.log(share_below_median) / math.log(0.5)
+
+            unknown_columns = [column for column in self.schema_columns
+                               if column not in self.ranges and column not in self.categories
+                               and column not in IDENTIFIER_COLUMNS and column != self.target_column]
+            if len(unknown_columns) > 0:
+                raise Exception(f"Columns: {unknown_columns} have no domain in the schema")
+
+            self.list_vocabularies = {column: self.get_list_vocabulary(domain)
+                                      for column, domain in self.categories.items() if "count_column" in domain}
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_list_vocabulary(self, domain: dict) -> dict:
+        """
+        Returns the lists of values of a list column for every count of its count column,
+        `vocabulary_size` distinct lists in all, e.g. "Auto Loan, Payday Loan, and Student Loan"
+        """
+        rng = np.random.default_rng([self.random_state, len(domain["values"])])
+        values = np.array(domain["values"], dtype=object)
+        shares = np.asarray(domain.get("shares", np.ones(len(values))), dtype=np.float64)
+        max_count = int(self.ranges[domain["count_column"]]["max"])
+        n_lists = max(domain.get("vocabulary_size", 1000) // max_count, 1)
+
+        vocabulary = {}
+        for count in range(1, max_count + 1):
+            picks = values[rng.choice(len(values), size=(n_lists, count), p=shares / shares.sum())]
+            vocabulary[count] = np.array([picked[0] if count == 1 else f"{', '.join(picked[:-1])}, and {picked[-1]}"
+                                          for picked in picks], dtype=object)
+        return vocabulary
+
+    @staticmethod
+    def get_correlated_uniform(risk: np.ndarray, correlation: float, rng: np.random.Generator) -> np.ndarray:
+        """
+        Returns values in (0, 1) correlated with the risk of the rows
+        """
+        noise = rng.standard_normal(len(risk))
+        return ndtr(correlation * risk + math.sqrt(1 - correlation ** 2) * noise)
+
+    def get_numeric_column(self, column: str, risk: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        domain = self.ranges[column]
+        uniform = self.get_correlated_uniform(risk, domain.get("risk", 0.0), rng) ** self.exponents[column]
+        low, high = domain["min"], domain["max"]
+        if all(isinstance(domain[key], int) for key in ("min", "median", "max")):
+            return np.minimum(np.floor(low + (high - low + 1) * uniform), high)
+        return np.round(low + (high - low) * uniform, 2)
+
+    def get_categorical_column(self, column: str, data: dict, risk: np.ndarray,
+                               rng: np.random.Generator) -> np.ndarray:
+        domain = self.categories[column]
+        values = np.array(domain["values"], dtype=object)
+        shares = np.asarray(domain.get("shares", np.ones(len(values))), dtype=np.float64)
+        shares = shares / shares.sum()
+
+        if "count_column" in domain:
+            # Lists of as many values as the count column, missing when it is 0
+            counts = data[domain["count_column"]].astype(np.int64)
+            column_values = np.full(len(counts), None, dtype=object)
+            for count, vocabulary in self.list_vocabularies[column].items():
+                in_count = counts == count
+                column_values[in_count] = vocabulary[rng.integers(len(vocabulary), size=int(in_count.sum()))]
+            return column_values
+
+        if "risk" in domain:
+            # Values are listed in increasing risk order
+            uniform = self.get_correlated_uniform(risk, domain["risk"], rng)
+            return values[np.minimum(np.searchsorted(np.cumsum(shares), uniform), len(values) - 1)]
+        return values[rng.choice(len(values), size=len(risk), p=shares)]
+
+    def generate_chunk(self, n_rows: int, start: int = 0) -> pd.DataFrame:
+        """
+        Returns rows start to start + n_rows of the data
+        """
+        try:
+            rng = np.random.default_rng([self.random_state, start])
+            target_index = rng.choice(len(self.target_classes), size=n_rows, p=self.target_shares)
+            risk = self.class_risk[target_index]
+
+            row_ids = np.arange(start, start + n_rows, dtype=np.int64)
+            customer_ids = row_ids // MONTHS_PER_CUSTOMER
+            data = {"ID": row_ids,
+                    "Customer_ID": customer_ids,
+                    "Month": row_ids % MONTHS_PER_CUSTOMER + 1,
+                    "Name": np.char.add("Customer_", customer_ids.astype(str)),
+                    "SSN": (100000000 + customer_ids).astype(np.float64),
+                    self.target_column: self.target_classes[target_index]}
+            for column in self.ranges:
+                data[column] = self.get_numeric_column(column, risk, rng)
+            # List columns are generated last, they depend on their count column
+            for column in sorted(self.categories, key=lambda column: "count_column" in self.categories[column]):
+                data[column] = self.get_categorical_column(column, data, risk, rng)
+
+            return pd.DataFrame({column: data[column] for column in self.schema_columns})
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def iter_chunks(self, n_rows: int, chunk_size: int = 100000, start: int = 0):
+        """
+        Yields n_rows rows of the data from row start, as dataframes of at most chunk_size rows
+        """
+        for chunk_start in range(start, start + n_rows, chunk_size):
+            yield self.generate_chunk(min(chunk_size, start + n_rows - chunk_start), start=chunk_start)
+
+    def write_csv(self, file_obj, n_rows: int, chunk_size: int = 100000, columns: list = None, start: int = 0) -> None:
+        for chunk_number, chunk in enumerate(self.iter_chunks(n_rows, chunk_size, start=start)):
+            chunk = chunk if columns is None else chunk[columns]
+            chunk.to_csv(file_obj, header=chunk_number == 0, index=False)
+
+    def save_dataset_archive(self, archive_file_path: str, n_rows: int, chunk_size: int = 100000,
+                             data_file_name: str = "clean_df.csv", folder_name: str = "dataset_clean") -> str:
+        """
+        Writes the data as the zipped dataset expected by the data ingestion, streaming the
+        csv into the archive
+        """
+        try:
+            start_time = time.perf_counter()
+            os.makedirs(os.path.dirname(os.path.abspath(archive_file_path)), exist_ok=True)
+            with zipfile.ZipFile(archive_file_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+                with archive.open(f"{folder_name}/{data_file_name}", "w", force_zip64=True) as data_file:
+                    with io.TextIOWrapper(data_file, encoding="utf-8", newline="") as text_file:
+                        self.write_csv(text_file, n_rows, chunk_size)
+            logging.info(f"Synthetic dataset of {n_rows} rows saved at: [{archive_file_path}] "
+                         f"in {time.perf_counter() - start_time:.1f}s")
+            return archive_file_path
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def save_features_file(self, file_path: str, n_rows: int, chunk_size: int = 100000, start: int = 0) -> str:
+        """
+        Writes a csv file to predict on: every column except the target, from row start
+        """
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+            columns = [column for column in self.schema_columns if column != self.target_column]
+            with open(file_path, "w", newline="") as features_file:
+                self.write_csv(features_file, n_rows, chunk_size, columns=columns, start=start)
+            logging.info(f"Synthetic features file of {n_rows} rows saved at: [{file_path}]")
+            return file_path
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates synthetic credit data from schema.yaml")
+    parser.add_argument("rows", help="number of rows, e.g. 10000, 100k or 1M")
+    parser.add_argument("--schema", default=os.path.join(ROOT_DIR, CONFIG_DIR, "schema.yaml"))
+    parser.add_argument("--archive", default=None, help="zipped dataset to write, as downloaded by the data ingestion")
+    parser.add_argument("--features", default=None, help="csv file to predict on to write, rows following the archive")
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--random-state", type=int, default=42)
+    args = parser.parse_args()
+
+    n_rows = parse_size(args.rows)
+    generator = SyntheticDataGenerator(read_yaml_file(args.schema), random_state=args.random_state)
+    if args.archive is None and args.features is None:
+        args.archive = f"dataset_clean_{format_size(n_rows)}.zip"
+    if args.archive is not None:
+        print(generator.save_dataset_archive(args.archive, n_rows, chunk_size=args.chunk_size))
+    if args.features is not None:
+        print(generator.save_features_file(args.features, n_rows, chunk_size=args.chunk_size, start=n_rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Reads the data files of the zipped dataset straight from the archive.
+
+Members are decompressed as they are read and parsed by pandas from the compressed stream,
+nothing is extracted to disk. The data files are the members of the first folder of the
+archive (<archive>/dataset_clean/*.csv), or of its top level when it has no folder.
+Members are independent streams, `map_members` processes them in parallel threads
+(decompression and csv parsing release the GIL).
+
+    archive_reader = ArchiveReader(tgz_file_path)
+    for member in archive_reader.get_data_members():
+        for chunk in archive_reader.iter_csv_chunks(member, chunk_size=50000):
+            ...
+"""
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import pandas as pd
+import os, sys
+import zipfile
+
+
+class ArchiveReader:
+
+    def __init__(self, archive_file_path: str, max_workers: int = None):
+        """
+        max_workers: members read at the same time by map_members, by default as many as
+        there are members, up to the number of cpus
+        """
+        try:
+            self.archive_file_path = archive_file_path
+            self.max_workers = max_workers
+            if not zipfile.is_zipfile(archive_file_path):
+                raise Exception(f"File: [{archive_file_path}] is not a zip archive")
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_data_members(self) -> list:
+        """
+        Returns the names of the data files of the archive, in archive order
+        """
+        try:
+            with zipfile.ZipFile(self.archive_file_path) as archive:
+                members = [info.filename for info in archive.infolist()
+                           if not info.is_dir() and not info.filename.startswith("__MACOSX/")]
+            folders = [member.split("/")[0] for member in members if "/" in member]
+            if len(folders) == 0:
+                return members
+            return [member for member in members if member.startswith(f"{folders[0]}/")]
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    @contextlib.contextmanager
+    def open_member(self, member: str):
+        """
+        Opens the member as a binary stream, decompressed as it is read. Every call has
+        its own handle on the archive, so members can be read from several threads
+        """
+        with zipfile.ZipFile(self.archive_file_path) as archive:
+            with archive.open(member) as member_file:
+                yield member_file
+
+    def read_csv(self, member: str, **kwargs) -> pd.DataFrame:
+        """
+        Parses the csv member into a dataframe, kwargs are passed to pd.read_csv
+        """
+        try:
+            logging.info(f"Reading member: [{member}] of archive: [{self.archive_file_path}]")
+            with self.open_member(member) as member_file:
+                return pd.read_csv(member_file, **kwargs)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def iter_csv_chunks(self, member: str, chunk_size: int, **kwargs):
+        """
+        Yields the csv member as dataframes of chunk_size rows, kwargs are passed to pd.read_csv
+        """
+        try:
+            logging.info(f"Reading member: [{member}] of archive: [{self.archive_file_path}] "
+                         f"in chunks of {chunk_size} rows")
+            with self.open_member(member) as member_file:
+                yield from pd.read_csv(member_file, chunksize=chunk_size, **kwargs)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def map_members(self, function, members: list = None) -> list:
+        """
+        Returns [function(member) for member in members], members (the data members by default)
+        being processed in parallel threads
+        """
+        try:
+            members = self.get_data_members() if members is None else list(members)
+            if len(members) <= 1:
+                return [function(member) for member in members]
+            max_workers = self.max_workers or min(len(members), os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="archive-member") as executor:
+                return list(executor.map(function, members))
+        except Exception as e:
+            raise CustomException(e, sys) from e
@@ -0,0 +1,333 @@
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+import pandas as pd
+import numpy as np
+import os, sys
+
+
+# Below this number of rows categories are looked up with a plain dict, above it with pandas
+SMALL_BATCH_SIZE = 64
+_MISSING = -2
+_UNKNOWN = -1
+
+
+def _yeo_johnson(x: np.ndarray, lambdas: np.ndarray) -> np.ndarray:
+    """
+    Yeo-Johnson transform of every column of x with its own lambda, same formulas as sklearn
+    """
+    eps = np.spacing(1.0)
+    positive = x >= 0
+    with np.errstate(all="ignore"):
+        x_pos = np.where(positive, x, 0.0)
+        x_neg = np.where(positive, 0.0, x)
+        lambda_is_0 = np.abs(lambdas) < eps
+        lambda_is_2 = np.abs(lambdas - 2) < eps
+        pos_value = np.where(lambda_is_0, np.log1p(x_pos),
+                             (np.power(x_pos + 1, lambdas) - 1) / np.where(lambda_is_0, 1.0, lambdas))
+        neg_value = np.where(lambda_is_2, -np.log1p(-x_neg),
+                             -(np.power(1 - x_neg, 2 - lambdas) - 1) / np.where(lambda_is_2, 1.0, 2 - lambdas))
+    return np.where(positive, pos_value, neg_value)
+
+
+class CompiledTransformer:
+    """
+    Inference time replacement of the fitted preprocessing ColumnTransformer.
+
+    The fitted steps are frozen into flat arrays when the object is created:
+
+    numeric columns     : impute value, one fused scale/shift before the Yeo-Johnson transform,
+                          its lambda and one fused scale/shift after it
+    categorical columns : category -> code lookup table, code of the imputed category and
+                          the scale/shift of the encoded output columns
+
+    `transform` then runs a handful of vectorized numpy operations instead of the nested
+    sklearn pipelines and writes into a float32 buffer, optionally preallocated by the caller.
+    sklearn is only imported to compile, transforming needs numpy and pandas alone.
+    Supported steps are SimpleImputer, MinMaxScaler, StandardScaler, PowerTransformer
+    (yeo-johnson), OrdinalEncoder, OneHotEncoder and passthrough; anything else raises.
+    """
+
+    def __init__(self, preprocessor):
+        try:
+            from sklearn.pipeline import Pipeline
+
+            self.feature_names_in_ = list(preprocessor.feature_names_in_)
+            self.numeric_outputs = []
+            self.categorical_outputs = []
+            n_features_out = 0
+            for name, transformer, columns in preprocessor.transformers_:
+                if isinstance(transformer, str) and transformer == "drop":
+                    continue
+                columns = [self.feature_names_in_[column] if isinstance(column, (int, np.integer)) else column
+                           for column in np.atleast_1d(columns)]
+                if len(columns) == 0:
+                    continue
+                steps = [] if isinstance(transformer, str) else (
+                    [step for _, step in transformer.steps] if isinstance(transformer, Pipeline) else [transformer])
+                n_features_out = self.compile_transformer(name, steps, columns, n_features_out)
+            self.n_features_out = n_features_out
+            self.freeze_numeric_outputs()
+            logging.info(f"Compiled preprocessor: {len(self.numeric_outputs)} numeric and "
+                         f"{len(self.categorical_outputs)} categorical columns -> {n_features_out} features")
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    @classmethod
+    def from_outputs(cls, feature_names_in: list, numeric_outputs: list, categorical_outputs: list,
+                     n_features_out: int) -> "CompiledTransformer":
+        """
+        Returns a transformer made of already compiled column states, e.g. fitted out of core
+        by `StreamingPreprocessor` instead of compiled from a fitted sklearn object
+        """
+        try:
+            compiled = cls.__new__(cls)
+            compiled.feature_names_in_ = list(feature_names_in)
+            compiled.numeric_outputs = list(numeric_outputs)
+            compiled.categorical_outputs = list(categorical_outputs)
+            compiled.n_features_out = n_features_out
+            compiled.freeze_numeric_outputs()
+            return compiled
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def compile_transformer(self, name: str, steps: list, columns: list, out_start: int) -> int:
+        """
+        Compiles the steps applied to the columns of one transformer, whose output starts at
+        column `out_start`, and returns the index of the first column after its output
+        """
+        from sklearn.impute import SimpleImputer
+        from sklearn.preprocessing import StandardScaler, MinMaxScaler, PowerTransformer
+        from sklearn.preprocessing import OrdinalEncoder, OneHotEncoder, FunctionTransformer
+
+        encoder_index = next((i for i, step in enumerate(steps)
+                              if isinstance(step, (OrdinalEncoder, OneHotEncoder))), None)
+        if encoder_index is not None:
+            return self.compile_categorical(name, steps, encoder_index, columns, out_start)
+
+        # Numeric column state: impute value, (a, b) before and after the Yeo-Johnson lambda
+        states = [{"column": column, "fill": np.nan, "pre": [1.0, 0.0], "lambda": None, "post": [1.0, 0.0]}
+                  for column in columns]
+        for step in steps:
+            if isinstance(step, FunctionTransformer) and step.func is None:
+                # passthrough columns are stored as identity FunctionTransformer once fitted
+                continue
+            if isinstance(step, SimpleImputer):
+                if any(state["pre"] != [1.0, 0.0] or state["lambda"] is not None for state in states):
+                    raise NotImplementedError(f"[{name}]: imputer after a scaling step is not supported")
+                statistics = step.statistics_.astype(np.float64)
+                kept = ~np.isnan(statistics) | getattr(step, "keep_empty_features", False)
+                states = [dict(state, fill=fill) for state, fill, keep in zip(states, statistics, kept) if keep]
+                continue
+            if isinstance(step, MinMaxScaler):
+                if step.clip:
+                    raise NotImplementedError(f"[{name}]: MinMaxScaler with clip is not supported")
+                scale, shift = step.scale_, step.min_
+            elif isinstance(step, StandardScaler):
+                scale = 1.0 / step.scale_ if step.scale_ is not None else np.ones(len(states))
+                shift = -step.mean_ * scale if step.mean_ is not None and step.with_mean else np.zeros(len(states))
+            elif isinstance(step, PowerTransformer):
+                if step.method != "yeo-johnson":
+                    raise NotImplementedError(f"[{name}]: PowerTransformer method {step.method} is not supported")
+                for state, lmbda in zip(states, step.lambdas_):
+                    if state["lambda"] is not None:
+                        raise NotImplementedError(f"[{name}]: more than one PowerTransformer is not supported")
+                    state["lambda"] = float(lmbda)
+                if not step.standardize:
+                    continue
+                scale = 1.0 / step._scaler.scale_
+                shift = -step._scaler.mean_ * scale
+            else:
+                raise NotImplementedError(f"[{name}]: step {type(step).__name__} is not supported")
+
+            # Folding the affine step into the one before or after the Yeo-Johnson transform
+            for state, a, b in zip(states, scale, shift):
+                affine = state["pre"] if state["lambda"] is None else state["post"]
+                affine[0], affine[1] = affine[0] * a, affine[1] * a + b
+
+        for i, state in enumerate(states):
+            self.numeric_outputs.append(dict(state, out_index=out_start + i))
+        return out_start + len(states)
+
+    def compile_categorical(self, name: str, steps: list, encoder_index: int, columns: list, out_start: int) -> int:
+        from sklearn.impute import SimpleImputer
+        from sklearn.preprocessing import StandardScaler, MinMaxScaler, OneHotEncoder
+
+        fill_values = [None] * len(columns)
+        for step in steps[:encoder_index]:
+            if not isinstance(step, SimpleImputer) or step.strategy not in ("most_frequent", "constant"):
+                raise NotImplementedError(f"[{name}]: step {type(step).__name__} before the encoder is not supported")
+            fill_values = list(step.statistics_)
+        if len(fill_values) != len(columns):
+            raise NotImplementedError(f"[{name}]: imputer dropping empty columns is not supported")
+
+        encoder = steps[encoder_index]
+        is_onehot = isinstance(encoder, OneHotEncoder)
+        if is_onehot and (encoder.drop_idx_ is not None or encoder.handle_unknown != "ignore"):
+            raise NotImplementedError(f"[{name}]: OneHotEncoder needs drop=None and handle_unknown='ignore'")
+        if getattr(encoder, "infrequent_categories_", None) is not None and \
+                any(categories is not None for categories in encoder.infrequent_categories_):
+            raise NotImplementedError(f"[{name}]: infrequent categories are not supported")
+
+        widths = [len(categories) if is_onehot else 1 for categories in encoder.categories_]
+        n_out = sum(widths)
+        scale, shift = np.ones(n_out), np.zeros(n_out)
+        for step in steps[encoder_index + 1:]:
+            if isinstance(step, StandardScaler):
+                step_scale = 1.0 / step.scale_ if step.scale_ is not None else np.ones(n_out)
+                step_shift = -step.mean_ * step_scale if step.mean_ is not None and step.with_mean else np.zeros(n_out)
+            elif isinstance(step, MinMaxScaler) and not step.clip:
+                step_scale, step_shift = step.scale_, step.min_
+            else:
+                raise NotImplementedError(f"[{name}]: step {type(step).__name__} after the encoder is not supported")
+            scale, shift = scale * step_scale, shift * step_scale + step_shift
+
+        out_index = out_start
+        for column, categories, fill_value, width in zip(columns, encoder.categories_, fill_values, widths):
+            lookup = {category: code for code, category in enumerate(categories)}
+            unknown_code = None
+            if not is_onehot:
+                if encoder.handle_unknown == "use_encoded_value":
+                    unknown_code = float(encoder.unknown_value)
+                else:
+                    unknown_code = np.nan  # unknown categories raise like in sklearn
+            self.categorical_outputs.append({
+                "column": column,
+                "categories": pd.Index(categories),
+                "lookup": lookup,
+                "fill_code": lookup.get(fill_value, _MISSING) if fill_value is not None else _MISSING,
+                "is_onehot": is_onehot,
+                "unknown_code": unknown_code,
+                "handle_unknown_error": not is_onehot and encoder.handle_unknown == "error",
+                "out_index": out_index,
+                "scale": scale[out_index - out_start:out_index - out_start + width],
+                "shift": shift[out_index - out_start:out_index - out_start + width]})
+            out_index += width
+        return out_index
+
+    def freeze_numeric_outputs(self) -> None:
+        """
+        Stacks the compiled numeric column states into flat arrays used by `transform`
+        """
+        outputs = self.numeric_outputs
+        self.numeric_columns = list(dict.fromkeys(output["column"] for output in outputs))
+        position = {column: i for i, column in enumerate(self.numeric_columns)}
+        self.numeric_source = np.array([position[output["column"]] for output in outputs], dtype=np.intp)
+        self.numeric_out_index = np.array([output["out_index"] for output in outputs], dtype=np.intp)
+        self.numeric_fill = np.array([output["fill"] for output in outputs], dtype=np.float64)
+        self.numeric_pre = np.array([output["pre"] for output in outputs], dtype=np.float64).reshape(-1, 2)
+        self.numeric_post = np.array([output["post"] for output in outputs], dtype=np.float64).reshape(-1, 2)
+        self.yeo_johnson_index = np.array([i for i, output in enumerate(outputs) if output["lambda"] is not None],
+                                          dtype=np.intp)
+        self.yeo_johnson_lambdas = np.array([outputs[i]["lambda"] for i in self.yeo_johnson_index], dtype=np.float64)
+
+    def encode(self, values, output: dict) -> np.ndarray:
+        """
+        Returns the category codes of the values, _MISSING for missing values and
+        _UNKNOWN for categories not seen at fit time
+        """
+        if len(values) <= SMALL_BATCH_SIZE:
+            lookup = output["lookup"]
+            codes = np.array([lookup.get(value, _MISSING if value is None or value != value else _UNKNOWN)
+                              for value in values], dtype=np.int64)
+        else:
+            # get_indexer gives -1 (_UNKNOWN) for the categories not seen at fit time. Categorical
+            # values are looked up once per category of their dtype instead of once per row
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Missing values have the code -1, which picks the _MISSING appended last
+                category_codes = np.append(output["categories"].get_indexer(values.cat.categories), _MISSING)
+                codes = category_codes[values.cat.codes.to_numpy()].astype(np.int64)
+            else:
+                codes = output["categories"].get_indexer(values).astype(np.int64)
+            codes[np.asarray(pd.isna(values))] = _MISSING
+        codes[codes == _MISSING] = output["fill_code"]
+        if output["handle_unknown_error"] and (codes < 0).any():
+            raise ValueError(f"Found unknown categories in column: [{output['column']}] during transform")
+        return codes
+
+    def transform(self, dataframe: pd.DataFrame, out: np.ndarray = None) -> np.ndarray:
+        """
+        Transforms the dataframe into `out`, a float32 array of shape (n_rows, n_features_out)
+        allocated here when not given, and returns it
+        """
+        try:
+            n_rows = len(dataframe)
+            if out is None:
+                out = np.empty((n_rows, self.n_features_out), dtype=np.float32)
+
+            if len(self.numeric_columns) > 0:
+                raw = np.empty((n_rows, len(self.numeric_columns)), dtype=np.float64)
+                for i, column in enumerate(self.numeric_columns):
+                    raw[:, i] = dataframe[column].to_numpy(dtype=np.float64, na_value=np.nan)
+                values = raw[:, self.numeric_source]
+                missing = np.isnan(values)
+                if missing.any():
+                    np.copyto(values, np.broadcast_to(self.numeric_fill, values.shape), where=missing)
+                values *= self.numeric_pre[:, 0]
+                values += self.numeric_pre[:, 1]
+                if len(self.yeo_johnson_index) > 0:
+                    values[:, self.yeo_johnson_index] = _yeo_johnson(values[:, self.yeo_johnson_index],
+                                                                     self.yeo_johnson_lambdas)
+                values *= self.numeric_post[:, 0]
+                values += self.numeric_post[:, 1]
+                out[:, self.numeric_out_index] = values
+
+            for output in self.categorical_outputs:
+                codes = self.encode(dataframe[output["column"]].tolist() if n_rows <= SMALL_BATCH_SIZE
+                                    else dataframe[output["column"]], output)
+                start, scale, shift = output["out_index"], output["scale"], output["shift"]
+                if output["is_onehot"]:
+                    block = out[:, start:start + len(scale)]
+                    block[:] = shift
+                    known = codes >= 0
+                    rows = np.flatnonzero(known)
+                    block[rows, codes[known]] = scale[codes[known]] + shift[codes[known]]
+                else:
+                    encoded = np.where(codes >= 0, codes, output["unknown_code"])
+                    out[:, start] = encoded * scale[0] + shift[0]
+            return out
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_parity_difference(self, preprocessor, dataframe: pd.DataFrame,
+                              rtol: float = 1e-4, atol: float = 1e-4) -> float:
+        """
+        Returns the largest absolute difference between the compiled and the sklearn
+        transform of the dataframe, raises when they don't match
+        """
+        expected = np.asarray(preprocessor.transform(dataframe), dtype=np.float64)
+        actual = self.transform(dataframe).astype(np.float64)
+        if expected.shape != actual.shape:
+            raise Exception(f"Compiled preprocessor output shape {actual.shape} "
+                            f"does not match sklearn output shape {expected.shape}")
+        mismatch = ~np.isclose(actual, expected, rtol=rtol, atol=atol, equal_nan=True)
+        max_difference = float(np.nanmax(np.abs(actual - expected))) if actual.size else 0.0
+        if mismatch.any():
+            columns = sorted(set(np.nonzero(mismatch)[1].tolist()))
+            raise Exception(f"Compiled preprocessor does not match sklearn on a batch of {len(dataframe)} rows, "
+                            f"output columns: {columns}, max absolute difference: {max_difference}")
+        return max_difference
+
+    def check_parity(self, preprocessor, dataframe: pd.DataFrame,
+                     rtol: float = 1e-4, atol: float = 1e-4, n_single_rows: int = 8) -> float:
+        """
+        Checks that the compiled transform matches the sklearn one on the whole dataframe,
+        on its first SMALL_BATCH_SIZE rows and on `n_single_rows` rows one at a time, so
+        that both the pandas and the dict category lookup are checked.
+        Returns the largest absolute difference
+        """
+        try:
+            # Rows with missing values go first among the single rows, they also check the imputation
+            has_missing = dataframe.isna().any(axis=1).to_numpy()
+            single_rows = np.concatenate([np.flatnonzero(has_missing)[:n_single_rows // 2],
+                                          np.flatnonzero(~has_missing)])[:n_single_rows]
+            batches = [dataframe, dataframe.iloc[:SMALL_BATCH_SIZE]]
+            batches += [dataframe.iloc[[row]] for row in np.sort(single_rows)]
+
+            max_difference = max([self.get_parity_difference(preprocessor, batch, rtol=rtol, atol=atol)
+                                  for batch in batches if len(batch) > 0], default=0.0)
+            logging.info(f"Compiled preprocessor parity checked on {len(dataframe)} rows, a batch of "
+                         f"{min(len(dataframe), SMALL_BATCH_SIZE)} rows and {len(single_rows)} single rows, "
+                         f"max absolute difference: {max_difference}")
+            return max_difference
+        except Exception as e:
+            raise CustomException(e, sys) from e
@@ -4,31 +4,53 @@ from credit_score.logger import logging
 from credit_score.exception import CustomException
 from credit_score.entity.config_entity import DataIngestionConfig
 from credit_score.entity.artifact_entity import DataIngestionArtifact
-from credit_score.components.db_operation import MongoDB
-from sklearn.model_selection import train_test_split
+from credit_score.utils.utils import get_peak_rss_mb
+from credit_score.utils.utils import read_yaml_file
+from credit_score.utils.utils import get_schema_columns
+from credit_score.utils.utils import apply_schema_dtypes
+from credit_score.utils.utils import get_schema_read_dtypes
+from credit_score.utils.utils import save_dataframe
+from credit_score.instrumentation import instrument
+from credit_score.instrumentation import set_rows
+from credit_score.components.download_cache import DownloadCache
+from credit_score.components.archive_reader import ArchiveReader
+from credit_score.constant import *
 import pandas as pd
 import numpy as np
+from threading import Thread
 import os,sys
-import zipfile
+import shutil
+import time
 from six.moves import urllib
 
 
 
 class DataIngestion:
-    def __init__(self,data_ingestion_config : DataIngestionConfig):
+    def __init__(self,data_ingestion_config : DataIngestionConfig, db = None):
+        """
+        db: MongoDB to use, created when data goes through or is mirrored into the DB if not given
+        """
         try:
             logging.info(f"\n{'*'*20} Data Ingestion log started {'*'*20}\n")
             self.data_ingestion_config = data_ingestion_config
 
-            # Creating connection with the DB
-            self.db = MongoDB()
+            # Creating connection with the DB, only needed when data goes through or is mirrored into it
+            self.db = db
+            self.mirror_thread = None
+            self.mirror_error = None
+            self.archive_reader = None
+            if self.db is None and ((data_ingestion_config.ingestion_backend == "mongo") or data_ingestion_config.mirror_to_db):
+                from credit_score.components.db_operation import MongoDB
+                self.db = MongoDB()
 
         except Exception as e:
             raise CustomException(e,sys) from e
 
+    @instrument("download_data")
     def download_data(self):
         """
-        Downloads the zipped dataset from the given url and save it to the specified path.
+        Downloads the zipped dataset from the given url through the download cache and
+        links it into the specified path. An unchanged archive is not downloaded again.
         """
         try:
             # Extracting remote url to download dataset files
@@ -36,17 +58,26 @@ class DataIngestion:
 
             # folder location to download zipped file
             tgz_download_dir = self.data_ingestion_config.tgz_download_dir
-
-            if os.path.exists(tgz_download_dir):
-                os.remove(tgz_download_dir)
             os.makedirs(tgz_download_dir,exist_ok=True)
 
-            #file_name = os.path.basename(download_url)
-            file_name = "rental_bike_data.zip"
-            tgz_file_path = os.path.join(tgz_download_dir,file_name)
+            download_cache = DownloadCache(self.data_ingestion_config.download_cache_dir,
+                                           n_segments=self.data_ingestion_config.download_segments,
+                                           parallel_min_bytes=self.data_ingestion_config.download_parallel_min_bytes,
+                                           timeout=self.data_ingestion_config.download_timeout,
+                                           retries=self.data_ingestion_config.download_retries)
+            logging.info(f"Downloading file from: [{download_url}]")
+            cached_file_path = download_cache.get(download_url,
+                                                  expected_sha256=self.data_ingestion_config.download_sha256)
 
-            logging.info(f"Downloading file from: [{download_url}] into : [{tgz_file_path}]")
-            urllib.request.urlretrieve(download_url,tgz_file_path)
+            file_name = os.path.basename(urllib.parse.urlparse(download_url).path) or "dataset.zip"
+            tgz_file_path = os.path.join(tgz_download_dir,file_name)
+            if os.path.exists(tgz_file_path):
+                os.remove(tgz_file_path)
+            try:
+                # The cached archive is shared by the runs, not copied
+                os.link(cached_file_path, tgz_file_path)
+            except OSError:
+                shutil.copyfile(cached_file_path, tgz_file_path)
             logging.info(f"File: [{tgz_file_path}] has been downloaded successfully")
 
             return tgz_file_path
@@ -54,91 +85,197 @@ class DataIngestion:
         except Exception as e:
             raise CustomException(e,sys) from e
 
-    def extract_tgz_file(self,tgz_file_path:str):
+    def get_data_members(self) -> list:
+        """
+        Returns the name of every data file in the downloaded archive.
+        """
         try:
-            # Folder location to extract the downloaded zipped dataset files
-            raw_data_dir = self.data_ingestion_config.raw_data_dir
-            if os.path.exists(raw_data_dir):
-                os.remove(raw_data_dir)
-            os.makedirs(raw_data_dir,exist_ok=True)
+            return self.archive_reader.get_data_members()
+        except Exception as e:
+            raise CustomException(e,sys) from e
 
-            logging.info(f"Extracting zipped file : [{tgz_file_path}] into dir: [{raw_data_dir}]")
-            # Extarcting the files from zipped file
-            zip_ref = zipfile.ZipFile(tgz_file_path)
-            zip_ref.extractall(raw_data_dir)
-            zip_ref.close()
+    def read_data_files(self) -> pd.DataFrame:
+        """
+        Reads the data files straight from the archive into one dataframe, leaving out
+        the columns listed under drop_columns in the schema. Files are read in parallel.
+        """
+        try:
+            dataset_schema = read_yaml_file(file_path=self.data_ingestion_config.schema_file_path)
+            drop_columns = get_schema_columns(dataset_schema, DROP_COLUMN_KEY)
 
-            logging.info("Extraction completed successfully")
+            # Strings are parsed straight into categoricals and numbers into 64 bit types,
+            # downcast losslessly once the data is merged
+            read_dtypes = get_schema_read_dtypes(dataset_schema[DATASET_SCHEMA_COLUMNS_KEY])
+            dataframes = self.archive_reader.map_members(
+                lambda member: self.archive_reader.read_csv(member, usecols=lambda column: column not in drop_columns,
+                                                            dtype=read_dtypes),
+                self.get_data_members())
 
+            return pd.concat(dataframes, ignore_index=True)
         except Exception as e:
             raise CustomException(e,sys) from e
 
-    def data_merge_and_split(self):
+    def load_data_via_db(self) -> pd.DataFrame:
+        """
+        Dumps the data files of the archive into the main collection and fetches the entire data back.
+        """
         try:
-            raw_data_dir = self.data_ingestion_config.raw_data_dir  # Location for extracted data files
-            
-            file_name = os.listdir(raw_data_dir)[0]
-            data_file_path = os.path.join(raw_data_dir,file_name)
-            
+            chunk_size = self.data_ingestion_config.chunk_size
+            batch_size = self.data_ingestion_config.db_batch_size
+            n_threads = self.data_ingestion_config.db_writer_threads
+
             # Creating collection in mongoDb for dumping data
             self.db.create_and_check_collection()
-            
-            # Reading each data files and dumping it into DB
-            for file in os.listdir(data_file_path):
-                data = pd.read_csv(os.path.join(data_file_path,file))
-                data_dict = data.to_dict("records")
-                logging.info(f"Inserting file: [{file}] into DB")
-                self.db.insertall(data_dict)
+
+            # Streaming each data file from the archive in chunks and dumping it into DB
+            def insert_member(member:str):
+                for chunk in self.archive_reader.iter_csv_chunks(member, chunk_size):
+                    self.db.insert_dataframe(chunk, batch_size=batch_size, n_threads=n_threads)
+
+            self.archive_reader.map_members(insert_member, self.get_data_members())
 
             # fetching the data set from DB
-            logging.info(f"Fetching entire data from DB")
-            dataframe = self.db.fetch_df()
-            #columns = ['ssn', 'name',"id",'customer_id']
+            logging.info(f"Fetching entire data from DB in [{self.data_ingestion_config.db_fetch_mode}] mode")
+            if self.data_ingestion_config.db_fetch_mode == "columnar":
+                dataset_schema = read_yaml_file(file_path=self.data_ingestion_config.schema_file_path)
+                dataframe = self.db.fetch_columnar_df(
+                    columns=dataset_schema[DATASET_SCHEMA_COLUMNS_KEY],
+                    drop_columns=get_schema_columns(dataset_schema, DROP_COLUMN_KEY),
+                    batch_size=self.data_ingestion_config.db_fetch_batch_size)
+            else:
+                dataframe = self.db.fetch_df()
             logging.info(f"Entire data fetched successfully from DB!!!")
+            return dataframe
+        except Exception as e:
+            raise CustomException(e,sys) from e
 
-            # Splitting the dataset into train and test data based on date indexing
-            logging.info("Splitting Dataset into train and test")
-            train_set, test_set = train_test_split(dataframe, test_size=0.2, random_state=42)
-            logging.info(f"total no of columns:{train_set.shape[1]} and rows:{train_set.shape[0]}")
-            logging.info(f"total no of columns:{test_set.shape[1]} and rows:{test_set.shape[0]}")
+    def save_train_test_to_db(self, train_set:pd.DataFrame, test_set:pd.DataFrame, dataframe:pd.DataFrame = None):
+        """
+        Inserts the train and test sets into their collections.
+        The entire dataset is also dumped into the main collection when it is passed.
+        """
+        try:
+            batch_size = self.data_ingestion_config.db_batch_size
+            n_threads = self.data_ingestion_config.db_writer_threads
+
+            if dataframe is not None:
+                logging.info("Inserting entire data into DB")
+                self.db.create_and_check_collection()
+                self.db.insert_dataframe(dataframe, batch_size=batch_size, n_threads=n_threads)
 
             logging.info("Inserting new Training Data into DB")
             self.db.create_and_check_collection(collection_name="Training")
-            self.db.insertall(train_set.to_dict("records"))
+            self.db.insert_dataframe(train_set, batch_size=batch_size, n_threads=n_threads)
 
             logging.info("Inserting new Test Data into DB")
             self.db.create_and_check_collection(collection_name="Test")
-            self.db.insertall(test_set.to_dict("records"))
+            self.db.insert_dataframe(test_set, batch_size=batch_size, n_threads=n_threads)
+        except Exception as e:
+            raise CustomException(e,sys) from e
+
+    def mirror_to_db(self, dataframe:pd.DataFrame, train_set:pd.DataFrame, test_set:pd.DataFrame):
+        """
+        Target of the background mirroring thread. Failures are only logged as the
+        ingested files have already been written by then.
+        """
+        try:
+            logging.info("Mirroring ingested data into DB in background")
+            self.save_train_test_to_db(train_set, test_set, dataframe=dataframe)
+            logging.info("Mirroring ingested data into DB completed")
+        except Exception as e:
+            self.mirror_error = e
+            logging.error(f"Mirroring ingested data into DB failed: {e}")
+
+    def wait_for_mirror(self) -> bool:
+        """
+        Waits for the background mirroring thread, if one was started, and returns
+        whether the data is in the DB. A failed mirroring doesn't fail the pipeline.
+        """
+        if self.mirror_thread is None:
+            return False
+        logging.info("Waiting for the mirroring of ingested data into DB")
+        self.mirror_thread.join()
+        self.mirror_thread = None
+        is_mirrored = self.mirror_error is None
+        logging.info(f"Is ingested data mirrored into DB? -> {is_mirrored}")
+        return is_mirrored
+
+    @instrument("data_merge_and_split")
+    def data_merge_and_split(self):
+        try:
+            ingestion_backend = self.data_ingestion_config.ingestion_backend
+            start_time = time.perf_counter()
+
+            if ingestion_backend == "direct":
+                logging.info("Reading data files directly")
+                dataframe = self.read_data_files()
+            else:
+                dataframe = self.load_data_via_db()
+            set_rows(len(dataframe))
+
+            # Applying schema types before splitting so that train and test share the same categories
+            dataset_schema = read_yaml_file(file_path=self.data_ingestion_config.schema_file_path)
+            dataframe = apply_schema_dtypes(dataframe, dataset_schema[DATASET_SCHEMA_COLUMNS_KEY], downcast=True)
+            logging.info(f"Dataframe memory usage: {dataframe.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB")
+
+            # Splitting the dataset into train and test data based on date indexing
+            logging.info("Splitting Dataset into train and test")
+            from sklearn.model_selection import train_test_split
+            train_set, test_set = train_test_split(dataframe, test_size=0.2, random_state=42)
+            logging.info(f"total no of columns:{train_set.shape[1]} and rows:{train_set.shape[0]}")
+            logging.info(f"total no of columns:{test_set.shape[1]} and rows:{test_set.shape[0]}")
+
+            if ingestion_backend == "direct":
+                if self.data_ingestion_config.mirror_to_db:
+                    self.mirror_thread = Thread(target=self.mirror_to_db,
+                                                args=(dataframe, train_set, test_set),
+                                                name="db-mirror")
+                    self.mirror_thread.start()
+            else:
+                self.save_train_test_to_db(train_set, test_set)
             
             # Setting paths for train and test data
-            train_file_path = os.path.join(self.data_ingestion_config.ingested_train_dir,"train.csv")
-            test_file_path = os.path.join(self.data_ingestion_config.ingested_test_dir,"test.csv")
+            file_format = self.data_ingestion_config.ingested_file_format
+            train_file_path = os.path.join(self.data_ingestion_config.ingested_train_dir,f"train.{file_format}")
+            test_file_path = os.path.join(self.data_ingestion_config.ingested_test_dir,f"test.{file_format}")
 
             if train_set is not None:
-                os.makedirs(self.data_ingestion_config.ingested_train_dir,exist_ok=True)
                 logging.info(f"Exporting training dataset to file: [{train_file_path}]")
-                train_set.to_csv(train_file_path,index=False)
+                save_dataframe(train_file_path, train_set)
 
             if test_set is not None:
-                os.makedirs(self.data_ingestion_config.ingested_test_dir,exist_ok=True)
                 logging.info(f"Exporting test dataset to file: [{test_file_path}]")
-                test_set.to_csv(test_file_path,index=False)
+                save_dataframe(test_file_path, test_set)
+
+            if self.data_ingestion_config.export_csv and file_format != "csv":
+                logging.info("Exporting training and test dataset to csv files")
+                save_dataframe(os.path.join(self.data_ingestion_config.ingested_train_dir,"train.csv"), train_set)
+                save_dataframe(os.path.join(self.data_ingestion_config.ingested_test_dir,"test.csv"), test_set)
 
+            rows_per_second = len(dataframe) / (time.perf_counter() - start_time)
+            peak_rss_mb = get_peak_rss_mb()
+            logging.info(f"Ingested {len(dataframe)} rows at {rows_per_second:.0f} rows/s, peak RSS: "
+                         f"{'n/a' if peak_rss_mb is None else f'{peak_rss_mb:.1f} MB'}")
 
-            data_ingestion_artifact = DataIngestionArtifact(train_file_path=train_file_path,
+            data_ingestion_artifact = DataIngestionArtifact(archive_file_path=self.archive_reader.archive_file_path,
+                                                            train_file_path=train_file_path,
                                                             test_file_path=test_file_path,
                                                             is_ingested=True,
-                                                            message="Data ingestion completed successfully")
+                                                            message="Data ingestion completed successfully",
+                                                            rows_per_second=rows_per_second,
+                                                            peak_rss_mb=peak_rss_mb)
             logging.info(f"Data Ingestion Artifact: [{data_ingestion_artifact}]")
             return data_ingestion_artifact
         except Exception as e:
             raise CustomException(e,sys) from e
     
     
-    def initiate_data_ingestion(self) -> DataIngestionArtifact:
+    def initiate_data_ingestion(self, tgz_file_path:str = None) -> DataIngestionArtifact:
         try:
-            tgz_file_path = self.download_data()
-            self.extract_tgz_file(tgz_file_path=tgz_file_path)
+            if tgz_file_path is None:
+                tgz_file_path = self.download_data()
+            # Data files are read from the archive as it is, nothing is extracted to disk
+            self.archive_reader = ArchiveReader(tgz_file_path)
             return self.data_merge_and_split()
         except Exception as e:
             raise CustomException(e,sys) from e
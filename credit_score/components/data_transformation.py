@@ -3,6 +3,11 @@ from credit_score.utils.utils import save_data
 from credit_score.utils.utils import save_object
 from credit_score.utils.utils import load_data
 from credit_score.utils.utils import save_numpy_array_data
+from credit_score.utils.utils import get_schema_columns
+from credit_score.utils.utils import get_schema_read_dtypes
+from credit_score.utils.utils import apply_schema_dtypes
+from credit_score.utils.utils import iter_dataframe_chunks
+from credit_score.utils.utils import get_dataframe_n_rows
 from credit_score.logger import logging
 from credit_score.exception import CustomException
 from credit_score.constant import *
@@ -10,16 +15,22 @@ from credit_score.entity.artifact_entity import DataIngestionArtifact
 from credit_score.entity.artifact_entity import DataValidationArtifact
 from credit_score.entity.artifact_entity import DataTransformationArtifact
 from credit_score.entity.config_entity import DataTransformationConfig
+from credit_score.components.compiled_transformer import CompiledTransformer
+from credit_score.components.rebalancing import Rebalancer
+from credit_score.components.streaming_preprocessor import StreamingPreprocessor
+from credit_score.instrumentation import instrument
+from credit_score.instrumentation import measure
+from credit_score.instrumentation import set_rows
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.preprocessing import StandardScaler
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.preprocessing import LabelEncoder
 from sklearn.preprocessing import PowerTransformer
 from sklearn.preprocessing import OrdinalEncoder
+from sklearn.preprocessing import OneHotEncoder
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer 
-from imblearn.combine import SMOTEENN
 import os,sys
 import pandas as pd
 import numpy as np
@@ -45,10 +56,10 @@ class DataTransformation:
             schema_file_path = self.data_validation_artifact.schema_file_path
             dataset_schema = read_yaml_file(file_path= schema_file_path)
 
-            numerical_columns = dataset_schema[NUMERICAL_COLUMN_KEY]
-            ordinal_columns = dataset_schema[ORDINAL_COLUMN_KEY]
-            onehot_columns = dataset_schema[ONE_HOT_COLUMN_KEY]
-            transform_columns = dataset_schema[TRANSFORM_COLUMN_KEY]
+            numerical_columns = get_schema_columns(dataset_schema, NUMERICAL_COLUMN_KEY)
+            ordinal_columns = get_schema_columns(dataset_schema, ORDINAL_COLUMN_KEY)
+            onehot_columns = get_schema_columns(dataset_schema, ONE_HOT_COLUMN_KEY)
+            transform_columns = get_schema_columns(dataset_schema, TRANSFORM_COLUMN_KEY)
 
             num_pipeline = Pipeline(steps=[
                 ('imputer', SimpleImputer(strategy='median')),
@@ -57,12 +68,12 @@ class DataTransformation:
 
             onehot_pipeline= Pipeline(steps=[
                 ('imputer', SimpleImputer(strategy='most_frequent')),
-                ('label_encoder', LabelEncoder()),
+                ('one_hot_encoder', OneHotEncoder(handle_unknown='ignore', sparse_output=False)),
                 ('scaler', StandardScaler(with_mean=False))
             ])
             ordinal_pipeline = Pipeline(steps=[
                 ('imputer', SimpleImputer(strategy='most_frequent')),
-                ('one_hot_encoder', OrdinalEncoder()),
+                ('ordinal_encoder', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1)),
                 ('scaler', StandardScaler(with_mean=False))
             ])
 
@@ -102,8 +113,145 @@ class DataTransformation:
             raise CustomException(e, sys) from e 
     """        
     
+    def get_transformed_file_paths(self) -> tuple:
+        """
+        Returns the transformed train, test, train target and test target file paths
+        """
+        try:
+            transformed_train_dir = self.data_transformation_config.transformed_train_dir
+            transformed_test_dir = self.data_transformation_config.transformed_test_dir
+
+            train_file_name = os.path.splitext(os.path.basename(self.data_ingestion_artifact.train_file_path))[0]
+            test_file_name = os.path.splitext(os.path.basename(self.data_ingestion_artifact.test_file_path))[0]
+
+            return (os.path.join(transformed_train_dir, f"{train_file_name}.npy"),
+                    os.path.join(transformed_test_dir, f"{test_file_name}.npy"),
+                    os.path.join(transformed_train_dir, f"{train_file_name}_target.npy"),
+                    os.path.join(transformed_test_dir, f"{test_file_name}_target.npy"))
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def save_preprocessing_objects(self, preprocessing_obj, target_encoder, compiled_preprocessing_obj) -> None:
+        try:
+            logging.info(f"Saving preprocessing object.")
+            # Published to prediction_files by the pipeline, next to the trained model
+            for obj_file_path, obj in ((self.data_transformation_config.preprocessed_object_file_path, preprocessing_obj),
+                                       (self.data_transformation_config.target_encoder_object_file_path, target_encoder),
+                                       (self.data_transformation_config.compiled_preprocessed_object_file_path,
+                                        compiled_preprocessing_obj)):
+                save_object(file_path=obj_file_path, obj=obj)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_data_transformation_artifact(self, transformed_file_paths: tuple,
+                                         class_weights: list) -> DataTransformationArtifact:
+        try:
+            transformed_train_file_path, transformed_test_file_path, \
+                transformed_train_target_file_path, transformed_test_target_file_path = transformed_file_paths
+            data_transformation_artifact = DataTransformationArtifact(is_transformed=True,
+                                                                      message="Data transformation successfull.",
+                                                                      transformed_train_file_path=transformed_train_file_path,
+                                                                      transformed_test_file_path=transformed_test_file_path,
+                                                                      transformed_train_target_file_path=transformed_train_target_file_path,
+                                                                      transformed_test_target_file_path=transformed_test_target_file_path,
+                                                                      preprocessed_object_file_path=self.data_transformation_config.preprocessed_object_file_path,
+                                                                      target_encoder_object_file_path=self.data_transformation_config.target_encoder_object_file_path,
+                                                                      compiled_preprocessed_object_file_path=self.data_transformation_config.compiled_preprocessed_object_file_path,
+                                                                      class_weights=class_weights
+                                                                      )
+            logging.info(f"Data transformation artifact: {data_transformation_artifact}")
+            return data_transformation_artifact
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    @instrument("transform_chunks")
+    def save_transformed_chunks(self, get_chunks, n_rows: int, compiled_preprocessing_obj: CompiledTransformer,
+                                target_encoder: LabelEncoder, target_column_name: str,
+                                file_path: str, target_file_path: str) -> None:
+        """
+        Transforms the chunks one at a time into memory-mapped float32 features and int32 target .npy files
+        """
+        try:
+            set_rows(n_rows)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            features = np.lib.format.open_memmap(file_path, mode="w+", dtype=np.float32,
+                                                 shape=(n_rows, compiled_preprocessing_obj.n_features_out))
+            targets = np.lib.format.open_memmap(target_file_path, mode="w+", dtype=np.int32, shape=(n_rows,))
+            start = 0
+            for chunk in get_chunks():
+                end = start + len(chunk)
+                compiled_preprocessing_obj.transform(chunk, out=features[start:end])
+                targets[start:end] = target_encoder.transform(np.asarray(chunk[target_column_name]))
+                start = end
+            if start != n_rows:
+                raise Exception(f"{start} rows transformed, {n_rows} expected in [{file_path}]")
+            features.flush()
+            targets.flush()
+            del features, targets
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def initiate_out_of_core_data_transformation(self) -> DataTransformationArtifact:
+        """
+        Variant of `initiate_data_transformation` for data larger than memory: the preprocessor is
+        fitted from streamed chunks of the train file by StreamingPreprocessor, then both files are
+        transformed chunk by chunk into memory-mapped arrays at the usual artifact paths.
+        Resampling needs the whole train array in memory, only the class_weight and none
+        rebalancing strategies are supported.
+        """
+        try:
+            config = self.data_transformation_config
+            if config.rebalancing_strategy not in ("class_weight", "none"):
+                raise Exception(f"Rebalancing strategy: [{config.rebalancing_strategy}] is not supported out of core, "
+                                f"use class_weight or none")
+
+            schema = read_yaml_file(file_path=self.data_validation_artifact.schema_file_path)
+            schema_columns = schema[DATASET_SCHEMA_COLUMNS_KEY]
+            drop_columns = get_schema_columns(schema, DROP_COLUMN_KEY)
+            columns = [column for column in schema_columns if column not in drop_columns]
+            target_column_name = schema[TARGET_COLUMN_KEY]
+            read_dtypes = get_schema_read_dtypes(schema_columns, columns=columns)
+
+            def get_chunks_function(file_path: str):
+                return lambda: (apply_schema_dtypes(chunk, schema_columns, downcast=True)
+                                for chunk in iter_dataframe_chunks(file_path, config.chunk_size,
+                                                                   columns=columns, dtype=read_dtypes))
+
+            get_train_chunks = get_chunks_function(self.data_ingestion_artifact.train_file_path)
+            get_test_chunks = get_chunks_function(self.data_ingestion_artifact.test_file_path)
+
+            logging.info(f"Fitting preprocessing object out of core, {config.chunk_size} rows at a time.")
+            streaming_preprocessor = StreamingPreprocessor(self.get_data_transformer_object(),
+                                                           reservoir_size=config.reservoir_size)
+            compiled_preprocessing_obj = streaming_preprocessor.fit(get_train_chunks, target_column=target_column_name)
+            target_encoder = LabelEncoder().fit(np.asarray(list(streaming_preprocessor.target_counts_)))
+
+            transformed_file_paths = self.get_transformed_file_paths()
+            transformed_train_file_path, transformed_test_file_path, \
+                transformed_train_target_file_path, transformed_test_target_file_path = transformed_file_paths
+            logging.info(f"Saving transformed training and test array.")
+            self.save_transformed_chunks(get_train_chunks, streaming_preprocessor.n_rows_, compiled_preprocessing_obj,
+                                         target_encoder, target_column_name,
+                                         transformed_train_file_path, transformed_train_target_file_path)
+            self.save_transformed_chunks(get_test_chunks,
+                                         get_dataframe_n_rows(self.data_ingestion_artifact.test_file_path),
+                                         compiled_preprocessing_obj, target_encoder, target_column_name,
+                                         transformed_test_file_path, transformed_test_target_file_path)
+
+            class_weights = Rebalancer(strategy=config.rebalancing_strategy).get_class_weights(
+                np.load(transformed_train_target_file_path, mmap_mode="r"))
+
+            # There is no fitted sklearn object, the compiled one has the same transform
+            self.save_preprocessing_objects(compiled_preprocessing_obj, target_encoder, compiled_preprocessing_obj)
+            return self.get_data_transformation_artifact(transformed_file_paths, class_weights)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
     def initiate_data_transformation(self) -> DataTransformationArtifact:
         try:
+            if self.data_transformation_config.out_of_core:
+                return self.initiate_out_of_core_data_transformation()
+
             logging.info(f"Obtaining preprocessing object.")
             preprocessing_obj = self.get_data_transformer_object()
 
@@ -113,17 +261,20 @@ class DataTransformation:
 
             schema_file_path = self.data_validation_artifact.schema_file_path
 
-            logging.info(f"Loading training and test data as pandas dataframe.")
-            train_df = load_data(file_path=train_file_path, schema_file_path=schema_file_path)
+            schema = read_yaml_file(file_path=schema_file_path)
 
-            test_df = load_data(file_path=test_file_path, schema_file_path=schema_file_path)
+            drop_columns = get_schema_columns(schema, DROP_COLUMN_KEY)
+            columns = [column for column in schema[DATASET_SCHEMA_COLUMNS_KEY] if column not in drop_columns]
 
-            schema = read_yaml_file(file_path=schema_file_path)
+            logging.info(f"Loading training and test data as pandas dataframe.")
+            train_df = load_data(file_path=train_file_path, schema_file_path=schema_file_path, columns=columns)
+
+            test_df = load_data(file_path=test_file_path, schema_file_path=schema_file_path, columns=columns)
 
             target_column_name = schema[TARGET_COLUMN_KEY]
             numerical_columns = schema[NUMERICAL_COLUMN_KEY]
 
-            logging.info(f"{numerical_columns}")
+            logging.info("Numerical columns: %s", numerical_columns)
 
             #continuous_columns = ['Age','Annual_Income','Monthly_Inhand_Salary','Interest_Rate',
              #                     'Delay_from_due_date','Num_of_Delayed_Payment','Changed_Credit_Limit',
@@ -144,59 +295,58 @@ class DataTransformation:
             logging.info(f"Outlier capped in test df")            
             """
             logging.info(f"Splitting input and target feature from training and testing dataframe.")
-            input_feature_train_df = train_df.drop(columns=[target_column_name], axis=1)
+            input_feature_train_df = train_df.drop(columns=[target_column_name])
             target_feature_train_df = train_df[target_column_name]
-            print(input_feature_train_df)
 
-            input_feature_test_df = test_df.drop(columns=[target_column_name], axis=1)
+            input_feature_test_df = test_df.drop(columns=[target_column_name])
             target_feature_test_df = test_df[target_column_name]
 
-            logging.info(f"{input_feature_train_df.columns}")
-            logging.info(f"{target_feature_train_df}")
-            logging.info(f"{input_feature_test_df.columns}")
-            logging.info(f"{target_feature_test_df}")
+            logging.info(f"Input features: {list(input_feature_train_df.columns)}, "
+                         f"train rows: {len(input_feature_train_df)}, test rows: {len(input_feature_test_df)}")
 
             logging.info(f"Applying preprocessing object on training dataframe and testing dataframe.")
-            input_feature_train_arr = preprocessing_obj.fit_transform(input_feature_train_df)
-            input_feature_test_arr = preprocessing_obj.transform(input_feature_test_df)
+            with measure("fit_transform", rows=len(input_feature_train_df)):
+                input_feature_train_arr = preprocessing_obj.fit_transform(input_feature_train_df)
+            with measure("transform", rows=len(input_feature_test_df)):
+                input_feature_test_arr = preprocessing_obj.transform(input_feature_test_df)
+
+            # Freezing the fitted preprocessor into the fast inference time transformer,
+            # it has to give the same output as the sklearn object on the test data, scored whole
+            # and as the small batches and single rows of online prediction
+            logging.info(f"Compiling preprocessing object.")
+            compiled_preprocessing_obj = CompiledTransformer(preprocessing_obj)
+            compiled_preprocessing_obj.check_parity(preprocessing_obj, input_feature_test_df)
             
-            smt = SMOTEENN(random_state=42,sampling_strategy='all') # all
-            
-            input_feature_train_arr, target_feature_train_df = smt.fit_resample(input_feature_train_arr, target_feature_train_df)
-            
-            input_feature_test_arr, target_feature_test_df = smt.fit_resample(input_feature_test_arr , target_feature_test_df)
-
-            train_arr = np.c_[input_feature_train_arr, np.array(target_feature_train_df)]
-
-            test_arr = np.c_[input_feature_test_arr, np.array(target_feature_test_df)]
-
-            transformed_train_dir = self.data_transformation_config.transformed_train_dir
-            transformed_test_dir = self.data_transformation_config.transformed_test_dir
-
-            train_file_name = os.path.basename(train_file_path).replace(".csv", ".npz")
-            test_file_name = os.path.basename(test_file_path).replace(".csv", ".npz")
-
-            transformed_train_file_path = os.path.join(transformed_train_dir, train_file_name)
-            transformed_test_file_path = os.path.join(transformed_test_dir, test_file_name)
+            # Features are kept as a contiguous float32 matrix and the labels as a separate
+            # int32 code vector, so that both can be memory-mapped by the trainer.
+            target_encoder = LabelEncoder()
+            train_target_arr = target_encoder.fit_transform(np.asarray(target_feature_train_df)).astype(np.int32)
+            test_target_arr = target_encoder.transform(np.asarray(target_feature_test_df)).astype(np.int32)
+
+            # Only the train data is rebalanced by default, the test data has to keep the real class mix
+            logging.info(f"Rebalancing classes with strategy: [{self.data_transformation_config.rebalancing_strategy}]")
+            rebalancer = Rebalancer(strategy=self.data_transformation_config.rebalancing_strategy,
+                                    n_jobs=self.data_transformation_config.rebalancing_n_jobs,
+                                    chunk_size=self.data_transformation_config.rebalancing_chunk_size)
+            train_arr, train_target_arr = rebalancer.fit_resample(input_feature_train_arr, train_target_arr)
+            test_arr, test_target_arr = np.ascontiguousarray(input_feature_test_arr, dtype=np.float32), test_target_arr
+            if self.data_transformation_config.rebalance_test:
+                test_arr, test_target_arr = rebalancer.fit_resample(test_arr, test_target_arr)
+            class_weights = rebalancer.get_class_weights(train_target_arr)
+
+            transformed_file_paths = self.get_transformed_file_paths()
+            transformed_train_file_path, transformed_test_file_path, \
+                transformed_train_target_file_path, transformed_test_target_file_path = transformed_file_paths
 
             logging.info(f"Saving transformed training and test array.")
 
             save_numpy_array_data(file_path=transformed_train_file_path, array=train_arr)
             save_numpy_array_data(file_path=transformed_test_file_path, array=test_arr)
+            save_numpy_array_data(file_path=transformed_train_target_file_path, array=train_target_arr)
+            save_numpy_array_data(file_path=transformed_test_target_file_path, array=test_target_arr)
 
-            preprocessing_obj_file_path = self.data_transformation_config.preprocessed_object_file_path
-
-            logging.info(f"Saving preprocessing object.")
-            save_object(file_path=preprocessing_obj_file_path, obj=preprocessing_obj)
-
-            data_transformation_artifact = DataTransformationArtifact(is_transformed=True,
-                                                                      message="Data transformation successfull.",
-                                                                      transformed_train_file_path=transformed_train_file_path,
-                                                                      transformed_test_file_path=transformed_test_file_path,
-                                                                      preprocessed_object_file_path=preprocessing_obj_file_path
-                                                                      )
-            logging.info(f"Data transformation artifact: {data_transformation_artifact}")
-            return data_transformation_artifact
+            self.save_preprocessing_objects(preprocessing_obj, target_encoder, compiled_preprocessing_obj)
+            return self.get_data_transformation_artifact(transformed_file_paths, class_weights)
         except Exception as e:
             raise CustomException(e, sys) from e
 
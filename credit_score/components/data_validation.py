@@ -5,11 +5,17 @@ from credit_score.entity.artifact_entity import DataValidationArtifact
 from credit_score.entity.config_entity import DataIngestionConfig
 from credit_score.entity.config_entity import DataValidationConfig
 from credit_score.config.Configuration import Configuration
+from credit_score.pipeline.executor import TaskGraph
+from credit_score.components.drift_monitor import DriftMonitor
+from credit_score.components.schema_validator import SchemaValidator
+from credit_score.components.archive_reader import ArchiveReader
 from credit_score.utils.utils import read_yaml_file
-from evidently.model_profile import Profile
-from evidently.model_profile.sections import DataDriftProfileSection
-from evidently.dashboard import Dashboard
-from evidently.dashboard.tabs import DataDriftTab
+from credit_score.utils.utils import save_object
+from credit_score.utils.utils import read_dataframe
+from credit_score.utils.utils import get_schema_columns
+from credit_score.instrumentation import instrument
+from credit_score.instrumentation import set_rows
+from credit_score.constant import *
 import pandas as pd
 import numpy as np
 import os, sys
@@ -18,12 +24,15 @@ import json
 
 class Prediction_validator:
 
-    def __init__(self, path, data_validation_config = DataValidationConfig):
+    def __init__(self, path, data_validation_config = DataValidationConfig, chunk_size:int = 100000):
         try:
             self.path = path
             self.data_validation_config = data_validation_config
             self.schema_file_path = self.data_validation_config.schema_file_path
             self.dataset_schema = read_yaml_file(file_path= self.schema_file_path)
+            self.chunk_size = chunk_size
+            # Every feature column has to be there, the target and the dropped columns are optional
+            self.schema_validator = SchemaValidator.for_features(self.dataset_schema, chunk_size=chunk_size)
         except Exception as e:
             raise CustomException(e,sys) from e
          
@@ -31,47 +40,22 @@ class Prediction_validator:
     def file_name_check(self, file_name):
         try:
             logging.info("Checking File Name")
-            print(self.data["FileName"])
-            schema_file_name = self.dataset_schema['SampleFileName']
-            if schema_file_name == file_name:
-                return True
+            # Prediction files can have any name, only the file type has to match the sample file
+            schema_file_extension = os.path.splitext(self.dataset_schema['SampleFileName'])[1]
+            if os.path.splitext(file_name)[1] != schema_file_extension:
+                raise Exception(f"File: [{file_name}] is not a [{schema_file_extension}] file")
+            return True
         except Exception as e:
             raise CustomException(e,sys) from e
     
+    @instrument("column_check")
     def column_check(self, file):
         try:
             logging.info("Checking detail about columns")
-            data = pd.read_csv(file)
-            # find no of columns in dataset
-            logging.info("find no of columns in dataset")
-            no_of_columns = data.shape[1]-7
-            # checking no of columns in dataset as per schema file
-            logging.info("checking no of columns in dataset as per schema file")
-            if no_of_columns != self.dataset_schema['NumberofColumns']:
-                raise Exception(F"No of columns is not correct in file: [{file}]!!!")
-            
-            columns = list(data.columns)
-
-            # checking for Columns name, whether they are as per the defined schema
-            logging.info("checking for Columns name, whether they are as per the defined schema")
-            
-            for column in columns:
-                if column not in self.dataset_schema['Columns'].keys():
-                    raise Exception(F"column :[{column}] in file: [{file}] not available in the schema!!!")
-
-            # # Checking whether any column have entire rows as missing value
-            logging.info("checking for Columns missing")
-            count = 0
-            col = []
-            for column in columns:            
-                if (len(data[column]) - data[column].count()) == len(data[column]):
-                    count+=1
-                    col.append(column)
-            if count > 0:
-                raise Exception(f"Columns: [{col}] have entire row as missing value") 
-
-            return True    
-
+            # Header and values are checked in one streamed pass, the file can be larger than memory
+            is_valid = self.schema_validator.check(file)
+            set_rows(self.schema_validator.n_rows_)
+            return is_valid
         except Exception as e:
             raise CustomException(e,sys) from e
         
@@ -80,7 +64,7 @@ class Prediction_validator:
                 logging.info("Validating the schema of the dataset")
                 validation_status = False
                 
-                if self.file_name_check(os.path.basename(self.path)) and self.column_check(os.path.join(self.path)):
+                if self.file_name_check(os.path.basename(self.path)) and self.column_check(self.path):
                     validation_status = True
                 
                 logging.info("Schema Validation Completed")
@@ -108,14 +92,25 @@ class DataValidaton:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.schema_file_path = self.data_validation_config.schema_file_path
             self.dataset_schema = read_yaml_file(file_path= self.schema_file_path)
+            self.schema_validator = SchemaValidator(self.dataset_schema, check_number_of_columns=True)
+            self.train_test_df = None
         except Exception as e:
             raise CustomException(e,sys) from e
         
     def get_train_test_df(self):
+        """
+        Reads the ingested train and test data once, only with the schema columns
+        which are not dropped, and reuses them for every later call.
+        """
         try:
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path)
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
-            return train_df, test_df
+            if self.train_test_df is None:
+                drop_columns = get_schema_columns(self.dataset_schema, DROP_COLUMN_KEY)
+                columns = [column for column in self.dataset_schema[DATASET_SCHEMA_COLUMNS_KEY]
+                           if column not in drop_columns]
+                train_df = read_dataframe(self.data_ingestion_artifact.train_file_path, columns=columns)
+                test_df = read_dataframe(self.data_ingestion_artifact.test_file_path, columns=columns)
+                self.train_test_df = (train_df, test_df)
+            return self.train_test_df
         except Exception as e:
             raise CustomException(e,sys) from e
         
@@ -164,38 +159,13 @@ class DataValidaton:
             raise CustomException(e,sys) from e
         
     
+    @instrument("column_check")
     def column_check(self,file):   
         try:
-            data = pd.read_csv(file)
-            # Finding no of columns in the dataset
-            logging.info(f"total no of columns:{data.shape[1]} and rows:{data.shape[0]}")
-            no_of_columns = data.shape[1]
-            logging.info(f"total no of columns:{data.shape[1]} and rows:{data.shape[0]}")
-            # Checking if the no of columns in dataset is as per defined schema
-            if no_of_columns != self.dataset_schema["NumberOfColumns"]:
-                raise Exception(f"No of columns is not correct in file: [{file}]!!!")
-
-            columns = list(data.columns)
-            logging.info(f"{list(data.columns)}")
-
-
-            # Checking for columns name , whether they are as per the defined schema
-            for column in columns:
-                if column not in self.dataset_schema["Columns"].keys():
-                    raise Exception(f"Column :[{column}] in file: [{file}] not available in the Schema!!!")
-
-            # Checking whether any column have entire rows as missing value
-            count = 0
-            col = []
-            for column in columns:            
-                if (len(data[column]) - data[column].count()) == len(data[column]):
-                    count+=1
-                    col.append(column)
-            if count > 0:
-                raise Exception(f"Columns: [{col}] have entire row as missing value") 
-
-            return True
-
+            logging.info("Checking detail about columns")
+            is_valid = self.schema_validator.check(file)
+            set_rows(self.schema_validator.n_rows_)
+            return is_valid
         except Exception as e:
             raise CustomException(e,sys) from e 
     
@@ -203,15 +173,16 @@ class DataValidaton:
         try:
             logging.info("Validating the schema of the dataset")
             validation_status = False
-            raw_data_dir = self.data_ingestion_config.raw_data_dir
-            
-            file_name = os.listdir(raw_data_dir)[0]
-            data_file_path = os.path.join(raw_data_dir,file_name)
-            
-            for file in os.listdir(data_file_path):
-                if self.file_name_check(file) and self.column_check(os.path.join(data_file_path,file)):
-                    validation_status = True
-                
+            # Data files are validated straight from the downloaded archive, as they are streamed
+            # out of it. One at a time, they share the schema validator
+            archive_reader = ArchiveReader(self.data_ingestion_artifact.archive_file_path)
+
+            for member in archive_reader.get_data_members():
+                if self.file_name_check(os.path.basename(member)):
+                    with archive_reader.open_member(member) as member_file:
+                        if self.column_check(member_file):
+                            validation_status = True
+
             logging.info("Schema Validation Completed")
             logging.info(f"Is dataset schema as per the defined schema? -> {validation_status}")
             return validation_status
@@ -219,30 +190,58 @@ class DataValidaton:
         except Exception as e:
             raise CustomException(e,sys) from e
         
-    def get_and_save_data_drift_report(self):
+    def get_drift_monitor(self, train_df:pd.DataFrame = None) -> DriftMonitor:
+        """
+        Sketches the train data as the drift reference and saves the monitor. The pipeline
+        publishes it to prediction_files, to compare the scoring traffic with the same reference.
+        """
         try:
-            logging.info("Generating data drift report.json file")
-            profile = Profile(sections = [DataDriftProfileSection()])
-            train_df, test_df = self.get_train_test_df()
-            profile.calculate(train_df, test_df)
-            
-            report = json.loads(profile.json())
-            report_file_path = self.data_validation_config.report_file_path
-            report_dir = os.path.dirname(report_file_path)
-            os.makedirs(report_dir,exist_ok=True)
+            logging.info("Sketching the drift reference data")
+            if train_df is None:
+                train_df, _ = self.get_train_test_df()
+            drift_monitor = DriftMonitor.from_schema(self.dataset_schema,
+                                                     n_bins=self.data_validation_config.drift_n_bins,
+                                                     p_value_threshold=self.data_validation_config.drift_p_value_threshold,
+                                                     psi_threshold=self.data_validation_config.drift_psi_threshold,
+                                                     drift_share=self.data_validation_config.drift_share)
+            drift_monitor.update_reference(train_df)
+
+            drift_reference_file_path = self.data_validation_config.drift_reference_file_path
+            save_object(file_path=drift_reference_file_path, obj=drift_monitor)
+            return drift_monitor
+        except Exception as e:
+            raise CustomException(e,sys) from e
 
-            with open(report_file_path,"w") as report_file:
-                json.dump(report, report_file, indent = 6)
+    def get_and_save_data_drift_report(self, train_df:pd.DataFrame = None, test_df:pd.DataFrame = None):
+        try:
+            logging.info("Generating data drift report.json file")
+            if train_df is None or test_df is None:
+                train_df, test_df = self.get_train_test_df()
+            drift_monitor = self.get_drift_monitor(train_df)
+            drift_monitor.update(test_df)
+            report = drift_monitor.save_report(self.data_validation_config.report_file_path)
             logging.info("Report.json file generation successful!!")
             return report
         except Exception as e:
             raise CustomException(e,sys) from e   
 
-    def save_data_drift_report_page(self):
+    def save_data_drift_report_page(self, train_df:pd.DataFrame = None, test_df:pd.DataFrame = None):
         try:
+            if not self.data_validation_config.save_report_page:
+                logging.info("Report.html page is disabled")
+                return
+            try:
+                # evidently is only needed for this page, the json report is computed without it
+                from evidently.dashboard import Dashboard
+                from evidently.dashboard.tabs import DataDriftTab
+            except ImportError as e:
+                logging.info(f"Report.html page skipped, evidently is not available: {e}")
+                return
+
             logging.info("Generating data drift report.html page")
             dashboard = Dashboard(tabs = [DataDriftTab()])
-            train_df, test_df = self.get_train_test_df()
+            if train_df is None or test_df is None:
+                train_df, test_df = self.get_train_test_df()
             dashboard.calculate(train_df, test_df)
 
             report_page_file_path = self.data_validation_config.report_page_file_path
@@ -259,20 +258,34 @@ class DataValidaton:
             logging.info("Checking for Data Drift")
             report = self.get_and_save_data_drift_report()
             self.save_data_drift_report_page()
-            return True
+            return report["data_drift"]["data"]["metrics"]["dataset_drift"]
         except Exception as e:
             raise CustomException(e,sys) from e
 
     def initiate_data_validation(self) -> DataValidationArtifact:
         try:
-            self.validate_dataset_schema()
-            self.is_train_test_file_exists()
-            self.is_data_drift_found()
+            # Schema validation and the two drift reports are independent, the reports
+            # share the train and test dataframes loaded once by the load task.
+            validation_graph = TaskGraph(name="data_validation")
+            validation_graph.add_task("validate_dataset_schema", self.validate_dataset_schema)
+            validation_graph.add_task("is_train_test_file_exists", self.is_train_test_file_exists)
+            validation_graph.add_task("train_test_df",
+                                      lambda is_train_test_file_exists: self.get_train_test_df(),
+                                      dependencies=["is_train_test_file_exists"])
+            validation_graph.add_task("data_drift_report",
+                                      lambda train_test_df: self.get_and_save_data_drift_report(*train_test_df),
+                                      dependencies=["train_test_df"])
+            validation_graph.add_task("data_drift_report_page",
+                                      lambda train_test_df: self.save_data_drift_report_page(*train_test_df),
+                                      dependencies=["train_test_df"])
+            validation_graph.run()
+            logging.info(f"Data validation task timings: {validation_graph.timings}")
 
             data_validation_artifact = DataValidationArtifact(
                 schema_file_path=self.data_validation_config.schema_file_path,
                 report_file_path=self.data_validation_config.report_file_path,
                 report_page_file_path=self.data_validation_config.report_page_file_path,
+                drift_reference_file_path=self.data_validation_config.drift_reference_file_path,
                 is_validated=True,
                 message="Data Validation performed successfully.")
 
@@ -1,16 +1,24 @@
 from credit_score.constant import *
 from credit_score.logger import logging
 from credit_score.exception import CustomException
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pandas.api.types import union_categoricals
+import bson
 import pymongo
 import pandas as pd
+import numpy as np
 import os
 import sys
 
 class MongoDB:
 
-    def __init__(self) -> None:
+    def __init__(self, client = None) -> None:
+        """
+        client: pymongo client to use, e.g. the in-memory stand-in of credit_score.benchmark.in_memory_mongo,
+        a connection to DATABASE_CLIENT_URL_KEY by default
+        """
         try:
-            self.client = pymongo.MongoClient(DATABASE_CLIENT_URL_KEY)
+            self.client = pymongo.MongoClient(DATABASE_CLIENT_URL_KEY) if client is None else client
             logging.info("Connection with DB created successfully!!!")                                
             self.db= self.client[DATABASE_NAME_KEY]
             self.collection_name= DATABASE_COLLECTION_NAME_KEY
@@ -45,19 +53,120 @@ class MongoDB:
         except Exception as e:
             raise CustomException(e,sys) from e
 
+    def insert_dataframe(self, dataframe:pd.DataFrame, batch_size:int, n_threads:int = 1)-> int:
+        """
+        Inserts the dataframe into the current collection in batches of `batch_size` rows.
+        Only one batch per writer thread is converted to records at a time, and the writer
+        threads share the same MongoClient connection pool.
+
+        Returns the number of rows inserted.
+        """
+        try:
+            collection = self.collection
+            n_rows = len(dataframe)
+
+            def insert_batch(start:int)-> int:
+                records = dataframe.iloc[start:start + batch_size].to_dict("records")
+                collection.insert_many(records, ordered=False)
+                return len(records)
+
+            batch_starts = range(0, n_rows, batch_size)
+            if n_threads <= 1:
+                return sum(insert_batch(start) for start in batch_starts)
+
+            inserted = 0
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                pending = set()
+                for start in batch_starts:
+                    # Keeping at most two batches per thread in flight to bound memory
+                    if len(pending) >= 2 * n_threads:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        inserted += sum(future.result() for future in done)
+                    pending.add(executor.submit(insert_batch, start))
+                inserted += sum(future.result() for future in pending)
+            return inserted
+        except Exception as e:
+            raise CustomException(e,sys) from e
+
     def fetch_df(self,coll_name:str = None )->pd.DataFrame:
         try:
+            # The ObjectId _id added by the DB is not part of the data, it can't be saved to parquet
             if coll_name is None:
                 self.collection = self.db[self.collection_name]
-                dataframe = pd.DataFrame(self.collection.find())
+                dataframe = pd.DataFrame(self.collection.find({}, {"_id": 0}))
 
             if coll_name == "Training" or coll_name == "Test":
                 self.collection = self.db[coll_name]
-                dataframe = pd.DataFrame(self.collection.find())
+                dataframe = pd.DataFrame(self.collection.find({}, {"_id": 0}))
 
             logging.info(f"Data Fetched from collection: [{coll_name}] successfully!!!")
 
             return dataframe
 
         except Exception as e:
-            raise CustomException(e,sys) from e
\ No newline at end of file
+            raise CustomException(e,sys) from e
+
+    def _decode_column(self, values:list, column_type:str):
+        """
+        Converts one batch of raw values for a column into a typed array
+        as per the column type defined in the schema.
+        """
+        if column_type == "category":
+            # Missing values written from pandas come back as NaN doubles (NaN != NaN)
+            return pd.Categorical([None if value is None or value != value else str(value)
+                                   for value in values])
+        # Missing int values come back as None, or as NaN doubles when written from pandas
+        if column_type == "int" and not any(value is None or value != value for value in values):
+            return np.fromiter(values, dtype=np.int64, count=len(values))
+        return np.fromiter((np.nan if value is None else value for value in values),
+                           dtype=np.float64, count=len(values))
+
+    def fetch_columnar_df(self, columns:dict, drop_columns:list, coll_name:str = None,
+                          batch_size:int = 50000)->pd.DataFrame:
+        """
+        Fetches the collection as a typed dataframe.
+
+        Only the schema columns which are not in `drop_columns` are requested from the DB.
+        Documents are pulled as raw BSON batches and every batch is decoded straight into
+        one typed array per column, so no intermediate list of row dicts is kept around.
+
+        columns: dict of column name and type from the `Columns` section of the schema
+        drop_columns: columns to be left out of the projection
+        """
+        try:
+            if coll_name is None:
+                coll_name = self.collection_name
+            self.collection = self.db[coll_name]
+
+            fields = [column for column in columns if column not in drop_columns]
+            projection = {field: 1 for field in fields}
+            projection["_id"] = 0
+
+            batches = {field: [] for field in fields}
+            cursor = self.collection.find_raw_batches({}, projection, batch_size=batch_size)
+            for raw_batch in cursor:
+                documents = bson.decode_all(raw_batch)
+                for field in fields:
+                    values = [document.get(field) for document in documents]
+                    batches[field].append(self._decode_column(values, columns[field]))
+
+            # Fields without any value are kept as all missing columns, the schema
+            # validation reports them instead of a missing column error later on
+            data = {}
+            for field, arrays in batches.items():
+                if len(arrays) == 0:
+                    arrays = [self._decode_column([], columns[field])]
+                if columns[field] == "category":
+                    column = pd.Series(union_categoricals(arrays))
+                else:
+                    # Upcasting int batches to float if any batch had missing values
+                    column = pd.Series(np.concatenate(arrays))
+                data[field] = column
+
+            dataframe = pd.DataFrame(data)
+            logging.info(f"Data Fetched from collection: [{coll_name}] with columns: {list(dataframe.columns)}")
+
+            return dataframe
+
+        except Exception as e:
+            raise CustomException(e,sys) from e
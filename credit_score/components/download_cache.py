@@ -0,0 +1,299 @@
+"""
+Download cache of the dataset archive.
+
+Downloaded files are kept in the cache dir under the sha256 of their content, and indexed by url
+with the validator of the remote file (ETag, else Last-Modified and size). A url is only
+downloaded again when its validator changed, and never when a file with the expected sha256 is
+already cached:
+
+    http(s) : ranged GET requests, an interrupted download is resumed from the bytes already
+              written (If-Range guards against a file changed in between), large files are
+              fetched as parallel segments when the server accepts ranges
+    file:// : on-prem mirrors, copied with the same resume and segment logic
+
+Every download is verified: size against Content-Length, sha256 against the expected one when
+given, before it is moved into the cache.
+
+    DownloadCache(cache_dir).get(url, expected_sha256=None) -> path of the cached file
+"""
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+import hashlib
+import http.client
+import json
+import os, sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+INDEX_FILE_NAME = "index.json"
+FILES_DIR_NAME = "files"
+READ_BLOCK_SIZE = 1024 * 1024
+
+RemoteFileInfo = namedtuple("RemoteFileInfo", ["url", "size", "etag", "last_modified", "accept_ranges"])
+
+
+def get_url_file_path(url: str) -> str:
+    """
+    Returns the local path of a file:// url
+    """
+    parsed_url = urllib.parse.urlparse(url)
+    return urllib.request.url2pathname(parsed_url.path)
+
+
+class DownloadCache:
+
+    def __init__(self, cache_dir: str, n_segments: int = 4, parallel_min_bytes: int = 64 * 1024 * 1024,
+                 timeout: float = 60, retries: int = 3):
+        """
+        n_segments: ranged requests run in parallel for files of at least parallel_min_bytes
+        retries: attempts of a failed request, each resuming where the previous one stopped
+        """
+        try:
+            self.cache_dir = cache_dir
+            self.files_dir = os.path.join(cache_dir, FILES_DIR_NAME)
+            self.index_file_path = os.path.join(cache_dir, INDEX_FILE_NAME)
+            self.n_segments = max(int(n_segments), 1)
+            self.parallel_min_bytes = parallel_min_bytes
+            self.timeout = timeout
+            self.retries = retries
+            self.lock = threading.Lock()
+            os.makedirs(self.files_dir, exist_ok=True)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def read_index(self) -> dict:
+        if not os.path.exists(self.index_file_path):
+            return {}
+        with open(self.index_file_path, "r") as index_file:
+            return json.load(index_file)
+
+    def write_index(self, index: dict) -> None:
+        # Replaced at once, a reader never sees a partly written index
+        temp_file_path = f"{self.index_file_path}.{os.getpid()}.tmp"
+        with open(temp_file_path, "w") as index_file:
+            json.dump(index, index_file, indent=4)
+        os.replace(temp_file_path, self.index_file_path)
+
+    @staticmethod
+    def is_entry_valid(entry: dict) -> bool:
+        """
+        Cheap check that the cached file is still the verified one: present, same size and mtime
+        """
+        file_path = entry["file_path"]
+        if not os.path.exists(file_path):
+            return False
+        stat = os.stat(file_path)
+        return stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]
+
+    @staticmethod
+    def get_validator(info: RemoteFileInfo) -> str:
+        """
+        Returns what identifies the version of the remote file, None when nothing does
+        """
+        if info.etag is not None:
+            return f"etag:{info.etag}"
+        if info.last_modified is not None and info.size is not None:
+            return f"last_modified:{info.last_modified}:{info.size}"
+        return None
+
+    def get_remote_info(self, url: str) -> RemoteFileInfo:
+        try:
+            if urllib.parse.urlparse(url).scheme == "file":
+                stat = os.stat(get_url_file_path(url))
+                return RemoteFileInfo(url=url, size=stat.st_size, etag=f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+                                      last_modified=None, accept_ranges=True)
+
+            try:
+                response = urllib.request.urlopen(urllib.request.Request(url, method="HEAD"), timeout=self.timeout)
+            except urllib.error.HTTPError as e:
+                # Some servers refuse HEAD, the headers of a GET are read without its body
+                logging.info(f"HEAD request of [{url}] failed with {e.code}, reading the headers of a GET")
+                response = urllib.request.urlopen(url, timeout=self.timeout)
+            with response:
+                headers = response.headers
+                content_length = headers.get("Content-Length")
+                # Ranged requests go to the url redirects ended on
+                return RemoteFileInfo(url=response.geturl(),
+                                      size=None if content_length is None else int(content_length),
+                                      etag=headers.get("ETag"),
+                                      last_modified=headers.get("Last-Modified"),
+                                      accept_ranges=headers.get("Accept-Ranges", "").lower() == "bytes")
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def open_range(self, info: RemoteFileInfo, start: int, end: int = None):
+        """
+        Returns the stream of bytes start to end (inclusive, the end of the file when None)
+        of the remote file and whether it starts at start, a server can answer with the whole file
+        """
+        if urllib.parse.urlparse(info.url).scheme == "file":
+            file_obj = open(get_url_file_path(info.url), "rb")
+            file_obj.seek(start)
+            return file_obj, True
+
+        if start == 0 and end is None:
+            return urllib.request.urlopen(info.url, timeout=self.timeout), True
+        request = urllib.request.Request(info.url, headers={"Range": f"bytes={start}-{'' if end is None else end}"})
+        # The range is only served if the file is still the same version, the whole file otherwise.
+        # Weak ETags can't be used for ranges
+        if info.etag is not None and not info.etag.startswith("W/"):
+            request.add_header("If-Range", info.etag)
+        elif info.last_modified is not None:
+            request.add_header("If-Range", info.last_modified)
+        response = urllib.request.urlopen(request, timeout=self.timeout)
+        return response, response.status == 206
+
+    def download_segment(self, info: RemoteFileInfo, part_file_path: str, start: int, end: int = None) -> None:
+        """
+        Downloads bytes start to end of the remote file into the part file, resuming
+        from the bytes it already has
+        """
+        for attempt in range(self.retries + 1):
+            offset = start + (os.path.getsize(part_file_path) if os.path.exists(part_file_path) else 0)
+            if end is not None and offset > end:
+                return
+            try:
+                stream, is_range = self.open_range(info, offset, end)
+                with stream:
+                    if not is_range and (start > 0 or end is not None):
+                        raise Exception(f"Server did not serve the range {start}-{end} of [{info.url}]")
+                    if offset > start:
+                        logging.info(f"Resuming [{part_file_path}] from byte {offset - start}" if is_range else
+                                     f"Server did not serve a range, downloading [{part_file_path}] again")
+                    position = offset if is_range else start
+                    last_byte = end if end is not None or info.size is None else info.size - 1
+                    with open(part_file_path, "ab" if is_range else "wb") as part_file:
+                        while last_byte is None or position <= last_byte:
+                            block_size = READ_BLOCK_SIZE if last_byte is None else min(READ_BLOCK_SIZE, last_byte - position + 1)
+                            block = stream.read(block_size)
+                            if not block:
+                                break
+                            part_file.write(block)
+                            position += len(block)
+                if last_byte is not None and position <= last_byte:
+                    raise ConnectionError(f"Connection closed at byte {position} of [{info.url}]")
+                return
+            except urllib.error.HTTPError as e:
+                if e.code == 416 and end is None and offset > 0:
+                    # Nothing left to download after offset
+                    return
+                if attempt == self.retries or e.code < 500:
+                    raise
+                logging.info(f"Download of [{part_file_path}] failed: {e}, retrying")
+            except (urllib.error.URLError, http.client.HTTPException, ConnectionError, TimeoutError) as e:
+                if attempt == self.retries:
+                    raise
+                logging.info(f"Download of [{part_file_path}] failed: {e}, retrying")
+            time.sleep(min(2 ** attempt, 30))
+
+    def download(self, info: RemoteFileInfo, part_prefix: str, file_path: str) -> str:
+        """
+        Downloads the remote file into file_path through part files named after part_prefix
+        and returns its sha256
+        """
+        try:
+            if (info.size is not None and info.accept_ranges and self.n_segments > 1
+                    and info.size >= self.parallel_min_bytes):
+                segment_size = -(-info.size // self.n_segments)
+                segments = [(start, min(start + segment_size, info.size) - 1)
+                            for start in range(0, info.size, segment_size)]
+            else:
+                segments = [(0, None)]
+            part_file_paths = [f"{part_prefix}.part{number}" for number in range(len(segments))]
+
+            logging.info(f"Downloading [{info.url}] ({info.size} bytes) in {len(segments)} segment(s)")
+            if len(segments) == 1:
+                self.download_segment(info, part_file_paths[0], *segments[0])
+            else:
+                with ThreadPoolExecutor(max_workers=len(segments), thread_name_prefix="download") as executor:
+                    futures = [executor.submit(self.download_segment, info, part_file_path, start, end)
+                               for part_file_path, (start, end) in zip(part_file_paths, segments)]
+                    for future in futures:
+                        future.result()
+
+            # Parts are joined and hashed in one pass
+            sha256 = hashlib.sha256()
+            size = 0
+            with open(file_path, "wb") as file_obj:
+                for part_file_path in part_file_paths:
+                    with open(part_file_path, "rb") as part_file:
+                        for block in iter(lambda: part_file.read(READ_BLOCK_SIZE), b""):
+                            sha256.update(block)
+                            file_obj.write(block)
+                            size += len(block)
+            if info.size is not None and size != info.size:
+                os.remove(file_path)
+                raise Exception(f"Downloaded {size} bytes of [{info.url}] instead of {info.size}")
+            for part_file_path in part_file_paths:
+                os.remove(part_file_path)
+            return sha256.hexdigest()
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get(self, url: str, expected_sha256: str = None) -> str:
+        """
+        Returns the path of the cached file of the url, downloaded unless an unchanged
+        version or a file with the expected sha256 is already cached
+        """
+        try:
+            with self.lock:
+                index = self.read_index()
+                if expected_sha256 is not None:
+                    expected_sha256 = expected_sha256.lower()
+                    for entry in index.values():
+                        if entry["sha256"] == expected_sha256 and self.is_entry_valid(entry):
+                            logging.info(f"Using cached file: [{entry['file_path']}] with sha256 {expected_sha256}")
+                            return entry["file_path"]
+
+                entry = index.get(url)
+                try:
+                    info = self.get_remote_info(url)
+                except Exception as e:
+                    if entry is not None and self.is_entry_valid(entry):
+                        logging.warning(f"[{url}] is not reachable ({e}), using the cached file: [{entry['file_path']}]")
+                        return entry["file_path"]
+                    raise
+
+                validator = self.get_validator(info)
+                if (entry is not None and validator is not None and entry["validator"] == validator
+                        and self.is_entry_valid(entry)):
+                    logging.info(f"[{url}] is unchanged, using the cached file: [{entry['file_path']}]")
+                    return entry["file_path"]
+
+                # Part files are specific to one version of the url, those of another version are removed
+                url_key = hashlib.sha256(url.encode()).hexdigest()[:16]
+                version_key = hashlib.sha256(str(validator).encode()).hexdigest()[:16]
+                part_prefix = os.path.join(self.cache_dir, f"{url_key}-{version_key}")
+                for file_name in os.listdir(self.cache_dir):
+                    if (file_name.startswith(f"{url_key}-") and ".part" in file_name
+                            and (validator is None or not file_name.startswith(f"{url_key}-{version_key}."))):
+                        os.remove(os.path.join(self.cache_dir, file_name))
+
+                start_time = time.perf_counter()
+                download_file_path = f"{part_prefix}.download"
+                sha256 = self.download(info, part_prefix, download_file_path)
+                if expected_sha256 is not None and sha256 != expected_sha256:
+                    os.remove(download_file_path)
+                    raise Exception(f"sha256 of [{url}] is {sha256}, expected {expected_sha256}")
+
+                extension = os.path.splitext(urllib.parse.urlparse(url).path)[1]
+                file_path = os.path.join(self.files_dir, f"{sha256}{extension}")
+                if os.path.exists(file_path):
+                    # Same content as a cached file, e.g. of another url, kept as it is for its entry
+                    os.remove(download_file_path)
+                else:
+                    os.replace(download_file_path, file_path)
+                stat = os.stat(file_path)
+                index[url] = {"validator": validator, "sha256": sha256, "file_path": file_path,
+                              "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+                self.write_index(index)
+                logging.info(f"Downloaded [{url}] into: [{file_path}] in {time.perf_counter() - start_time:.1f}s, "
+                             f"sha256 {sha256}")
+                return file_path
+        except Exception as e:
+            raise CustomException(e, sys) from e
@@ -0,0 +1,323 @@
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from credit_score.utils.utils import get_schema_columns
+from credit_score.constant import *
+from datetime import datetime
+import pandas as pd
+import numpy as np
+import os, sys
+import json
+import threading
+
+
+def get_ks_p_value(statistic: float, n_reference: int, n_current: int) -> float:
+    """
+    Asymptotic p-value of the two sample Kolmogorov-Smirnov statistic
+    """
+    if n_reference == 0 or n_current == 0:
+        return 1.0
+    effective_n = np.sqrt(n_reference * n_current / (n_reference + n_current))
+    lam = (effective_n + 0.12 + 0.11 / effective_n) * statistic
+    if lam < 1e-3:
+        return 1.0
+    j = np.arange(1, 101)
+    p_value = 2 * np.sum((-1.0) ** (j - 1) * np.exp(-2 * j ** 2 * lam ** 2))
+    return float(min(max(p_value, 0.0), 1.0))
+
+
+def get_psi(reference_counts: np.ndarray, current_counts: np.ndarray, epsilon: float = 1e-4) -> float:
+    """
+    Population stability index between two count vectors over the same bins
+    """
+    reference_share = np.maximum(reference_counts / max(reference_counts.sum(), 1), epsilon)
+    current_share = np.maximum(current_counts / max(current_counts.sum(), 1), epsilon)
+    return float(np.sum((current_share - reference_share) * np.log(current_share / reference_share)))
+
+
+class NumericalSketch:
+    """
+    Counts of a numerical column over fixed bins. Sketches with the same bin edges are merged
+    by adding their counts, so a large dataset can be sketched chunk by chunk or in parallel.
+    """
+
+    def __init__(self, bin_edges: np.ndarray):
+        self.bin_edges = np.asarray(bin_edges, dtype=np.float64)
+        # one bin below the first edge and one above the last one
+        self.counts = np.zeros(len(self.bin_edges) + 1, dtype=np.int64)
+        self.n_missing = 0
+        self.min_value = np.inf
+        self.max_value = -np.inf
+
+    @classmethod
+    def from_values(cls, values, n_bins: int) -> "NumericalSketch":
+        """
+        Returns an empty sketch with quantile bin edges of the values
+        """
+        values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return cls(np.array([]))
+        return cls(np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1])))
+
+    def update(self, values) -> None:
+        values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64)
+        missing = np.isnan(values)
+        values = values[~missing]
+        self.n_missing += int(missing.sum())
+        if len(values) > 0:
+            self.counts += np.bincount(np.searchsorted(self.bin_edges, values, side="right"),
+                                       minlength=len(self.counts))
+            self.min_value = min(self.min_value, float(values.min()))
+            self.max_value = max(self.max_value, float(values.max()))
+
+    def merge(self, other: "NumericalSketch") -> None:
+        if not np.array_equal(self.bin_edges, other.bin_edges):
+            raise Exception("Numerical sketches with different bin edges can't be merged")
+        self.counts += other.counts
+        self.n_missing += other.n_missing
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+
+    def empty_copy(self) -> "NumericalSketch":
+        return NumericalSketch(self.bin_edges)
+
+    def get_histogram(self) -> list:
+        """
+        Returns [bin shares, bin edges], the outer edges being the min and max value seen
+        """
+        n_values = max(int(self.counts.sum()), 1)
+        if not np.isfinite(self.min_value):
+            return [(self.counts / n_values).tolist(), self.bin_edges.tolist()]
+        edges = [min(self.min_value, *self.bin_edges[:1]), *self.bin_edges.tolist(),
+                 max(self.max_value, *self.bin_edges[-1:])]
+        return [(self.counts / n_values).tolist(), edges]
+
+    def compare(self, current: "NumericalSketch") -> dict:
+        """
+        Returns the KS statistic, computed on the bin edges, its p-value and the PSI of the current
+        sketch against this one
+        """
+        n_reference, n_current = int(self.counts.sum()), int(current.counts.sum())
+        reference_cdf = np.cumsum(self.counts) / max(n_reference, 1)
+        current_cdf = np.cumsum(current.counts) / max(n_current, 1)
+        statistic = float(np.max(np.abs(reference_cdf - current_cdf)))
+        return {"ks_statistic": statistic,
+                "p_value": get_ks_p_value(statistic, n_reference, n_current),
+                "psi": get_psi(self.counts, current.counts)}
+
+
+class CategoricalSketch:
+    """
+    Counts of every category of a categorical column, merged by adding the counts
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.n_missing = 0
+
+    def update(self, values) -> None:
+        values = pd.Series(values)
+        self.n_missing += int(values.isna().sum())
+        for category, count in values.value_counts(dropna=True).items():
+            self.counts[category] = self.counts.get(category, 0) + int(count)
+
+    def merge(self, other: "CategoricalSketch") -> None:
+        for category, count in other.counts.items():
+            self.counts[category] = self.counts.get(category, 0) + count
+        self.n_missing += other.n_missing
+
+    def empty_copy(self) -> "CategoricalSketch":
+        return CategoricalSketch()
+
+    def get_histogram(self, categories: list = None) -> list:
+        """
+        Returns [category shares, categories]
+        """
+        categories = categories if categories is not None else sorted(self.counts, key=str)
+        n_values = max(sum(self.counts.values()), 1)
+        return [[self.counts.get(category, 0) / n_values for category in categories],
+                [str(category) for category in categories]]
+
+    def compare(self, current: "CategoricalSketch") -> dict:
+        categories = sorted(set(self.counts) | set(current.counts), key=str)
+        reference_counts = np.array([self.counts.get(category, 0) for category in categories], dtype=np.float64)
+        current_counts = np.array([current.counts.get(category, 0) for category in categories], dtype=np.float64)
+        return {"psi": get_psi(reference_counts, current_counts),
+                "new_categories": [str(category) for category in categories if category not in self.counts]}
+
+
+class DriftMonitor:
+    """
+    Streaming data drift monitor.
+
+    The reference data (the train set) is sketched once: histogram counts over quantile bins
+    for the numerical columns and category counts for the categorical ones. The bin edges come
+    from the first reference batch, so that every later batch is only counted into them.
+    Current data (the test set or scoring traffic) is sketched batch by batch with `update`,
+    and the drift statistics are computed from the sketches alone:
+        numerical columns: KS p-value, drift if below `p_value_threshold`
+        categorical columns: PSI, drift if above `psi_threshold`
+    The dataset drifts when the share of drifted columns reaches `drift_share`.
+
+    `get_report` returns the same json layout as the evidently data drift profile.
+    """
+
+    def __init__(self, numerical_columns: list, categorical_columns: list, n_bins: int = 20,
+                 p_value_threshold: float = 0.05, psi_threshold: float = 0.2, drift_share: float = 0.5):
+        try:
+            self.numerical_columns = list(numerical_columns)
+            self.categorical_columns = list(categorical_columns)
+            self.n_bins = n_bins
+            self.p_value_threshold = p_value_threshold
+            self.psi_threshold = psi_threshold
+            self.drift_share = drift_share
+            self.reference = None
+            self.current = None
+            self.lock = threading.Lock()
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    @classmethod
+    def from_schema(cls, dataset_schema: dict, **kwargs) -> "DriftMonitor":
+        try:
+            numerical_columns = get_schema_columns(dataset_schema, NUMERICAL_COLUMN_KEY)
+            categorical_columns = get_schema_columns(dataset_schema, ORDINAL_COLUMN_KEY) + \
+                                  get_schema_columns(dataset_schema, ONE_HOT_COLUMN_KEY)
+            return cls(numerical_columns, categorical_columns, **kwargs)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get_columns(self, dataframe: pd.DataFrame) -> tuple:
+        return ([column for column in self.numerical_columns if column in dataframe.columns],
+                [column for column in self.categorical_columns if column in dataframe.columns])
+
+    def update_reference(self, dataframe: pd.DataFrame) -> None:
+        """
+        Adds a batch of reference data, the first batch fixes the bins of the numerical columns
+        """
+        try:
+            with self.lock:
+                if self.reference is None:
+                    numerical_columns, categorical_columns = self.get_columns(dataframe)
+                    self.reference = {column: NumericalSketch.from_values(dataframe[column], self.n_bins)
+                                      for column in numerical_columns}
+                    self.reference.update({column: CategoricalSketch() for column in categorical_columns})
+                for column, sketch in self.reference.items():
+                    sketch.update(dataframe[column])
+                self.current = None
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def update(self, dataframe: pd.DataFrame) -> None:
+        """
+        Adds a batch of current data
+        """
+        try:
+            if self.reference is None:
+                raise Exception("Reference data has to be added before the current data")
+            with self.lock:
+                if self.current is None:
+                    self.current = {column: sketch.empty_copy() for column, sketch in self.reference.items()}
+                for column, sketch in self.current.items():
+                    if column in dataframe.columns:
+                        sketch.update(dataframe[column])
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def merge(self, other: "DriftMonitor") -> None:
+        """
+        Adds the current data sketched by another monitor built from the same reference
+        """
+        try:
+            if other.current is None:
+                return
+            with self.lock:
+                if self.current is None:
+                    self.current = {column: sketch.empty_copy() for column, sketch in self.reference.items()}
+                for column, sketch in self.current.items():
+                    sketch.merge(other.current[column])
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def reset(self) -> None:
+        """
+        Forgets the current data, the reference is kept
+        """
+        with self.lock:
+            self.current = None
+
+    def get_report(self) -> dict:
+        try:
+            if self.reference is None:
+                raise Exception("Reference data has to be added before a drift report can be made")
+            with self.lock:
+                current = self.current or {column: sketch.empty_copy() for column, sketch in self.reference.items()}
+                metrics = {}
+                for column, reference_sketch in self.reference.items():
+                    current_sketch = current[column]
+                    statistics = reference_sketch.compare(current_sketch)
+                    if isinstance(reference_sketch, NumericalSketch):
+                        feature_metrics = {"feature_type": "num", "stattest_name": "K-S p_value",
+                                           "drift_score": statistics["p_value"],
+                                           "drift_detected": statistics["p_value"] < self.p_value_threshold,
+                                           "ref_small_hist": reference_sketch.get_histogram(),
+                                           "current_small_hist": current_sketch.get_histogram()}
+                    else:
+                        categories = sorted(set(reference_sketch.counts) | set(current_sketch.counts), key=str)
+                        feature_metrics = {"feature_type": "cat", "stattest_name": "PSI",
+                                           "drift_score": statistics["psi"],
+                                           "drift_detected": statistics["psi"] > self.psi_threshold,
+                                           "ref_small_hist": reference_sketch.get_histogram(categories),
+                                           "current_small_hist": current_sketch.get_histogram(categories)}
+                    feature_metrics.update(statistics)
+                    feature_metrics["drift_detected"] = bool(feature_metrics["drift_detected"])
+                    metrics[column] = feature_metrics
+
+            n_features = len(metrics)
+            n_drifted_features = sum(feature["drift_detected"] for feature in metrics.values())
+            share_drifted_features = n_drifted_features / n_features if n_features > 0 else 0.0
+            metrics.update({"n_features": n_features,
+                            "n_drifted_features": n_drifted_features,
+                            "share_drifted_features": share_drifted_features,
+                            "dataset_drift": n_features > 0 and share_drifted_features >= self.drift_share})
+            time_stamp = str(datetime.now())
+            return {
+                "data_drift": {
+                    "name": "data_drift",
+                    "datetime": time_stamp,
+                    "data": {
+                        "utility_columns": {"date": None, "id": None, "target": None, "prediction": None,
+                                            "drift_conf_level": 1 - self.p_value_threshold,
+                                            "drift_features_share": self.drift_share,
+                                            "nbinsx": self.n_bins, "xbins": None},
+                        "cat_feature_names": [column for column in self.categorical_columns if column in metrics],
+                        "num_feature_names": [column for column in self.numerical_columns if column in metrics],
+                        "metrics": metrics
+                    }
+                },
+                "timestamp": time_stamp
+            }
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def save_report(self, report_file_path: str) -> dict:
+        try:
+            report = self.get_report()
+            os.makedirs(os.path.dirname(report_file_path), exist_ok=True)
+            with open(report_file_path, "w") as report_file:
+                json.dump(report, report_file, indent=6)
+            metrics = report["data_drift"]["data"]["metrics"]
+            logging.info(f"Drift report saved to [{report_file_path}]: {metrics['n_drifted_features']} of "
+                         f"{metrics['n_features']} features drifted, dataset drift: {metrics['dataset_drift']}")
+            return report
+        except Exception as e:
+            raise CustomException(e, sys) from e
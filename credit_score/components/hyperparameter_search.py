@@ -0,0 +1,200 @@
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from credit_score.instrumentation import measure
+from credit_score.instrumentation import metrics
+from sklearn.base import clone
+from sklearn.model_selection import ParameterGrid
+from sklearn.model_selection import StratifiedKFold
+from sklearn.metrics import f1_score
+from joblib import Parallel, delayed
+from xgboost.callback import TrainingCallback
+import optuna
+import numpy as np
+import os, sys
+import math
+import time
+
+
+def _fit_and_score(estimator, params: dict, x, y, train_idx, test_idx, sample_weight=None) -> tuple:
+    """
+    Fits a clone of the estimator with the given params on one fold and returns
+    the weighted f1 score on the held out part of the fold, with the metrics record
+    of the trial (measured in the worker process, collected by the caller).
+    """
+    with measure("search_trial", rows=len(train_idx), collect=False,
+                 model=type(estimator).__name__) as record:
+        model = clone(estimator).set_params(**params)
+        if sample_weight is None:
+            model.fit(x[train_idx], y[train_idx])
+        else:
+            model.fit(x[train_idx], y[train_idx], sample_weight=sample_weight[train_idx])
+        score = f1_score(y[test_idx], model.predict(x[test_idx]), average="weighted")
+    return score, record
+
+
+class HyperparameterSearch:
+    """
+    Hyperparameter search engine with two modes:
+
+    grid    : every candidate of the grid is evaluated on all the folds with the full resource
+    halving : successive halving, all candidates start with a small resource budget and only the
+              best 1/factor of them are promoted to the next rung with factor times more resource
+
+    The resource is either the number of training samples (`n_samples`) or the number of trees
+    (`n_estimators`). Fold indices are computed once and reused by every rung, and the
+    (candidate, fold) fits run in a process pool. Once `time_budget` seconds are spent no new
+    batch of trials is started and the best candidate of the highest finished rung is returned.
+    """
+
+    def __init__(self, estimator, param_grid: dict, mode: str = "halving", resource: str = "n_samples",
+                 cv: int = 5, factor: int = 3, time_budget: float = None, n_jobs: int = -1,
+                 random_state: int = 786):
+        try:
+            self.estimator = estimator
+            self.param_grid = dict(param_grid)
+            self.mode = mode
+            self.resource = resource
+            self.cv = cv
+            self.factor = factor
+            self.time_budget = time_budget
+            self.n_jobs = n_jobs
+            self.random_state = random_state
+            self._folds = None
+            if self.mode not in ("grid", "halving"):
+                raise ValueError(f"Search mode: [{self.mode}] is not supported, use grid or halving")
+            if self.resource not in ("n_samples", "n_estimators"):
+                raise ValueError(f"Search resource: [{self.resource}] is not supported, "
+                                 f"use n_samples or n_estimators")
+
+            # The number of trees can't be both searched and used as the budget
+            if self.resource == "n_estimators":
+                self.max_n_estimators = max(self.param_grid.pop("n_estimators",
+                                                                [self.estimator.get_params()["n_estimators"]]))
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_folds(self, y) -> list:
+        """
+        Returns the cached stratified fold indices, computing them on the first call
+        """
+        try:
+            if self._folds is None:
+                skf = StratifiedKFold(n_splits=self.cv, shuffle=True, random_state=self.random_state)
+                self._folds = list(skf.split(np.zeros(len(y)), y))
+            return self._folds
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_rung_resources(self, n_candidates: int, n_samples: int, n_classes: int) -> list:
+        """
+        Returns the resource to be used at every rung
+        """
+        try:
+            if self.resource == "n_samples":
+                min_resource, max_resource = 2 * self.cv * n_classes, n_samples
+            else:
+                min_resource, max_resource = min(10, self.max_n_estimators), self.max_n_estimators
+
+            if self.mode == "grid":
+                return [max_resource]
+
+            n_rungs = min(int(math.log(max_resource / min_resource, self.factor)) + 1,
+                          int(math.ceil(math.log(max(n_candidates, 1), self.factor))) + 1)
+            return [int(max_resource / self.factor ** (n_rungs - 1 - rung)) for rung in range(n_rungs)]
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def fit(self, x, y, sample_weight=None):
+        try:
+            y = np.asarray(y)
+            start_time = time.perf_counter()
+            candidates = list(ParameterGrid(self.param_grid))
+            folds = self.get_folds(y)
+
+            resources = self.get_rung_resources(len(candidates), len(y), len(np.unique(y)))
+            n_jobs = os.cpu_count() if self.n_jobs in (None, -1) else self.n_jobs
+            # Sample order used to pick the subsample of a rung when the resource is n_samples
+            sample_rank = np.random.RandomState(self.random_state).permutation(len(y))
+
+            self.cv_results_ = []
+            self.n_trials_ = 0
+            best_params, best_score = None, -np.inf
+            timed_out = False
+
+            with Parallel(n_jobs=n_jobs) as parallel:
+                for rung, resource in enumerate(resources):
+                    logging.info(f"Search rung: [{rung}] with {len(candidates)} candidates and {self.resource}={resource}")
+
+                    if self.resource == "n_samples":
+                        in_rung = sample_rank < resource
+                        rung_folds = [(train_idx[in_rung[train_idx]], test_idx[in_rung[test_idx]])
+                                      for train_idx, test_idx in folds]
+                        rung_candidates = candidates
+                    else:
+                        rung_folds = folds
+                        rung_candidates = [{**params, "n_estimators": resource} for params in candidates]
+
+                    # Dispatching a few candidates per worker at a time to be able to honour the time budget
+                    batch_size = max(1, 2 * n_jobs // len(rung_folds))
+                    rung_scores = []
+                    for batch_start in range(0, len(rung_candidates), batch_size):
+                        if self.time_budget is not None and time.perf_counter() - start_time > self.time_budget:
+                            timed_out = True
+                            break
+                        batch = rung_candidates[batch_start:batch_start + batch_size]
+                        fold_results = parallel(
+                            delayed(_fit_and_score)(self.estimator, params, x, y, train_idx, test_idx, sample_weight)
+                            for params in batch for train_idx, test_idx in rung_folds)
+                        fold_scores = [score for score, _ in fold_results]
+                        metrics.extend([record for _, record in fold_results])
+                        for i, params in enumerate(batch):
+                            score = float(np.mean(fold_scores[i * len(rung_folds):(i + 1) * len(rung_folds)]))
+                            rung_scores.append(score)
+                            self.cv_results_.append({"rung": rung, "resource": resource,
+                                                     "params": params, "mean_test_score": score})
+                        self.n_trials_ += len(batch)
+
+                    if len(rung_scores) > 0:
+                        rung_best = int(np.argmax(rung_scores))
+                        best_params, best_score = candidates[rung_best], rung_scores[rung_best]
+                        if self.resource == "n_estimators":
+                            best_params = {**best_params, "n_estimators": resource}
+
+                    if timed_out:
+                        logging.info(f"Search time budget of {self.time_budget}s exhausted at rung: [{rung}]")
+                        break
+
+                    # Promoting the top 1/factor candidates to the next rung
+                    n_promoted = int(math.ceil(len(candidates) / self.factor))
+                    order = np.argsort(rung_scores)[::-1][:n_promoted]
+                    candidates = [candidates[i] for i in order]
+
+            elapsed = time.perf_counter() - start_time
+            self.best_params_ = best_params
+            self.best_score_ = best_score
+            self.trials_per_second_ = self.n_trials_ / elapsed
+            logging.info(f"Search finished: {self.n_trials_} trials in {elapsed:.1f}s "
+                         f"({self.trials_per_second_:.2f} trials/s), best score: {best_score}")
+            return self
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+class XGBoostPruningCallback(TrainingCallback):
+    """
+    Reports the validation accuracy of every boosting round to the optuna trial
+    and stops the training as soon as the trial's pruner asks for it.
+    """
+
+    def __init__(self, trial, eval_name: str = "validation_0", metric: str = "merror"):
+        self.trial = trial
+        self.eval_name = eval_name
+        self.metric = metric
+
+    def after_iteration(self, model, epoch: int, evals_log: dict) -> bool:
+        # Reporting accuracy instead of error so that it has the same direction as the study
+        accuracy = 1 - evals_log[self.eval_name][self.metric][-1]
+        self.trial.report(accuracy, step=epoch)
+        if self.trial.should_prune():
+            raise optuna.TrialPruned(f"Trial pruned at boosting round: {epoch}")
+        return False
@@ -1,38 +1,137 @@
 from credit_score.logger import logging
+from credit_score.logger import setup_logging
+from credit_score.logger import set_log_context
+from credit_score.logger import get_log_stage
+from credit_score.logger import get_logging_options
 from credit_score.exception import CustomException
 from credit_score.entity.config_entity import *
 from credit_score.entity.artifact_entity import *
 from credit_score.constant import *
 from credit_score.utils.utils import save_object
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import GridSearchCV
-from sklearn.metrics import f1_score
-from xgboost import XGBClassifier
+from credit_score.utils.utils import load_numpy_array_data
+from credit_score.utils.utils import get_file_hash
+from credit_score.utils.utils import load_object
+from credit_score.instrumentation import measure
+from credit_score.instrumentation import metrics
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import pandas as pd
 import numpy as np
+import hashlib
 import os, sys
-import optuna 
+import time
+
+# sklearn, xgboost, optuna and the search engine are imported in the methods using them,
+# so that importing this module stays cheap
+
+
+XGBOOST_N_ESTIMATORS = 130
+
+# Registry of candidate models, name used in model_candidates of config.yaml -> training function.
+# Every function takes the trainer and the train/test arrays and returns the fitted model.
+MODEL_CANDIDATES = {
+    "xgboost": lambda trainer, x_train, y_train, x_test, y_test: trainer.XGBoost_Classifier(x_train, y_train, x_test, y_test),
+    "random_forest": lambda trainer, x_train, y_train, x_test, y_test: trainer.Random_Forest_Classifier(x_train, y_train),
+}
+
+
+def init_candidate_worker(logging_options: dict, stage: str, metrics_options: dict) -> None:
+    """
+    Initializer of the spawned worker processes: logs to the log file of the parent, written
+    directly without the writer thread (only the parent rotates it), and measures calls as
+    part of the parent's run
+    """
+    setup_logging(**logging_options, use_queue=False)
+    set_log_context(run_id=metrics_options["run_id"], stage=stage)
+    metrics.configure(**metrics_options)
+
+
+def train_candidate(model_trainer_config: ModelTrainerConfig,
+                    data_transformation_artifact: DataTransformationArtifact,
+                    model_name: str, cpu_quota: int) -> dict:
+    """
+    Runs the search, final fit and scoring of one candidate model. Executed in its own
+    worker process, which memory-maps the transformed arrays and uses at most `cpu_quota` cores.
+    """
+    try:
+        # A worker process can train several candidates, only the records added from here on are this one's
+        n_parent_records = len(metrics.records)
+        model_trainer = ModelTrainer(model_trainer_config=model_trainer_config,
+                                     data_transformation_artifact=data_transformation_artifact,
+                                     cpu_quota=cpu_quota)
+        x_train, y_train, x_test, y_test = model_trainer.load_transformed_data()
+
+        logging.info(f"{'*'*20} Training {model_name} Model with {cpu_quota} cores {'*'*20}")
+        model = MODEL_CANDIDATES[model_name](model_trainer, x_train, y_train, x_test, y_test)
+        logging.info(f"{'*'*20} Trained {model_name} Model Successfully!! {'*'*20}")
+
+        scores = model_trainer.score_model(model, x_train, y_train, x_test, y_test)
+
+        model_file_path = os.path.join(os.path.dirname(model_trainer_config.trained_model_file_path),
+                                       "candidates", f"{model_name}.pkl")
+        save_object(file_path=model_file_path, obj=model)
+
+        return {"model_name": model_name,
+                "model_file_path": model_file_path,
+                "trials_per_second": model_trainer.trials_per_second,
+                "metrics": metrics.records[n_parent_records:],
+                **scores}
+    except Exception as e:
+        raise CustomException(e, sys) from e
+    finally:
+        # Stopping the joblib workers of the searches, otherwise this worker process can't exit
+        from joblib.externals.loky import get_reusable_executor
+        get_reusable_executor().shutdown(wait=True)
 
 
 class ModelTrainer:
 
     def __init__(self,
                  model_trainer_config: ModelTrainerConfig,
-                 data_transformation_artifact: DataTransformationArtifact):
+                 data_transformation_artifact: DataTransformationArtifact,
+                 cpu_quota: int = None):
         try:
             logging.info(f"\n{'*'*20} Model Training started {'*'*20}\n\n")
             self.model_trainer_config = model_trainer_config
             self.data_transformation_artifact = data_transformation_artifact
+            self.cpu_quota = os.cpu_count() if cpu_quota is None else cpu_quota
+            self.trials_per_second = {}
         except Exception as e:
             raise CustomException(e, sys) from e
+
+    def get_n_jobs(self, n_jobs: int) -> int:
+        """
+        Resolves an n_jobs setting (-1 or None meaning all cores) within the cpu quota of the trainer
+        """
+        if n_jobs in (None, -1):
+            return self.cpu_quota
+        return max(1, min(n_jobs, self.cpu_quota))
         
+    def get_sample_weight(self, y):
+        """
+        Returns the weight of every sample from the class weights of the transformation,
+        None when the classes were rebalanced by resampling instead
+        """
+        try:
+            class_weights = self.data_transformation_artifact.class_weights
+            if class_weights is None:
+                return None
+            return np.asarray(class_weights, dtype=np.float64)[np.asarray(y)]
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
     def get_random_forest_best_params(self,x_train,y_train)-> dict:
         try:
-            logging.info("Grid Search for Random forest best parameters started")
+            from sklearn.ensemble import RandomForestClassifier
+            from credit_score.components.hyperparameter_search import HyperparameterSearch
+
+            logging.info(f"[{self.model_trainer_config.search_mode}] Search for Random forest best parameters started")
+            # Parallelism is across the search trials, so each forest is fitted on a single core
             rf = RandomForestClassifier(
                 n_estimators= 100,
                 criterion= 'gini',
-                random_state= 786
+                random_state= 786,
+                n_jobs= 1
             ) 
             params ={
                 "n_estimators" : [50,100,150,200],
@@ -42,75 +141,140 @@ class ModelTrainer:
                 "max_features": ["sqrt", "log2", None],
 
             }
-            grid_rf = GridSearchCV(
+            search_rf = HyperparameterSearch(
                 estimator= rf,
                 param_grid= params,
-                cv= 10,
-                scoring="f1_score"
+                mode= self.model_trainer_config.search_mode,
+                resource= self.model_trainer_config.search_resource,
+                cv= self.model_trainer_config.search_cv,
+                factor= self.model_trainer_config.search_factor,
+                time_budget= self.model_trainer_config.search_time_budget,
+                n_jobs= self.get_n_jobs(self.model_trainer_config.search_n_jobs)
             )
-            grid_rf.fit(x_train,y_train)
-            logging.info("Grid Search for Random forest best parameters completed")
-            return grid_rf.best_params_
+            search_rf.fit(x_train,y_train,sample_weight=self.get_sample_weight(y_train))
+            self.trials_per_second["random_forest"] = search_rf.trials_per_second_
+            logging.info("Search for Random forest best parameters completed")
+            return search_rf.best_params_
         except Exception as e:
             raise   CustomException(e, sys) from e
     
+    def get_optuna_study_name(self) -> str:
+        """
+        Returns the configured study name suffixed with a hash of the transformed data and
+        of the pruner, so that only a re-run on the same data continues a study of the journal
+        """
+        try:
+            sha256 = hashlib.sha256(self.model_trainer_config.optuna_pruner.encode())
+            for file_path in (self.data_transformation_artifact.transformed_train_file_path,
+                              self.data_transformation_artifact.transformed_train_target_file_path,
+                              self.data_transformation_artifact.transformed_test_file_path,
+                              self.data_transformation_artifact.transformed_test_target_file_path):
+                sha256.update(get_file_hash(file_path).encode())
+            return f"{self.model_trainer_config.optuna_study_name}_{sha256.hexdigest()[:16]}"
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
     def get_xgboost_best_params(self,x_train,x_test,y_train,y_test)-> dict:
         try:
+            import optuna
+            from optuna.storages.journal import JournalFileBackend
+            from xgboost import XGBClassifier
+            from sklearn.metrics import f1_score
+            from credit_score.components.hyperparameter_search import XGBoostPruningCallback
+
             logging.info("Optuna Search for XG Boost best parameters started")
+            n_jobs = self.get_n_jobs(self.model_trainer_config.optuna_n_jobs)
+            sample_weight = self.get_sample_weight(y_train)
+            # Splitting the cores between the trials running in parallel
+            xgb_n_jobs = max(1, self.cpu_quota // n_jobs)
+
             def objective(trial, data=x_train, target=y_train):
                 param = {
                 #'tree_method' : 'gpu_hist',
-                'lambda' : trial.suggest_loguniform('lambda', 1e-4, 10.0),
-                'alpha' :  trial.suggest_loguniform('alpha', 1e-4, 10.0),
+                'lambda' : trial.suggest_float('lambda', 1e-4, 10.0, log=True),
+                'alpha' :  trial.suggest_float('alpha', 1e-4, 10.0, log=True),
                 'colsample_bytree' : trial.suggest_categorical('colsample_bytree', [.1,.2,.3,.4,.5,.6,.7,.8,.9,1]),
                 'subsample' : trial.suggest_categorical('subsample', [.1,.2,.3,.4,.5,.6,.7,.8,.9,1]),
                 'learning_rate' : trial.suggest_categorical('learning_rate',[.00001,.0003,.008,.02,.01,0.10,0.15,0.2,1,10,20]),
-                'n_estimator' : 130,
+                'n_estimators' : XGBOOST_N_ESTIMATORS,
                 'max_depth' : trial.suggest_categorical('max_depth', [3,4,5,6,7,8,9,10,11,12]),
                 'random_state' : 786,
                 'min_child_weight' : trial.suggest_int('min_child_weight',1,200),
                 'booster' : trial.suggest_categorical('booster',["gblinear","gbtree","dart"]),
                 "reg_lambda" : trial.suggest_categorical("reg_lambda",[0.01, 0.05, 0.10]),
                 "reg_alpha" : trial.suggest_categorical("reg_alpha",[0.01, 0.05, 0.10]),
-                'verbosity' : 2
+                'n_jobs' : xgb_n_jobs,
+                'eval_metric' : 'merror',
+                'callbacks' : [XGBoostPruningCallback(trial)],
+                'verbosity' : 0
                 }
                 if param["booster"] in ['gbtree', 'dart']:
-                    param['gamma'] : trial.suggest_float('gamma', 1e-3, 4)
-                    param['eta'] : trial.suggest_float('eta', .001, 5)
-
-                xgb_class_model = XGBClassifier(
-                    objective="class:f1_score",
-                    **param
-                )
-                xgb_class_model.fit(data,target, eval_set = [(x_test,y_test)], verbose = True)
-                pred_xgb = xgb_class_model.predict(x_test)
-                f1_Score = f1_score(x_test, pred_xgb)
+                    param['gamma'] = trial.suggest_float('gamma', 1e-3, 4)
+
+                with measure("search_trial", rows=len(target), model="XGBClassifier", trial=trial.number):
+                    xgb_class_model = XGBClassifier(
+                        objective="multi:softprob",
+                        **param
+                    )
+                    xgb_class_model.fit(data,target, sample_weight = sample_weight, eval_set = [(x_test,y_test)], verbose = False)
+                    pred_xgb = xgb_class_model.predict(x_test)
+                    f1_Score = f1_score(y_test, pred_xgb, average="weighted")
                 return f1_Score
-            
-            find_param = optuna.create_study(direction='minimize')
-            find_param.optimize(objective, n_trials = 10)
-            find_param.best_trial.params
+
+            if self.model_trainer_config.optuna_pruner == "hyperband":
+                pruner = optuna.pruners.HyperbandPruner(min_resource=1, max_resource=XGBOOST_N_ESTIMATORS)
+            else:
+                pruner = optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=10)
+
+            # Journal storage on a fixed path outside of the timestamped artifact dirs, so that
+            # a re-run on the same data continues its study instead of starting cold. Trials
+            # scored on other data are in other studies, the pruner and best_trial never see them
+            storage_file_path = self.model_trainer_config.optuna_storage_file_path
+            os.makedirs(os.path.dirname(storage_file_path), exist_ok=True)
+            storage = optuna.storages.JournalStorage(JournalFileBackend(storage_file_path))
+            study_name = self.get_optuna_study_name()
+
+            find_param = optuna.create_study(study_name=study_name,
+                                             storage=storage,
+                                             direction='maximize',
+                                             pruner=pruner,
+                                             load_if_exists=True)
+            n_previous_trials = len(find_param.trials)
+            logging.info(f"Optuna study: [{study_name}] loaded with {n_previous_trials} previous trials")
+
+            start_time = time.perf_counter()
+            find_param.optimize(objective,
+                                n_trials = self.model_trainer_config.optuna_n_trials,
+                                timeout = self.model_trainer_config.optuna_timeout,
+                                n_jobs = n_jobs)
+            elapsed = time.perf_counter() - start_time
+
+            trials = find_param.trials[n_previous_trials:]
+            n_pruned = len([trial for trial in trials if trial.state == optuna.trial.TrialState.PRUNED])
+            self.trials_per_second["xgboost"] = len(trials) / elapsed
+            logging.info(f"Optuna ran {len(trials)} trials ({n_pruned} pruned) in {elapsed:.1f}s "
+                         f"({self.trials_per_second['xgboost']:.2f} trials/s)")
             logging.info("Optuna Search for XG Boost best parameters completed")
             params = find_param.best_trial.params
             return params
-        except ValueError:
-            return self.get_xgboost_best_params(x_train,y_train,x_test,y_test)
         except Exception as e:
             raise CustomException(e, sys) from e
         
     def Random_Forest_Classifier(self,x_train,y_train):
         try:
-            logging.info("Getting Best Parameters for Random Forest by Grid Search CV")
+            from sklearn.ensemble import RandomForestClassifier
+
+            logging.info("Getting Best Parameters for Random Forest by Hyperparameter Search")
             rf_best_params = self.get_random_forest_best_params(x_train,y_train)
 
             logging.info(f"RF Best Parameters : {rf_best_params}")
             logging.info("Fitting random forest model")
             rf = RandomForestClassifier(
                 **rf_best_params,
-                criterion="f1_score",
-                random_state=786
+                random_state=786,
+                n_jobs=self.cpu_quota
             )
-            rf.fit(x_train,y_train)
+            rf.fit(x_train,y_train,sample_weight=self.get_sample_weight(y_train))
 
             return rf
         except Exception as e:
@@ -118,86 +282,145 @@ class ModelTrainer:
         
     def XGBoost_Classifier(self,x_train,y_train,x_test,y_test):
         try:
-            logging.info("Getting Best Parameters for Random Forest by Grid Search CV")
-            xgb_best_params = self.get_xgboost_best_params(x_train,y_train,x_test,y_test)
+            from xgboost import XGBClassifier
+
+            logging.info("Getting Best Parameters for XG Boost by Optuna Search")
+            xgb_best_params = self.get_xgboost_best_params(x_train=x_train,x_test=x_test,y_train=y_train,y_test=y_test)
 
             logging.info(f"XGB Best Parameters : {xgb_best_params}")
             logging.info("Fitting XG Boost model")
             xgb = XGBClassifier(
-                objective="class:f1_score",
-                n_estimator=130, 
+                objective="multi:softprob",
+                n_estimators=XGBOOST_N_ESTIMATORS, 
                 random_state = 786,
+                n_jobs = self.cpu_quota,
                 **xgb_best_params
             )
-            xgb.fit(x_train,y_train)
+            xgb.fit(x_train,y_train,sample_weight=self.get_sample_weight(y_train))
 
             return xgb
         except Exception as e:
             raise CustomException(e,sys) from e
         
-    def get_best_model(self,x_train,y_train,x_test,y_test):
+    def load_transformed_data(self):
+        """
+        Memory-maps the transformed train/test features and targets, so that every
+        process working on them shares the same pages.
+        """
         try:
-            logging.info(f"{'*'*20} Training XGBoost Model {'*'*20}")
-            xgb_obj = self.XGBoost_Classifier(x_train,y_train,x_test,y_test)
-            logging.info(f"{'*'*20} Trained XGBoost Model Successfully!! {'*'*20}")
-
-            logging.info(f"{'*'*20} Training Random Forest Model {'*'*20}")
-            rf_obj = self.Random_Forest_Classifier(x_train,y_train)
-            logging.info(f"{'*'*20} Trained Random Forest Model Successfully!! {'*'*20}")
-
-            logging.info("***Objects for model obtained!!! Now calcalating R2 score for model evaluation***")
-            rf_f1_train = f1_score(y_train,rf_obj.predict(x_train))
-            xgb_f1_train = f1_score(y_train,xgb_obj.predict(x_train))
-            logging.info(f"f1 score for Training set ---> Random Forest: {rf_f1_train} || XG Boost: {xgb_f1_train}")
-            
-            rf_f1_test = f1_score(y_test, rf_obj.predict(x_test))
-            xgb_f1_test = f1_score(y_test, xgb_obj.predict(x_test))
-            logging.info(f"f1 score for Testing set ---> Random Forest : {rf_f1_test} || XGBoost : {xgb_f1_test}")
+            logging.info("Finding transformed Training and Test")
+            transformed_train_file_path = self.data_transformation_artifact.transformed_train_file_path
+            transformed_test_file_path = self.data_transformation_artifact.transformed_test_file_path
 
-            if xgb_f1_test > rf_f1_test:
-                logging.info("XGBoost Model Accepted!!!")
-                return xgb_obj
-            else:
-                logging.info("Random Forest Model Accepted!!!")
-                return rf_obj
+            transformed_train_target_file_path = self.data_transformation_artifact.transformed_train_target_file_path
+            transformed_test_target_file_path = self.data_transformation_artifact.transformed_test_target_file_path
 
+            logging.info("Transformed Data found!!! Now, memory-mapping input features and target feature arrays")
+            train_input_feature = load_numpy_array_data(transformed_train_file_path, mmap_mode="r")
+            train_target_feature = load_numpy_array_data(transformed_train_target_file_path, mmap_mode="r")
+
+            test_input_feature = load_numpy_array_data(transformed_test_file_path, mmap_mode="r")
+            test_target_feature = load_numpy_array_data(transformed_test_target_file_path, mmap_mode="r")
+
+            return train_input_feature, train_target_feature, test_input_feature, test_target_feature
         except Exception as e:
             raise CustomException(e,sys) from e
 
-
-    def initiate_model_training(self) -> ModelTrainerArtifact:
+    def score_model(self, model, x_train, y_train, x_test, y_test) -> dict:
+        """
+        Returns the weighted f1 score of the model on the train and test sets
+        """
         try:
-            logging.info("Finding transformed Training and Test")
-            transformed_train_file_path = self.data_transformation_artifact.transformed_train_file_path
-            transformed_test_file_path = self.data_transformation_artifact.transformed_test_file_path
+            from sklearn.metrics import f1_score
+            return {"train_f1": f1_score(y_train, model.predict(x_train), average="weighted"),
+                    "test_f1": f1_score(y_test, model.predict(x_test), average="weighted")}
+        except Exception as e:
+            raise CustomException(e,sys) from e
+        
+    def get_best_model(self):
+        """
+        Trains every candidate of model_candidates concurrently, each one in its own process
+        with an equal share of the cores, and returns the one with the best test f1 score.
+        """
+        try:
+            model_candidates = self.model_trainer_config.model_candidates
+            n_workers = max(1, min(len(model_candidates), self.model_trainer_config.candidate_workers))
+            cpu_quota = max(1, self.cpu_quota // n_workers)
+            logging.info(f"Training candidates: {model_candidates} in {n_workers} processes with {cpu_quota} cores each")
+
+            # Spawned rather than forked: this runs in a worker thread of the pipeline while other
+            # threads (log writer, DB mirroring, thread pools) may hold locks a fork would copy
+            # locked, and fork isn't available on Windows. train_candidate is module level and
+            # its arguments are namedtuples, so everything sent to the workers is picklable
+            worker_options = (get_logging_options(), get_log_stage(),
+                              {"run_id": metrics.run_id, "profile": metrics.profile,
+                               "profile_stages": sorted(metrics.profile_stages), "profile_dir": metrics.profile_dir})
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=init_candidate_worker, initargs=worker_options) as executor:
+                futures = [executor.submit(train_candidate,
+                                           self.model_trainer_config,
+                                           self.data_transformation_artifact,
+                                           model_name,
+                                           cpu_quota) for model_name in model_candidates]
+                results = [future.result() for future in futures]
 
-            logging.info("Transformed Data found!!! Now, converting it into dataframe")
-            train_df = pd.read_csv(transformed_train_file_path)
-            test_df = pd.read_csv(transformed_test_file_path)
+            for result in results:
+                self.trials_per_second.update(result["trials_per_second"])
+                metrics.extend(result["metrics"])
+                logging.info(f"f1 score of {result['model_name']} ---> Training set: {result['train_f1']} || Testing set: {result['test_f1']}")
 
-            train_df = train_df.infer_objects()
-            test_df = test_df.infer_objects()
+            best_result = max(results, key=lambda result: result["test_f1"])
+            logging.info(f"{best_result['model_name']} Model Accepted!!!")
+            return load_object(best_result["model_file_path"])
 
-            logging.info("Splitting Input features and Target Feature for train and test data")
-            train_input_feature = train_df.drop(columns=['Credit_Score'], axis= 1)
-            train_target_feature = train_df.iloc[:,-1]
+        except Exception as e:
+            raise CustomException(e,sys) from e
 
-            test_input_feature = test_df.drop(columns=["Credit_score"], axis=1)
-            test_target_feature = test_df.iloc[:,-1]
 
+    def export_model(self, model_obj, n_check_rows: int = 10000) -> str:
+        """
+        Exports the model into memory-mappable node tables and checks that the export predicts
+        like the model on the test data. The pipeline publishes it to prediction_files with the
+        model, only once the whole run succeeded.
+        Returns the export dir, None when the model type can't be exported.
+        """
+        try:
+            from credit_score.components.tree_export import export_tree_model
+            from credit_score.components.tree_export import TreeEnsemble
+            from credit_score.components.tree_export import check_export_equivalence
+
+            try:
+                target_encoder = load_object(self.data_transformation_artifact.target_encoder_object_file_path)
+                exported_model_dir = export_tree_model(model_obj, self.model_trainer_config.exported_model_dir,
+                                                       class_labels=target_encoder.classes_.tolist())
+            except NotImplementedError as e:
+                logging.info(f"Model not exported: {e}")
+                return None
+
+            _, _, x_test, _ = self.load_transformed_data()
+            check_export_equivalence(model_obj, TreeEnsemble(exported_model_dir), np.asarray(x_test[:n_check_rows]))
+            return exported_model_dir
+        except Exception as e:
+            raise CustomException(e,sys) from e
+
+    def initiate_model_training(self) -> ModelTrainerArtifact:
+        try:
             logging.info("Best Model Finder function called")
-            model_obj = self.get_best_model(train_input_feature,train_target_feature,test_input_feature,test_target_feature)
+            model_obj = self.get_best_model()
 
             logging.info("Saving best model object file")
             trained_model_object_file_path = self.model_trainer_config.trained_model_file_path
             save_object(file_path=trained_model_object_file_path, obj=model_obj)
-            save_object(file_path=os.path.join(ROOT_DIR,PIKLE_FOLDER_NAME_KEY,
-                                 os.path.basename(trained_model_object_file_path)),obj=model_obj)
+
+            logging.info("Exporting best model to node tables")
+            exported_model_dir = self.export_model(model_obj)
 
 
             model_trainer_artifact = ModelTrainerArtifact(is_trained=True, 
                                                           message="Model Training Done!!",
-                                                          trained_model_object_file_path=trained_model_object_file_path)
+                                                          trained_model_object_file_path=trained_model_object_file_path,
+                                                          exported_model_dir=exported_model_dir,
+                                                          trials_per_second=self.trials_per_second)
             
             logging.info(f"Model Trainer Artifact: {model_trainer_artifact}")
             return model_trainer_artifact
@@ -0,0 +1,107 @@
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from credit_score.instrumentation import instrument
+from credit_score.instrumentation import set_rows
+import numpy as np
+import os, sys
+import time
+
+# imblearn and sklearn are imported in the methods using them, the class_weight and none
+# strategies don't need them
+
+# Strategy name used in rebalancing_strategy of config.yaml -> what it does to the train data
+REBALANCING_STRATEGIES = {
+    "smote_enn": "SMOTE over-sampling of every class, then chunked edited nearest neighbours cleaning",
+    "smote": "SMOTE over-sampling of every class",
+    "class_weight": "no resampling, balanced class weights are passed to the models",
+    "none": "no rebalancing",
+}
+
+
+def edited_nearest_neighbours(x: np.ndarray, y: np.ndarray, n_neighbors: int = 3, kind_sel: str = "all",
+                              n_jobs: int = 1, chunk_size: int = 10000) -> np.ndarray:
+    """
+    Returns the mask of the samples kept by edited nearest neighbours cleaning: a sample is removed
+    when all (kind_sel="all") or most (kind_sel="mode") of its n_neighbors nearest neighbours have
+    another class, as imblearn's EditedNearestNeighbours does.
+
+    Neighbours are queried `chunk_size` rows at a time against a tree index built once, in n_jobs
+    threads, so only one chunk of neighbour indices is held in memory.
+    """
+    try:
+        from sklearn.neighbors import NearestNeighbors
+
+        nearest_neighbors = NearestNeighbors(n_neighbors=n_neighbors + 1, n_jobs=n_jobs).fit(x)
+        keep = np.ones(len(y), dtype=bool)
+        for start in range(0, len(x), chunk_size):
+            # The first neighbour of a sample is the sample itself
+            neighbors = nearest_neighbors.kneighbors(x[start:start + chunk_size], return_distance=False)[:, 1:]
+            same_class = y[neighbors] == y[start:start + chunk_size, None]
+            if kind_sel == "all":
+                keep[start:start + chunk_size] = same_class.all(axis=1)
+            else:
+                keep[start:start + chunk_size] = same_class.sum(axis=1) > n_neighbors / 2
+        return keep
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+class Rebalancer:
+    """
+    Class rebalancing of the transformed train data with one of the REBALANCING_STRATEGIES.
+    Resampling works on float32 features, half the memory of the float64 preprocessor output.
+    """
+
+    def __init__(self, strategy: str = "smote_enn", n_jobs: int = -1, chunk_size: int = 10000,
+                 random_state: int = 42):
+        try:
+            if strategy not in REBALANCING_STRATEGIES:
+                raise Exception(f"Rebalancing strategy: [{strategy}] is not one of {list(REBALANCING_STRATEGIES)}")
+            self.strategy = strategy
+            self.n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+            self.chunk_size = chunk_size
+            self.random_state = random_state
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    @instrument("fit_resample")
+    def fit_resample(self, x: np.ndarray, y: np.ndarray) -> tuple:
+        """
+        Returns the rebalanced features and targets, unchanged for class_weight and none
+        """
+        try:
+            set_rows(len(y))
+            x = np.ascontiguousarray(x, dtype=np.float32)
+            y = np.asarray(y)
+            if self.strategy in ("class_weight", "none"):
+                return x, y
+
+            from imblearn.over_sampling import SMOTE
+
+            start_time = time.perf_counter()
+            n_rows = len(y)
+            x, y = SMOTE(sampling_strategy="all", random_state=self.random_state).fit_resample(x, y)
+            n_oversampled = len(y)
+            if self.strategy == "smote_enn":
+                keep = edited_nearest_neighbours(x, y, n_jobs=self.n_jobs, chunk_size=self.chunk_size)
+                x, y = x[keep], y[keep]
+            logging.info(f"Rebalanced [{self.strategy}] {n_rows} rows -> {n_oversampled} over-sampled -> "
+                         f"{len(y)} rows in {time.perf_counter() - start_time:.1f}s, "
+                         f"class counts: {dict(zip(*[values.tolist() for values in np.unique(y, return_counts=True)]))}")
+            return np.ascontiguousarray(x, dtype=np.float32), y
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_class_weights(self, y: np.ndarray) -> list:
+        """
+        Returns the balanced weight of every class code of y (n_samples / (n_classes * class count)),
+        for the class_weight strategy only, None otherwise
+        """
+        try:
+            if self.strategy != "class_weight":
+                return None
+            counts = np.bincount(np.asarray(y))
+            weights = np.where(counts > 0, len(y) / (np.count_nonzero(counts) * np.maximum(counts, 1)), 0.0)
+            return weights.tolist()
+        except Exception as e:
+            raise CustomException(e, sys) from e
@@ -0,0 +1,157 @@
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from credit_score.utils.utils import get_schema_columns
+from credit_score.constant import *
+from collections import namedtuple
+import pandas as pd
+import numpy as np
+import itertools
+import os, sys
+
+
+SchemaError = namedtuple("SchemaError", ["column", "check", "message"])
+
+INTEGER_TYPES = ("int", "int8", "int16", "int32", "int64")
+FLOAT_TYPES = ("float", "float16", "float32", "float64")
+CATEGORICAL_TYPES = ("category", "object", "str", "string")
+
+
+def get_file_name(file) -> str:
+    """
+    Returns the path of a file given as a path, or the name of a file given as a stream
+    """
+    return file if isinstance(file, (str, os.PathLike)) else getattr(file, "name", "<stream>")
+
+
+class SchemaValidator:
+    """
+    Validates csv files against the `Columns` section of schema.yaml.
+
+    The checks are compiled once from the schema and run in one streamed pass over the file (a path
+    or a binary stream), `chunk_size` rows at a time, so the memory used doesn't depend on the file size:
+        header: unknown columns, missing required columns and the number of columns
+        chunks: values which can't be cast to the schema type and columns without any value
+    Every problem found is returned as a SchemaError(column, check, message).
+    """
+
+    def __init__(self, dataset_schema: dict, required_columns: list = None,
+                 check_number_of_columns: bool = False, chunk_size: int = 100000):
+        try:
+            self.schema_columns = dict(dataset_schema[DATASET_SCHEMA_COLUMNS_KEY])
+            self.required_columns = list(self.schema_columns) if required_columns is None else list(required_columns)
+            self.number_of_columns = dataset_schema.get("NumberOfColumns") if check_number_of_columns else None
+            self.chunk_size = chunk_size
+            self.integer_columns = [column for column, column_type in self.schema_columns.items()
+                                    if column_type in INTEGER_TYPES]
+            self.float_columns = [column for column, column_type in self.schema_columns.items()
+                                  if column_type in FLOAT_TYPES]
+            # Columns of any other type are checked with a plain astype
+            self.other_columns = [column for column, column_type in self.schema_columns.items()
+                                  if column_type not in INTEGER_TYPES + FLOAT_TYPES + CATEGORICAL_TYPES]
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    @classmethod
+    def for_features(cls, dataset_schema: dict, **kwargs) -> "SchemaValidator":
+        """
+        Validator of files to predict on: every feature column is required, the target and the
+        dropped columns are optional
+        """
+        try:
+            drop_columns = get_schema_columns(dataset_schema, DROP_COLUMN_KEY)
+            feature_columns = [column for column in dataset_schema[DATASET_SCHEMA_COLUMNS_KEY]
+                               if column not in drop_columns and column != dataset_schema[TARGET_COLUMN_KEY]]
+            return cls(dataset_schema, required_columns=feature_columns, **kwargs)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def check_header(self, columns: list) -> list:
+        errors = []
+        if self.number_of_columns is not None and len(columns) != self.number_of_columns:
+            errors.append(SchemaError(None, "number_of_columns",
+                                      f"{len(columns)} columns found, {self.number_of_columns} expected"))
+        errors.extend(SchemaError(column, "unknown_column", f"column: [{column}] not available in the schema")
+                      for column in columns if column not in self.schema_columns)
+        errors.extend(SchemaError(column, "missing_column", f"column: [{column}] is missing")
+                      for column in self.required_columns if column not in columns)
+        return errors
+
+    @staticmethod
+    def get_invalid_values(chunk: pd.DataFrame, columns: list, integer: bool) -> pd.DataFrame:
+        """
+        Returns a boolean frame of the present values which are not numbers (or not integers)
+        """
+        values = chunk[columns]
+        present = values.notna()
+        numeric = values.apply(pd.to_numeric, errors="coerce")
+        invalid = present & numeric.isna()
+        if integer:
+            invalid |= present & numeric.notna() & (np.floor(numeric) != numeric)
+        return invalid
+
+    def validate(self, file) -> list:
+        """
+        Returns the list of SchemaErrors of the file, empty when the file is as per the schema
+        file: path or binary stream of the csv file, e.g. a member of the dataset archive
+        """
+        try:
+            self.n_rows_ = 0
+            file_name = get_file_name(file)
+            # The header is taken from the first chunk so that a stream is read once, a file
+            # with a header only still gives one empty chunk
+            chunks = pd.read_csv(file, chunksize=self.chunk_size)
+            first_chunk = next(chunks)
+            columns = list(first_chunk.columns)
+            errors = self.check_header(columns)
+
+            known_columns = [column for column in columns if column in self.schema_columns]
+            integer_columns = [column for column in self.integer_columns if column in known_columns]
+            float_columns = [column for column in self.float_columns if column in known_columns]
+            other_columns = [column for column in self.other_columns if column in known_columns]
+
+            has_value = pd.Series(False, index=columns)
+            n_invalid = pd.Series(0, index=known_columns, dtype=np.int64)
+            invalid_example = {}
+            n_rows = 0
+            for chunk in itertools.chain([first_chunk], chunks):
+                n_rows += len(chunk)
+                has_value |= chunk.notna().any()
+                invalid = pd.concat([self.get_invalid_values(chunk, float_columns, integer=False),
+                                     self.get_invalid_values(chunk, integer_columns, integer=True)], axis=1)
+                for column in other_columns:
+                    try:
+                        chunk[column].astype(self.schema_columns[column])
+                    except (TypeError, ValueError):
+                        invalid[column] = chunk[column].notna()
+                chunk_invalid = invalid.sum()
+                n_invalid = n_invalid.add(chunk_invalid, fill_value=0).astype(np.int64)
+                for column in chunk_invalid.index[chunk_invalid > 0]:
+                    invalid_example.setdefault(column, chunk.loc[invalid[column], column].iloc[0])
+
+            errors.extend(SchemaError(column, "invalid_type",
+                                      f"{n_invalid[column]} values of column: [{column}] can't be cast to "
+                                      f"[{self.schema_columns[column]}], e.g. [{invalid_example[column]}]")
+                          for column in known_columns if n_invalid[column] > 0)
+            errors.extend(SchemaError(column, "all_missing", f"column: [{column}] has entire row as missing value")
+                          for column in columns if not has_value[column])
+            self.n_rows_ = n_rows
+            logging.info(f"Schema validation of [{file_name}]: {n_rows} rows, {len(errors)} errors")
+            return errors
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def check(self, file) -> bool:
+        """
+        Validates the file and raises an Exception listing every SchemaError found
+        """
+        try:
+            errors = self.validate(file)
+            if len(errors) > 0:
+                file_name = get_file_name(file)
+                for error in errors:
+                    logging.info(f"Schema error in file: [{file_name}]: {error}")
+                raise Exception(f"File: [{os.path.basename(file_name)}] is not as per the schema: "
+                                + "; ".join(error.message for error in errors))
+            return True
+        except Exception as e:
+            raise CustomException(e, sys) from e
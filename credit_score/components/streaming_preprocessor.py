@@ -0,0 +1,408 @@
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from credit_score.instrumentation import instrument
+from credit_score.instrumentation import set_rows
+from credit_score.components.compiled_transformer import CompiledTransformer
+from credit_score.components.compiled_transformer import _yeo_johnson
+from credit_score.components.compiled_transformer import _MISSING
+import pandas as pd
+import numpy as np
+import os, sys
+import copy
+import time
+
+# Marker of the standardization following a PowerTransformer, fitted like a StandardScaler
+_STANDARDIZE = "standardize"
+
+
+class ColumnMoments:
+    """
+    Mergeable count, missing count, min, max, mean and sum of squared deviations of a column
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.n_missing = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    @property
+    def var(self) -> float:
+        return self.m2 / self.n if self.n > 0 else 0.0
+
+    def update(self, values: np.ndarray) -> None:
+        missing = np.isnan(values)
+        values = values[~missing]
+        self.n_missing += int(missing.sum())
+        if len(values) == 0:
+            return
+        self.add(len(values), float(values.mean()), float(((values - values.mean()) ** 2).sum()),
+                 float(values.min()), float(values.max()))
+
+    def add(self, n: int, mean: float, m2: float, min_value: float, max_value: float) -> None:
+        """
+        Merges the moments of n other values (parallel variance formula)
+        """
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.n * n / total
+        self.n = total
+        self.min, self.max = min(self.min, min_value), max(self.max, max_value)
+
+    def impute(self, fill_value: float) -> "ColumnMoments":
+        moments = copy.copy(self)
+        if self.n_missing > 0:
+            moments.n_missing = 0
+            moments.add(self.n_missing, fill_value, 0.0, fill_value, fill_value)
+        return moments
+
+    def affine(self, scale: float, shift: float) -> "ColumnMoments":
+        moments = copy.copy(self)
+        moments.mean = self.mean * scale + shift
+        moments.m2 = self.m2 * scale ** 2
+        moments.min, moments.max = sorted((self.min * scale + shift, self.max * scale + shift))
+        return moments
+
+
+def _get_affine(step, moments: ColumnMoments) -> tuple:
+    """
+    Returns the (scale, shift) the fitted scaling step would apply, given the moments of its input
+    """
+    from sklearn.preprocessing import MinMaxScaler
+
+    if isinstance(step, MinMaxScaler):
+        if step.clip:
+            raise NotImplementedError("MinMaxScaler with clip is not supported")
+        data_range = moments.max - moments.min
+        if data_range < 10 * np.finfo(np.float64).eps:
+            data_range = 1.0
+        feature_min, feature_max = step.feature_range
+        scale = (feature_max - feature_min) / data_range
+        return scale, feature_min - moments.min * scale
+
+    # StandardScaler, or the standardization of a PowerTransformer
+    with_mean = True if step == _STANDARDIZE else step.with_mean
+    with_std = True if step == _STANDARDIZE else step.with_std
+    scale = 1.0
+    if with_std:
+        # same constant feature rule as sklearn, whose scale is then 1
+        eps = np.finfo(np.float64).eps
+        is_constant = moments.var <= moments.n * eps * moments.var + (moments.n * moments.mean * eps) ** 2
+        scale = 1.0 if is_constant else 1.0 / np.sqrt(moments.var)
+    return scale, (-moments.mean * scale if with_mean else 0.0)
+
+
+class StreamingPreprocessor:
+    """
+    Out of core fit of the (unfitted) preprocessing ColumnTransformer.
+
+    The data is read as an iterable of dataframe chunks, at most twice, and the fitted
+    preprocessor is returned as a CompiledTransformer, so that the transform can also run
+    chunk by chunk. What is exact and what is estimated:
+
+    pass 1      : row count, per column count/missing/min/max/mean/variance and category counts,
+                  all exact, plus a uniform reservoir sample of the numeric rows
+    imputer     : median (and numeric most_frequent) from the reservoir, exact while the data
+                  fits in it; mean, most_frequent of categories and constant are exact
+    scalers     : MinMaxScaler/StandardScaler statistics derived exactly from the moments
+                  of their input, propagated through the earlier steps
+    encoders    : vocabularies from the category counts, encoded output moments from the counts
+    yeo-johnson : lambdas fitted on the reservoir; the standardization after it, and any step
+                  after that, from the exact moments of a second pass over the data
+
+    Supported steps are the ones CompiledTransformer supports.
+    """
+
+    def __init__(self, preprocessor, reservoir_size: int = 100000, random_state: int = 42):
+        try:
+            self.preprocessor = preprocessor
+            self.reservoir_size = reservoir_size
+            self.random_state = random_state
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_transformers(self, feature_names_in: list) -> list:
+        """
+        Returns the (name, steps, columns) of every transformer, remainder passthrough included
+        """
+        from sklearn.pipeline import Pipeline
+
+        transformers, used_columns = [], set()
+        for name, transformer, columns in self.preprocessor.transformers:
+            columns = list(np.atleast_1d(columns))
+            used_columns.update(columns)
+            if (isinstance(transformer, str) and transformer == "drop") or len(columns) == 0:
+                continue
+            steps = [] if isinstance(transformer, str) else (
+                [step for _, step in transformer.steps] if isinstance(transformer, Pipeline) else [transformer])
+            transformers.append((name, steps, columns))
+        remainder = [column for column in feature_names_in if column not in used_columns]
+        if self.preprocessor.remainder == "passthrough" and len(remainder) > 0:
+            transformers.append(("remainder", [], remainder))
+        elif self.preprocessor.remainder != "drop" and len(remainder) > 0:
+            raise NotImplementedError("Only passthrough and drop remainders are supported")
+        return transformers
+
+    @staticmethod
+    def is_categorical(steps: list) -> bool:
+        from sklearn.preprocessing import OrdinalEncoder, OneHotEncoder
+        return any(isinstance(step, (OrdinalEncoder, OneHotEncoder)) for step in steps)
+
+    def collect_statistics(self, chunks, feature_names_in: list, numeric_columns: list,
+                           categorical_columns: list, target_column: str = None) -> None:
+        """
+        Pass 1 over the chunks
+        """
+        rng = np.random.RandomState(self.random_state)
+        self.n_rows_ = 0
+        self.moments_ = {column: ColumnMoments() for column in numeric_columns}
+        self.category_counts_ = {column: {} for column in categorical_columns}
+        self.n_missing_categories_ = {column: 0 for column in categorical_columns}
+        self.target_counts_ = {}
+        reservoir = np.empty((self.reservoir_size, len(numeric_columns)), dtype=np.float64)
+
+        for chunk in chunks:
+            numeric = np.column_stack([chunk[column].to_numpy(dtype=np.float64, na_value=np.nan)
+                                       for column in numeric_columns]) if numeric_columns \
+                else np.empty((len(chunk), 0))
+            for i, column in enumerate(numeric_columns):
+                self.moments_[column].update(numeric[:, i])
+            for column in categorical_columns:
+                self.n_missing_categories_[column] += int(chunk[column].isna().sum())
+                counts = self.category_counts_[column]
+                for category, count in chunk[column].value_counts(dropna=True).items():
+                    if count > 0:
+                        counts[category] = counts.get(category, 0) + int(count)
+            if target_column is not None:
+                for category, count in chunk[target_column].value_counts(dropna=True).items():
+                    if count > 0:
+                        self.target_counts_[category] = self.target_counts_.get(category, 0) + int(count)
+
+            # Reservoir sampling (algorithm R), vectorized over the rows of the chunk
+            row_numbers = np.arange(self.n_rows_, self.n_rows_ + len(chunk))
+            filling = row_numbers < self.reservoir_size
+            reservoir[row_numbers[filling]] = numeric[filling]
+            slots = np.array([rng.randint(0, row_number + 1) for row_number in row_numbers[~filling]],
+                             dtype=np.int64)
+            replaced = slots < self.reservoir_size
+            reservoir[slots[replaced]] = numeric[~filling][replaced]
+            self.n_rows_ += len(chunk)
+
+        self.reservoir_ = pd.DataFrame(reservoir[:min(self.n_rows_, self.reservoir_size)], columns=numeric_columns)
+        logging.info(f"Streaming preprocessor statistics collected over {self.n_rows_} rows, "
+                     f"reservoir of {len(self.reservoir_)} rows")
+
+    def advance_numeric(self, state: dict) -> None:
+        """
+        Fits the pending steps of a numeric column state, until a step needs the moments
+        of a Yeo-Johnson output which are only known after the second pass
+        """
+        from sklearn.impute import SimpleImputer
+        from sklearn.preprocessing import StandardScaler, MinMaxScaler, PowerTransformer, FunctionTransformer
+
+        while len(state["pending"]) > 0:
+            step = state["pending"][0]
+            if isinstance(step, FunctionTransformer) and step.func is None:
+                state["pending"].pop(0)
+                continue
+            if state["moments"] is None:
+                return
+            if isinstance(step, SimpleImputer):
+                if state["pre"] != [1.0, 0.0] or state["lambda"] is not None:
+                    raise NotImplementedError(f"[{state['name']}]: imputer after a scaling step is not supported")
+                if state["moments"].n == 0 and step.strategy != "constant":
+                    raise NotImplementedError(f"[{state['name']}]: column: [{state['column']}] has no value")
+                sample = self.reservoir_[state["column"]].dropna()
+                if step.strategy == "median":
+                    fill = float(np.median(sample))
+                elif step.strategy == "mean":
+                    fill = state["moments"].mean
+                elif step.strategy == "most_frequent":
+                    counts = sample.value_counts()
+                    fill = float(min(counts.index[counts == counts.max()]))
+                else:
+                    fill = 0.0 if step.fill_value is None else float(step.fill_value)
+                state["fill"] = fill
+                state["moments"] = state["moments"].impute(fill)
+            elif isinstance(step, PowerTransformer):
+                if step.method != "yeo-johnson":
+                    raise NotImplementedError(f"[{state['name']}]: PowerTransformer method {step.method} is not supported")
+                if state["lambda"] is not None:
+                    raise NotImplementedError(f"[{state['name']}]: more than one PowerTransformer is not supported")
+                values = self.reservoir_[state["column"]].to_numpy()
+                values = np.where(np.isnan(values), state["fill"], values) * state["pre"][0] + state["pre"][1]
+                lambda_fitter = PowerTransformer(method="yeo-johnson", standardize=False)
+                state["lambda"] = float(lambda_fitter.fit(values.reshape(-1, 1)).lambdas_[0])
+                state["moments"] = None
+                state["pending"].pop(0)
+                if step.standardize:
+                    state["pending"].insert(0, _STANDARDIZE)
+                continue
+            elif isinstance(step, (MinMaxScaler, StandardScaler)) or step == _STANDARDIZE:
+                scale, shift = _get_affine(step, state["moments"])
+                affine = state["pre"] if state["lambda"] is None else state["post"]
+                affine[0], affine[1] = affine[0] * scale, affine[1] * scale + shift
+                state["moments"] = state["moments"].affine(scale, shift)
+            else:
+                raise NotImplementedError(f"[{state['name']}]: step {type(step).__name__} is not supported")
+            state["pending"].pop(0)
+
+    def collect_yeo_johnson_moments(self, chunks, states: list) -> None:
+        """
+        Pass 2: moments of the Yeo-Johnson output of the given column states
+        """
+        moments = [ColumnMoments() for _ in states]
+        for chunk in chunks:
+            for state, state_moments in zip(states, moments):
+                values = chunk[state["column"]].to_numpy(dtype=np.float64, na_value=np.nan)
+                if not np.isnan(state["fill"]):
+                    values = np.where(np.isnan(values), state["fill"], values)
+                values = _yeo_johnson(values * state["pre"][0] + state["pre"][1], np.float64(state["lambda"]))
+                state_moments.update(values * state["post"][0] + state["post"][1])
+        for state, state_moments in zip(states, moments):
+            state["moments"] = state_moments
+
+    def fit_categorical(self, name: str, steps: list, columns: list, out_start: int) -> tuple:
+        """
+        Returns the compiled categorical outputs of one transformer and the index after its output
+        """
+        from sklearn.impute import SimpleImputer
+        from sklearn.preprocessing import StandardScaler, MinMaxScaler, OrdinalEncoder, OneHotEncoder
+
+        encoder_index = next(i for i, step in enumerate(steps) if isinstance(step, (OrdinalEncoder, OneHotEncoder)))
+        encoder = steps[encoder_index]
+        is_onehot = isinstance(encoder, OneHotEncoder)
+        if is_onehot and (encoder.drop is not None or encoder.handle_unknown != "ignore"):
+            raise NotImplementedError(f"[{name}]: OneHotEncoder needs drop=None and handle_unknown='ignore'")
+        if getattr(encoder, "min_frequency", None) is not None or getattr(encoder, "max_categories", None) is not None:
+            raise NotImplementedError(f"[{name}]: infrequent categories are not supported")
+
+        outputs, out_index = [], out_start
+        for column_index, column in enumerate(columns):
+            counts = dict(self.category_counts_[column])
+            n_missing = self.n_missing_categories_[column]
+            fill_value = None
+            for step in steps[:encoder_index]:
+                if not isinstance(step, SimpleImputer) or step.strategy not in ("most_frequent", "constant"):
+                    raise NotImplementedError(f"[{name}]: step {type(step).__name__} before the encoder is not supported")
+                if step.strategy == "most_frequent":
+                    if len(counts) == 0:
+                        raise NotImplementedError(f"[{name}]: column: [{column}] has no value")
+                    max_count = max(counts.values())
+                    # ties go to the smallest category, as in sklearn
+                    fill_value = sorted(category for category, count in counts.items() if count == max_count)[0]
+                else:
+                    fill_value = "missing_value" if step.fill_value is None else step.fill_value
+                if n_missing > 0:
+                    counts[fill_value] = counts.get(fill_value, 0) + n_missing
+                    n_missing = 0
+            if n_missing > 0:
+                raise NotImplementedError(f"[{name}]: column: [{column}] has missing values and no imputer")
+
+            categories = sorted(counts) if isinstance(encoder.categories, str) else list(encoder.categories[column_index])
+            category_counts = np.array([counts.get(category, 0) for category in categories], dtype=np.float64)
+            if not is_onehot and encoder.handle_unknown == "error" and len(set(counts) - set(categories)) > 0:
+                raise ValueError(f"[{name}]: column: [{column}] has categories which are not in the given ones")
+
+            # Moments of the encoded output columns, from the category counts
+            n_total = category_counts.sum()
+            output_moments = []
+            if is_onehot:
+                for count in category_counts:
+                    moments = ColumnMoments()
+                    share = count / n_total
+                    moments.add(int(n_total), share, n_total * share * (1 - share),
+                                0.0 if count < n_total else 1.0, 1.0 if count > 0 else 0.0)
+                    output_moments.append(moments)
+            else:
+                codes = np.arange(len(categories), dtype=np.float64)
+                present = category_counts > 0
+                mean = float((codes * category_counts).sum() / n_total)
+                moments = ColumnMoments()
+                moments.add(int(n_total), mean, float((category_counts * (codes - mean) ** 2).sum()),
+                            float(codes[present].min()), float(codes[present].max()))
+                output_moments.append(moments)
+
+            scale, shift = np.ones(len(output_moments)), np.zeros(len(output_moments))
+            for step in steps[encoder_index + 1:]:
+                if not isinstance(step, (StandardScaler, MinMaxScaler)):
+                    raise NotImplementedError(f"[{name}]: step {type(step).__name__} after the encoder is not supported")
+                for i, moments in enumerate(output_moments):
+                    step_scale, step_shift = _get_affine(step, moments)
+                    scale[i], shift[i] = scale[i] * step_scale, shift[i] * step_scale + step_shift
+                    output_moments[i] = moments.affine(step_scale, step_shift)
+
+            lookup = {category: code for code, category in enumerate(categories)}
+            unknown_code = None
+            if not is_onehot:
+                unknown_code = float(encoder.unknown_value) if encoder.handle_unknown == "use_encoded_value" else np.nan
+            outputs.append({
+                "column": column,
+                "categories": pd.Index(categories),
+                "lookup": lookup,
+                "fill_code": lookup.get(fill_value, _MISSING) if fill_value is not None else _MISSING,
+                "is_onehot": is_onehot,
+                "unknown_code": unknown_code,
+                "handle_unknown_error": not is_onehot and encoder.handle_unknown == "error",
+                "out_index": out_index,
+                "scale": scale,
+                "shift": shift})
+            out_index += len(output_moments)
+        return outputs, out_index
+
+    @instrument("streaming_fit")
+    def fit(self, get_chunks, target_column: str = None) -> CompiledTransformer:
+        """
+        Fits the preprocessor on the chunks and returns it compiled.
+        get_chunks: function returning a new iterator over the dataframe chunks, called once per pass
+        target_column: left out of the features, its class counts are kept in `target_counts_`
+        """
+        try:
+            start_time = time.perf_counter()
+            first_chunk = next(iter(get_chunks()))
+            feature_names_in = [column for column in first_chunk.columns if column != target_column]
+            transformers = self.get_transformers(feature_names_in)
+
+            numeric_columns, categorical_columns = [], []
+            for _, steps, columns in transformers:
+                group = categorical_columns if self.is_categorical(steps) else numeric_columns
+                group.extend(column for column in columns if column not in group)
+            self.collect_statistics(get_chunks(), feature_names_in, numeric_columns, categorical_columns, target_column)
+
+            numeric_states, categorical_outputs, out_index = [], [], 0
+            for name, steps, columns in transformers:
+                if self.is_categorical(steps):
+                    outputs, out_index = self.fit_categorical(name, steps, columns, out_index)
+                    categorical_outputs.extend(outputs)
+                    continue
+                for column in columns:
+                    state = {"name": name, "column": column, "fill": np.nan, "pre": [1.0, 0.0], "lambda": None,
+                             "post": [1.0, 0.0], "moments": self.moments_[column], "pending": list(steps),
+                             "out_index": out_index}
+                    self.advance_numeric(state)
+                    numeric_states.append(state)
+                    out_index += 1
+
+            waiting_states = [state for state in numeric_states if len(state["pending"]) > 0]
+            if len(waiting_states) > 0:
+                logging.info(f"Second pass for the Yeo-Johnson output of {len(waiting_states)} columns")
+                self.collect_yeo_johnson_moments(get_chunks(), waiting_states)
+                for state in waiting_states:
+                    self.advance_numeric(state)
+
+            set_rows(self.n_rows_)
+            numeric_outputs = [{key: state[key] for key in ("column", "fill", "pre", "lambda", "post", "out_index")}
+                               for state in numeric_states]
+            compiled = CompiledTransformer.from_outputs(feature_names_in, numeric_outputs, categorical_outputs,
+                                                        n_features_out=out_index)
+            logging.info(f"Streaming preprocessor fitted on {self.n_rows_} rows in "
+                         f"{time.perf_counter() - start_time:.1f}s: {len(numeric_outputs)} numeric and "
+                         f"{len(categorical_outputs)} categorical columns -> {out_index} features")
+            return compiled
+        except NotImplementedError:
+            raise
+        except Exception as e:
+            raise CustomException(e, sys) from e
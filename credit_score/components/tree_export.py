@@ -0,0 +1,233 @@
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+import numpy as np
+import os, sys
+import json
+import shutil
+
+
+EXPORT_META_FILE_NAME = "meta.json"
+# Node table arrays of an exported model, one .npy file each
+EXPORT_ARRAYS = ["feature", "threshold", "left", "right", "default_left", "value",
+                 "tree_root", "tree_class", "tree_weight"]
+
+
+def _get_depth(left: np.ndarray, right: np.ndarray) -> int:
+    """
+    Returns the depth of a tree given its child arrays (-1 for leaves); children always come after
+    their parent in both sklearn and xgboost node orders.
+    """
+    depth = np.zeros(len(left), dtype=np.int64)
+    for node in range(len(left)):
+        if left[node] >= 0:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def _get_sklearn_forest_tables(model) -> tuple:
+    trees = []
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        value = tree.value[:, 0, :].astype(np.float64)
+        value = value / value.sum(axis=1, keepdims=True)
+        default_left = getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=np.uint8))
+        trees.append((tree.feature, tree.threshold, tree.children_left, tree.children_right,
+                      default_left, value, -1, 1.0))
+    meta = {"model_type": "random_forest", "decision": "<=", "n_classes": int(model.n_classes_),
+            "classes": model.classes_.tolist(), "base_score": None}
+    return trees, meta
+
+
+def _get_xgboost_tables(model) -> tuple:
+    model_json = json.loads(model.get_booster().save_raw(raw_format="json"))
+    learner = model_json["learner"]
+    gradient_booster = learner["gradient_booster"]
+    if gradient_booster["name"] not in ("gbtree", "dart"):
+        raise NotImplementedError(f"xgboost booster [{gradient_booster['name']}] has no trees to export")
+    booster_model = gradient_booster["model"] if gradient_booster["name"] == "gbtree" \
+        else gradient_booster["gbtree"]["model"]
+    weight_drop = gradient_booster.get("weight_drop") or [1.0] * len(booster_model["trees"])
+
+    n_trees = len(booster_model["trees"])
+    try:
+        # prediction of the sklearn wrapper stops at the best iteration when early stopping was used
+        n_trees = booster_model["iteration_indptr"][model.best_iteration + 1]
+    except (AttributeError, KeyError, IndexError, TypeError):
+        pass
+
+    trees = []
+    for tree, tree_class, weight in list(zip(booster_model["trees"], booster_model["tree_info"], weight_drop))[:n_trees]:
+        if any(split_type != 0 for split_type in tree["split_type"]):
+            raise NotImplementedError("xgboost categorical splits are not supported")
+        left = np.array(tree["left_children"], dtype=np.int64)
+        # leaf values are stored in split_conditions of the leaf nodes
+        split_conditions = np.array(tree["split_conditions"], dtype=np.float32)
+        trees.append((np.array(tree["split_indices"]), split_conditions.astype(np.float64), left,
+                      np.array(tree["right_children"], dtype=np.int64), np.array(tree["default_left"]),
+                      split_conditions.astype(np.float64).reshape(-1, 1), int(tree_class), float(weight)))
+
+    if learner["objective"]["name"] not in ("multi:softprob", "multi:softmax"):
+        raise NotImplementedError(f"xgboost objective [{learner['objective']['name']}] is not supported")
+    n_classes = int(learner["learner_model_param"]["num_class"])
+    base_score = [float(score) for score in
+                  learner["learner_model_param"]["base_score"].strip("[]").split(",")]
+    meta = {"model_type": "xgboost", "decision": "<", "n_classes": n_classes,
+            "classes": model.classes_.tolist(), "base_score": base_score}
+    return trees, meta
+
+
+def export_tree_model(model, export_dir: str, class_labels: list = None) -> str:
+    """
+    Exports a fitted RandomForest/ExtraTrees classifier or xgboost gbtree/dart classifier into flat
+    node tables saved as .npy files in export_dir, plus a meta.json, and returns the export dir.
+    class_labels: optional original labels of the encoded classes, kept in meta.json so that
+    a scorer can decode predictions without loading the target encoder.
+
+    All trees are concatenated in one table. Leaves point to themselves, so that every row can be
+    walked the same number of steps (the max depth) without branching.
+    """
+    try:
+        # Only the export needs the model libraries, the evaluator works on numpy alone
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.ensemble import ExtraTreesClassifier
+        from xgboost import XGBClassifier
+
+        if isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+            trees, meta = _get_sklearn_forest_tables(model)
+        elif isinstance(model, XGBClassifier):
+            trees, meta = _get_xgboost_tables(model)
+        else:
+            raise NotImplementedError(f"Export of model type [{type(model).__name__}] is not supported")
+
+        tables = {name: [] for name in EXPORT_ARRAYS}
+        offset, max_depth = 0, 0
+        for feature, threshold, left, right, default_left, value, tree_class, weight in trees:
+            n_nodes = len(left)
+            node_ids = np.arange(offset, offset + n_nodes)
+            is_leaf = left < 0
+            tables["feature"].append(np.where(is_leaf, 0, feature).astype(np.int32))
+            tables["threshold"].append(np.where(is_leaf, 0.0, threshold).astype(np.float64))
+            tables["left"].append(np.where(is_leaf, node_ids, left + offset).astype(np.int32))
+            tables["right"].append(np.where(is_leaf, node_ids, right + offset).astype(np.int32))
+            tables["default_left"].append(np.asarray(default_left).astype(bool))
+            tables["value"].append(np.where(is_leaf[:, None], value, 0.0))
+            tables["tree_root"].append([offset])
+            tables["tree_class"].append([tree_class])
+            tables["tree_weight"].append([weight])
+            max_depth = max(max_depth, _get_depth(left, right))
+            offset += n_nodes
+
+        if os.path.exists(export_dir):
+            shutil.rmtree(export_dir)
+        os.makedirs(export_dir, exist_ok=True)
+        for name, table in tables.items():
+            array = np.concatenate([np.asarray(part) for part in table])
+            np.save(os.path.join(export_dir, f"{name}.npy"), np.ascontiguousarray(array))
+
+        meta.update({"n_features": int(model.n_features_in_), "n_trees": len(trees),
+                     "n_nodes": offset, "max_depth": max_depth,
+                     "class_labels": None if class_labels is None else list(class_labels)})
+        with open(os.path.join(export_dir, EXPORT_META_FILE_NAME), "w") as meta_file:
+            json.dump(meta, meta_file, indent=4)
+        logging.info(f"Exported {meta['model_type']} model with {len(trees)} trees and {offset} nodes "
+                     f"to [{export_dir}]")
+        return export_dir
+    except NotImplementedError:
+        raise
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+
+class TreeEnsemble:
+    """
+    Vectorized evaluator of a model exported by `export_tree_model`.
+
+    The node tables are memory-mapped, so loading is instant and only the pages of the nodes
+    visited are read. Rows are scored in batches: all (row, tree) pairs of a batch take one
+    step down their tree at a time, for max depth steps.
+    """
+
+    def __init__(self, export_dir: str, mmap_mode: str = "r", batch_size: int = 4096):
+        try:
+            self.export_dir = export_dir
+            self.batch_size = batch_size
+            with open(os.path.join(export_dir, EXPORT_META_FILE_NAME), "r") as meta_file:
+                self.meta = json.load(meta_file)
+            for name in EXPORT_ARRAYS:
+                setattr(self, name, np.load(os.path.join(export_dir, f"{name}.npy"), mmap_mode=mmap_mode))
+            self.classes_ = np.array(self.meta["classes"])
+            self.class_labels_ = None if self.meta.get("class_labels") is None else np.array(self.meta["class_labels"])
+            self.n_features_in_ = self.meta["n_features"]
+            if self.meta["model_type"] == "xgboost":
+                # (n_trees, n_classes) matrix summing the weighted tree outputs into class margins
+                self.class_matrix = np.zeros((len(self.tree_root), self.meta["n_classes"]), dtype=np.float64)
+                self.class_matrix[np.arange(len(self.tree_root)), self.tree_class] = self.tree_weight
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def apply(self, x: np.ndarray) -> np.ndarray:
+        """
+        Returns the (n_rows, n_trees) leaf node ids reached by every row in every tree
+        """
+        node = np.repeat(np.asarray(self.tree_root)[None, :], len(x), axis=0)
+        rows = np.arange(len(x))[:, None]
+        less_equal = self.meta["decision"] == "<="
+        for _ in range(self.meta["max_depth"]):
+            values = x[rows, self.feature[node]]
+            threshold = self.threshold[node]
+            go_left = values <= threshold if less_equal else values < threshold
+            missing = np.isnan(values)
+            if missing.any():
+                go_left = np.where(missing, self.default_left[node], go_left)
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict_proba_batch(self, x: np.ndarray) -> np.ndarray:
+        leaves = self.apply(x)
+        if self.meta["model_type"] == "random_forest":
+            return self.value[leaves].sum(axis=1) / len(self.tree_root)
+
+        margin = self.value[leaves][:, :, 0] @ self.class_matrix + np.asarray(self.meta["base_score"])
+        margin = margin - margin.max(axis=1, keepdims=True)
+        probabilities = np.exp(margin)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, x: np.ndarray) -> np.ndarray:
+        try:
+            x = np.asarray(x, dtype=np.float32)
+            return np.concatenate([self.predict_proba_batch(x[start:start + self.batch_size])
+                                   for start in range(0, len(x), self.batch_size)] or
+                                  [np.empty((0, len(self.classes_)))])
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        try:
+            return self.classes_[np.argmax(self.predict_proba(x), axis=1)]
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+def check_export_equivalence(model, ensemble: TreeEnsemble, x: np.ndarray, atol: float = 1e-5) -> float:
+    """
+    Checks that the exported model gives the same probabilities (within atol) and the same predicted
+    classes as the original model on x, a class may only differ on exact ties within atol.
+    Returns the largest absolute probability difference.
+    """
+    try:
+        expected = model.predict_proba(x)
+        actual = ensemble.predict_proba(x)
+        max_difference = float(np.max(np.abs(expected - actual))) if expected.size else 0.0
+        if max_difference > atol:
+            raise Exception(f"Exported model probabilities differ from the original model by {max_difference}")
+
+        mismatch = np.flatnonzero(model.predict(x) != ensemble.predict(x))
+        if len(mismatch) > 0:
+            top_two = np.sort(expected[mismatch], axis=1)[:, -2:]
+            if np.any(top_two[:, 1] - top_two[:, 0] > atol):
+                raise Exception(f"Exported model predicts a different class for {len(mismatch)} rows")
+        logging.info(f"Exported model equivalence checked on {len(x)} rows, "
+                     f"max probability difference: {max_difference}")
+        return max_difference
+    except Exception as e:
+        raise CustomException(e, sys) from e
@@ -39,10 +39,6 @@ class Configuration:
                 data_ingestion_artifact_dir,
                 data_ingestion_info[DATA_INGESTION_TGZ_DOWNLOAD_DIR_KEY])
 
-            raw_data_dir = os.path.join(
-                data_ingestion_artifact_dir, 
-                data_ingestion_info[DATA_INGESTION_RAW_DATA_DIR_KEY])
-
             ingested_data_dir = os.path.join(
                 data_ingestion_artifact_dir,
                 data_ingestion_info[DATA_INGESTION_INGESTED_DIR_NAME_KEY])
@@ -54,12 +50,39 @@ class Configuration:
                 ingested_data_dir,
                 data_ingestion_info[DATA_INGESTION_TEST_DIR_KEY])
 
+            # Downloads are kept across runs, outside of the timestamped dir of the run
+            download_cache_dir = os.path.join(
+                artifact_dir,
+                DATA_INGESTION_ARTIFACT_DIR,
+                data_ingestion_info[DATA_INGESTION_DOWNLOAD_CACHE_DIR_KEY])
+
+            # Schema is needed at ingestion time to push column projection down to the DB
+            data_validation_info = self.config_info[DATA_VALIDATION_CONFIG_KEY]
+            schema_file_path = os.path.join(ROOT_DIR,
+                                            data_validation_info[DATA_VALIDATION_SCHEMA_DIR_KEY],
+                                            data_validation_info[DATA_VALIDATION_SCHEMA_FILE_NAME_KEY])
+
             data_ingestion_config = DataIngestionConfig(
                 dataset_download_url=dataset_download_url,
                 tgz_download_dir=tgz_download_dir,
-                raw_data_dir=raw_data_dir,
                 ingested_train_dir=ingested_train_dir,
-                ingested_test_dir=ingested_test_dir)
+                ingested_test_dir=ingested_test_dir,
+                ingested_file_format=data_ingestion_info[DATA_INGESTION_FILE_FORMAT_KEY],
+                export_csv=data_ingestion_info[DATA_INGESTION_EXPORT_CSV_KEY],
+                ingestion_backend=data_ingestion_info[DATA_INGESTION_BACKEND_KEY],
+                mirror_to_db=data_ingestion_info[DATA_INGESTION_MIRROR_TO_DB_KEY],
+                chunk_size=data_ingestion_info[DATA_INGESTION_CHUNK_SIZE_KEY],
+                db_batch_size=data_ingestion_info[DATA_INGESTION_DB_BATCH_SIZE_KEY],
+                db_writer_threads=data_ingestion_info[DATA_INGESTION_DB_WRITER_THREADS_KEY],
+                db_fetch_mode=data_ingestion_info[DATA_INGESTION_DB_FETCH_MODE_KEY],
+                db_fetch_batch_size=data_ingestion_info[DATA_INGESTION_DB_FETCH_BATCH_SIZE_KEY],
+                download_cache_dir=download_cache_dir,
+                download_sha256=data_ingestion_info[DATA_INGESTION_DOWNLOAD_SHA256_KEY],
+                download_segments=data_ingestion_info[DATA_INGESTION_DOWNLOAD_SEGMENTS_KEY],
+                download_parallel_min_bytes=data_ingestion_info[DATA_INGESTION_DOWNLOAD_PARALLEL_MIN_BYTES_KEY],
+                download_timeout=data_ingestion_info[DATA_INGESTION_DOWNLOAD_TIMEOUT_KEY],
+                download_retries=data_ingestion_info[DATA_INGESTION_DOWNLOAD_RETRIES_KEY],
+                schema_file_path=schema_file_path)
             logging.info(f"Data Ingestion Config : {data_ingestion_config} ")
             return data_ingestion_config
         except Exception as e:
@@ -87,9 +110,19 @@ class Configuration:
             report_page_file_path = os.path.join(data_validation_artifact_dir,
                                             data_validation_config[DATA_VALIDATION_REPORT_PAGE_FILE_NAME_KEY])
 
-            data_validation_config = DataValidationConfig(schema_file_path=schema_file_path,
-                                                          report_file_path=report_file_path,
-                                                          report_page_file_path=report_page_file_path)
+            drift_reference_file_path = os.path.join(data_validation_artifact_dir,
+                                            data_validation_config[DATA_VALIDATION_DRIFT_REFERENCE_FILE_NAME_KEY])
+
+            data_validation_config = DataValidationConfig(
+                schema_file_path=schema_file_path,
+                report_file_path=report_file_path,
+                report_page_file_path=report_page_file_path,
+                save_report_page=data_validation_config[DATA_VALIDATION_SAVE_REPORT_PAGE_KEY],
+                drift_reference_file_path=drift_reference_file_path,
+                drift_n_bins=data_validation_config[DATA_VALIDATION_DRIFT_N_BINS_KEY],
+                drift_p_value_threshold=data_validation_config[DATA_VALIDATION_DRIFT_P_VALUE_THRESHOLD_KEY],
+                drift_psi_threshold=data_validation_config[DATA_VALIDATION_DRIFT_PSI_THRESHOLD_KEY],
+                drift_share=data_validation_config[DATA_VALIDATION_DRIFT_SHARE_KEY])
             logging.info(f"Data Validation config: {data_validation_config}")
             return data_validation_config
 
@@ -114,6 +147,17 @@ class Configuration:
                 data_transformation_config_info[DATA_TRANSFORMATION_PREPROCESSED_FILE_NAME_KEY]
             )
 
+            target_encoder_object_file_path = os.path.join(
+                data_transformation_artifact_dir,
+                data_transformation_config_info[DATA_TRANSFORMATION_PREPROCESSING_DIR_KEY],
+                data_transformation_config_info[DATA_TRANSFORMATION_TARGET_ENCODER_FILE_NAME_KEY]
+            )
+
+            compiled_preprocessed_object_file_path = os.path.join(
+                data_transformation_artifact_dir,
+                data_transformation_config_info[DATA_TRANSFORMATION_PREPROCESSING_DIR_KEY],
+                data_transformation_config_info[DATA_TRANSFORMATION_COMPILED_PREPROCESSED_FILE_NAME_KEY]
+            )
             
             transformed_train_dir=os.path.join(
             data_transformation_artifact_dir,
@@ -133,7 +177,16 @@ class Configuration:
             data_transformation_config=DataTransformationConfig(
                 preprocessed_object_file_path=preprocessed_object_file_path,
                 transformed_train_dir=transformed_train_dir,
-                transformed_test_dir=transformed_test_dir
+                transformed_test_dir=transformed_test_dir,
+                target_encoder_object_file_path=target_encoder_object_file_path,
+                compiled_preprocessed_object_file_path=compiled_preprocessed_object_file_path,
+                rebalancing_strategy=data_transformation_config_info[DATA_TRANSFORMATION_REBALANCING_STRATEGY_KEY],
+                rebalancing_n_jobs=data_transformation_config_info[DATA_TRANSFORMATION_REBALANCING_N_JOBS_KEY],
+                rebalancing_chunk_size=data_transformation_config_info[DATA_TRANSFORMATION_REBALANCING_CHUNK_SIZE_KEY],
+                rebalance_test=data_transformation_config_info[DATA_TRANSFORMATION_REBALANCE_TEST_KEY],
+                out_of_core=data_transformation_config_info[DATA_TRANSFORMATION_OUT_OF_CORE_KEY],
+                chunk_size=data_transformation_config_info[DATA_TRANSFORMATION_CHUNK_SIZE_KEY],
+                reservoir_size=data_transformation_config_info[DATA_TRANSFORMATION_RESERVOIR_SIZE_KEY]
             )
 
             logging.info(f"Data transformation config: {data_transformation_config}")
@@ -143,7 +196,7 @@ class Configuration:
     
     def get_model_trainer_config(self)-> ModelTrainerConfig:
         try:
-            artifact_dir = self.get_training_pipeline_config.artifact_dir
+            artifact_dir = self.training_pipeline_config.artifact_dir
 
             model_trainer_arifact_dir = os.path.join(
                 artifact_dir,
@@ -158,15 +211,81 @@ class Configuration:
                 model_trainer_config[MODEL_TRAINER_TRAINED_MODEL_FILE_NAME_KEY]
             )
 
+            exported_model_dir = os.path.join(
+                model_trainer_arifact_dir,
+                model_trainer_config[MODEL_TRAINER_TRAINED_MODEL_DIR],
+                model_trainer_config[MODEL_TRAINER_EXPORTED_MODEL_DIR_KEY]
+            )
+
+            # Optuna storage is kept outside the timestamped dir so that studies can be resumed
+            optuna_storage_file_path = os.path.join(
+                artifact_dir,
+                MODEL_TRAINER_ARTIFACT_DIR,
+                model_trainer_config[MODEL_TRAINER_OPTUNA_STORAGE_FILE_NAME_KEY]
+            )
+
             model_trainer_config = ModelTrainerConfig(
-                trained_model_file_path= trained_model_file_path
+                trained_model_file_path= trained_model_file_path,
+                exported_model_dir=exported_model_dir,
+                model_candidates=model_trainer_config[MODEL_TRAINER_MODEL_CANDIDATES_KEY],
+                candidate_workers=model_trainer_config[MODEL_TRAINER_CANDIDATE_WORKERS_KEY],
+                search_mode=model_trainer_config[MODEL_TRAINER_SEARCH_MODE_KEY],
+                search_resource=model_trainer_config[MODEL_TRAINER_SEARCH_RESOURCE_KEY],
+                search_cv=model_trainer_config[MODEL_TRAINER_SEARCH_CV_KEY],
+                search_factor=model_trainer_config[MODEL_TRAINER_SEARCH_FACTOR_KEY],
+                search_time_budget=model_trainer_config[MODEL_TRAINER_SEARCH_TIME_BUDGET_KEY],
+                search_n_jobs=model_trainer_config[MODEL_TRAINER_SEARCH_N_JOBS_KEY],
+                optuna_study_name=model_trainer_config[MODEL_TRAINER_OPTUNA_STUDY_NAME_KEY],
+                optuna_storage_file_path=optuna_storage_file_path,
+                optuna_n_trials=model_trainer_config[MODEL_TRAINER_OPTUNA_N_TRIALS_KEY],
+                optuna_n_jobs=model_trainer_config[MODEL_TRAINER_OPTUNA_N_JOBS_KEY],
+                optuna_timeout=model_trainer_config[MODEL_TRAINER_OPTUNA_TIMEOUT_KEY],
+                optuna_pruner=model_trainer_config[MODEL_TRAINER_OPTUNA_PRUNER_KEY]
             ) 
+            logging.info(f"Model Trainer Config: {model_trainer_config}")
+            return model_trainer_config
 
         except Exception as e:
             raise CustomException(e,sys) from e
     
-    
 
+    def get_prediction_config(self) -> PredictionConfig:
+        try:
+            # Prediction uses the objects copied to prediction_files by the last training run
+            prediction_files_dir = os.path.join(ROOT_DIR, PIKLE_FOLDER_NAME_KEY)
+            data_transformation_config_info = self.config_info[DATA_TRANSFORMATION_CONFIG_KEY]
+            model_trainer_config_info = self.config_info[MODEL_TRAINER_CONFIG_KEY]
+            data_validation_config_info = self.config_info[DATA_VALIDATION_CONFIG_KEY]
+            prediction_config_info = self.config_info[PREDICTION_CONFIG_KEY]
+
+            prediction_config = PredictionConfig(
+                preprocessed_object_file_path=os.path.join(
+                    prediction_files_dir,
+                    data_transformation_config_info[DATA_TRANSFORMATION_PREPROCESSED_FILE_NAME_KEY]),
+                compiled_preprocessed_object_file_path=os.path.join(
+                    prediction_files_dir,
+                    data_transformation_config_info[DATA_TRANSFORMATION_COMPILED_PREPROCESSED_FILE_NAME_KEY]),
+                trained_model_file_path=os.path.join(
+                    prediction_files_dir,
+                    model_trainer_config_info[MODEL_TRAINER_TRAINED_MODEL_FILE_NAME_KEY]),
+                exported_model_dir=os.path.join(
+                    prediction_files_dir,
+                    model_trainer_config_info[MODEL_TRAINER_EXPORTED_MODEL_DIR_KEY]),
+                target_encoder_object_file_path=os.path.join(
+                    prediction_files_dir,
+                    data_transformation_config_info[DATA_TRANSFORMATION_TARGET_ENCODER_FILE_NAME_KEY]),
+                drift_reference_file_path=os.path.join(
+                    prediction_files_dir,
+                    data_validation_config_info[DATA_VALIDATION_DRIFT_REFERENCE_FILE_NAME_KEY]),
+                prediction_dir=os.path.join(ROOT_DIR, PREDICTION_DATA_SAVING_FOLDER_KEY),
+                chunk_size=prediction_config_info[PREDICTION_CHUNK_SIZE_KEY],
+                max_batch_size=prediction_config_info[PREDICTION_MAX_BATCH_SIZE_KEY],
+                max_batch_delay_ms=prediction_config_info[PREDICTION_MAX_BATCH_DELAY_MS_KEY]
+            )
+            logging.info(f"Prediction Config: {prediction_config}")
+            return prediction_config
+        except Exception as e:
+            raise CustomException(e,sys) from e
 
     def get_training_pipeline_config(self) -> TrainingPipelineConfig:
         try:
@@ -174,7 +293,15 @@ class Configuration:
             artifact_dir = os.path.join(ROOT_DIR, 
                                         training_pipeline_config[TRAINING_PIPELINE_NAME_KEY],
                                         training_pipeline_config[TRAINING_PIPELINE_ARTIFACT_DIR_KEY])
-            training_pipeline_config = TrainingPipelineConfig(artifact_dir=artifact_dir)
+            # Stage cache is disabled by leaving its file path empty
+            stage_cache_file_path = None
+            if training_pipeline_config[TRAINING_PIPELINE_USE_STAGE_CACHE_KEY]:
+                stage_cache_file_path = os.path.join(artifact_dir,
+                                                     training_pipeline_config[TRAINING_PIPELINE_STAGE_CACHE_FILE_NAME_KEY])
+            training_pipeline_config = TrainingPipelineConfig(artifact_dir=artifact_dir,
+                                                              stage_cache_file_path=stage_cache_file_path,
+                                                              profile=training_pipeline_config[TRAINING_PIPELINE_PROFILE_KEY],
+                                                              profile_stages=training_pipeline_config[TRAINING_PIPELINE_PROFILE_STAGES_KEY])
             logging.info(f"Training Pipeline Config: {training_pipeline_config}")
             return training_pipeline_config
         except Exception as e:
@@ -13,16 +13,36 @@ CURRENT_TIME_STAMP = f"{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}"
 TRAINING_PIPELINE_CONFIG_KEY = "training_pipeline_config"
 TRAINING_PIPELINE_ARTIFACT_DIR_KEY = "artifact_dir"
 TRAINING_PIPELINE_NAME_KEY = "pipeline_name"
+TRAINING_PIPELINE_USE_STAGE_CACHE_KEY = "use_stage_cache"
+TRAINING_PIPELINE_STAGE_CACHE_FILE_NAME_KEY = "stage_cache_file_name"
+TRAINING_PIPELINE_PROFILE_KEY = "profile"
+TRAINING_PIPELINE_PROFILE_STAGES_KEY = "profile_stages"
+RUN_SUMMARY_DIR = "run_summary"
+RUN_METRICS_DIR = "run_metrics"
 
 # Data Ingestion related variables
 DATA_INGESTION_CONFIG_KEY = "data_ingestion_config"
 DATA_INGESTION_ARTIFACT_DIR = "data_ingestion"
 DATA_INGESTION_DOWNLOAD_URL_KEY = "dataset_download_url"
-DATA_INGESTION_RAW_DATA_DIR_KEY = "raw_data_dir"
 DATA_INGESTION_TGZ_DOWNLOAD_DIR_KEY = "tgz_download_dir"
 DATA_INGESTION_INGESTED_DIR_NAME_KEY = "ingested_dir"
 DATA_INGESTION_TRAIN_DIR_KEY = "ingested_train_dir"
 DATA_INGESTION_TEST_DIR_KEY = "ingested_test_dir"
+DATA_INGESTION_FILE_FORMAT_KEY = "ingested_file_format"
+DATA_INGESTION_EXPORT_CSV_KEY = "export_csv"
+DATA_INGESTION_BACKEND_KEY = "ingestion_backend"
+DATA_INGESTION_MIRROR_TO_DB_KEY = "mirror_to_db"
+DATA_INGESTION_CHUNK_SIZE_KEY = "ingestion_chunk_size"
+DATA_INGESTION_DB_BATCH_SIZE_KEY = "db_batch_size"
+DATA_INGESTION_DB_WRITER_THREADS_KEY = "db_writer_threads"
+DATA_INGESTION_DB_FETCH_MODE_KEY = "db_fetch_mode"
+DATA_INGESTION_DB_FETCH_BATCH_SIZE_KEY = "db_fetch_batch_size"
+DATA_INGESTION_DOWNLOAD_CACHE_DIR_KEY = "download_cache_dir"
+DATA_INGESTION_DOWNLOAD_SHA256_KEY = "download_sha256"
+DATA_INGESTION_DOWNLOAD_SEGMENTS_KEY = "download_segments"
+DATA_INGESTION_DOWNLOAD_PARALLEL_MIN_BYTES_KEY = "download_parallel_min_bytes"
+DATA_INGESTION_DOWNLOAD_TIMEOUT_KEY = "download_timeout"
+DATA_INGESTION_DOWNLOAD_RETRIES_KEY = "download_retries"
 
 # Database related variables
 DATABASE_CLIENT_URL_KEY = "mongodb://localhost:27017/?readPreference=primary&ssl=false&directConnection=true"
@@ -39,6 +59,12 @@ DATA_VALIDATION_SCHEMA_FILE_NAME_KEY = "schema_file_name"
 DATA_VALIDATION_SCHEMA_DIR_KEY = "schema_dir"
 DATA_VALIDATION_REPORT_FILE_NAME_KEY = "report_file_name"
 DATA_VALIDATION_REPORT_PAGE_FILE_NAME_KEY = "report_page_file_name"
+DATA_VALIDATION_SAVE_REPORT_PAGE_KEY = "save_report_page"
+DATA_VALIDATION_DRIFT_REFERENCE_FILE_NAME_KEY = "drift_reference_file_name"
+DATA_VALIDATION_DRIFT_N_BINS_KEY = "drift_n_bins"
+DATA_VALIDATION_DRIFT_P_VALUE_THRESHOLD_KEY = "drift_p_value_threshold"
+DATA_VALIDATION_DRIFT_PSI_THRESHOLD_KEY = "drift_psi_threshold"
+DATA_VALIDATION_DRIFT_SHARE_KEY = "drift_share"
 
 
 # Data Transformation related variables
@@ -50,6 +76,15 @@ DATA_TRANSFORMATION_TRAIN_DIR_NAME_KEY = "transformed_train_dir"
 DATA_TRANSFORMATION_TEST_DIR_NAME_KEY = "transformed_test_dir"
 DATA_TRANSFORMATION_PREPROCESSING_DIR_KEY = "preprocessing_dir"
 DATA_TRANSFORMATION_PREPROCESSED_FILE_NAME_KEY = "preprocessed_object_file_name"
+DATA_TRANSFORMATION_TARGET_ENCODER_FILE_NAME_KEY = "target_encoder_object_file_name"
+DATA_TRANSFORMATION_COMPILED_PREPROCESSED_FILE_NAME_KEY = "compiled_preprocessed_object_file_name"
+DATA_TRANSFORMATION_REBALANCING_STRATEGY_KEY = "rebalancing_strategy"
+DATA_TRANSFORMATION_REBALANCING_N_JOBS_KEY = "rebalancing_n_jobs"
+DATA_TRANSFORMATION_REBALANCING_CHUNK_SIZE_KEY = "rebalancing_chunk_size"
+DATA_TRANSFORMATION_REBALANCE_TEST_KEY = "rebalance_test"
+DATA_TRANSFORMATION_OUT_OF_CORE_KEY = "out_of_core"
+DATA_TRANSFORMATION_CHUNK_SIZE_KEY = "transformation_chunk_size"
+DATA_TRANSFORMATION_RESERVOIR_SIZE_KEY = "reservoir_size"
 
 DROP_COLUMN_KEY = 'drop_columns'
 NUMERICAL_COLUMN_KEY = "numerical_columns"
@@ -58,6 +93,7 @@ ORDINAL_COLUMN_KEY ="Oridnal_columns"
 TRANSFORM_COLUMN_KEY= "Transformation_columns"
 DATASET_SCHEMA_COLUMNS_KEY = "Columns"
 TARGET_COLUMN_KEY = "target_column"
+DATASET_SCHEMA_DOMAINS_KEY = "Domains"
 PIKLE_FOLDER_NAME_KEY = "prediction_files"
 
 
@@ -66,7 +102,26 @@ MODEL_TRAINER_CONFIG_KEY = "model_trainer_config"
 MODEL_TRAINER_ARTIFACT_DIR = "model_training"
 MODEL_TRAINER_TRAINED_MODEL_DIR = "trained_model_dir"
 MODEL_TRAINER_TRAINED_MODEL_FILE_NAME_KEY = "model_file_name"
+MODEL_TRAINER_EXPORTED_MODEL_DIR_KEY = "exported_model_dir"
+MODEL_TRAINER_MODEL_CANDIDATES_KEY = "model_candidates"
+MODEL_TRAINER_CANDIDATE_WORKERS_KEY = "candidate_workers"
+MODEL_TRAINER_SEARCH_MODE_KEY = "search_mode"
+MODEL_TRAINER_SEARCH_RESOURCE_KEY = "search_resource"
+MODEL_TRAINER_SEARCH_CV_KEY = "search_cv"
+MODEL_TRAINER_SEARCH_FACTOR_KEY = "search_factor"
+MODEL_TRAINER_SEARCH_TIME_BUDGET_KEY = "search_time_budget"
+MODEL_TRAINER_SEARCH_N_JOBS_KEY = "search_n_jobs"
+MODEL_TRAINER_OPTUNA_STUDY_NAME_KEY = "optuna_study_name"
+MODEL_TRAINER_OPTUNA_STORAGE_FILE_NAME_KEY = "optuna_storage_file_name"
+MODEL_TRAINER_OPTUNA_N_TRIALS_KEY = "optuna_n_trials"
+MODEL_TRAINER_OPTUNA_N_JOBS_KEY = "optuna_n_jobs"
+MODEL_TRAINER_OPTUNA_TIMEOUT_KEY = "optuna_timeout"
+MODEL_TRAINER_OPTUNA_PRUNER_KEY = "optuna_pruner"
 
 # Prediction Related variables
 PREDICTION_DATA_SAVING_FOLDER_KEY = "Prediction_Batch_Files"
+PREDICTION_CONFIG_KEY = "prediction_config"
+PREDICTION_CHUNK_SIZE_KEY = "prediction_chunk_size"
+PREDICTION_MAX_BATCH_SIZE_KEY = "max_batch_size"
+PREDICTION_MAX_BATCH_DELAY_MS_KEY = "max_batch_delay_ms"
 APP_SECRET_KEY = "any random string"
\ No newline at end of file
@@ -1,15 +1,19 @@
 from collections import namedtuple
 
 DataIngestionArtifact = namedtuple("DataIngestionArtifact",[
+    "archive_file_path",
     "train_file_path",
     "test_file_path",
     "is_ingested",
-    "message"])
+    "message",
+    "rows_per_second",
+    "peak_rss_mb"])
 
 DataValidationArtifact = namedtuple("DataValidationArtifact",[
     "schema_file_path",
     "report_file_path",
     "report_page_file_path",
+    "drift_reference_file_path",
     "is_validated",
     "message"])
 
@@ -18,11 +22,28 @@ DataTransformationArtifact = namedtuple("DataTransformationArtifact",[
     "message",
     "transformed_train_file_path",
     "transformed_test_file_path",
+    "transformed_train_target_file_path",
+    "transformed_test_target_file_path",
     "preprocessed_object_file_path",
+    "target_encoder_object_file_path",
+    "compiled_preprocessed_object_file_path",
+    "class_weights",
     ])
 
 ModelTrainerArtifact = namedtuple("ModelTrainerArtifact", [
     "is_trained", 
     "message",
-    "trained_model_object_file_path"
+    "trained_model_object_file_path",
+    "exported_model_dir",
+    "trials_per_second"
+])
+
+PredictionArtifact = namedtuple("PredictionArtifact", [
+    "input_file_path",
+    "prediction_file_path",
+    "drift_report_file_path",
+    "n_rows",
+    "rows_per_second",
+    "mean_chunk_latency_ms",
+    "max_chunk_latency_ms"
 ])
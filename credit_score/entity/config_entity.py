@@ -4,20 +4,50 @@ from collections import namedtuple
 DataIngestionConfig = namedtuple("DataIngestionConfig",[
     "dataset_download_url",
     "tgz_download_dir",
-    "raw_data_dir",
     "ingested_train_dir",
-    "ingested_test_dir"])
+    "ingested_test_dir",
+    "ingested_file_format",
+    "export_csv",
+    "ingestion_backend",
+    "mirror_to_db",
+    "chunk_size",
+    "db_batch_size",
+    "db_writer_threads",
+    "db_fetch_mode",
+    "db_fetch_batch_size",
+    "download_cache_dir",
+    "download_sha256",
+    "download_segments",
+    "download_parallel_min_bytes",
+    "download_timeout",
+    "download_retries",
+    "schema_file_path"])
 
 
 DataValidationConfig = namedtuple("DataValidationConfig",[
     "schema_file_path",
     "report_file_path",
-    "report_page_file_path"])
+    "report_page_file_path",
+    "save_report_page",
+    "drift_reference_file_path",
+    "drift_n_bins",
+    "drift_p_value_threshold",
+    "drift_psi_threshold",
+    "drift_share"])
 
 DataTransformationConfig = namedtuple("DataTransformationConfig",[
     "transformed_train_dir",
     "transformed_test_dir",
-    "preprocessed_object_file_path"])
+    "preprocessed_object_file_path",
+    "target_encoder_object_file_path",
+    "compiled_preprocessed_object_file_path",
+    "rebalancing_strategy",
+    "rebalancing_n_jobs",
+    "rebalancing_chunk_size",
+    "rebalance_test",
+    "out_of_core",
+    "chunk_size",
+    "reservoir_size"])
 
 DatabaseConfig = namedtuple("DatabaseConfig",[
     "client_url",
@@ -27,7 +57,35 @@ DatabaseConfig = namedtuple("DatabaseConfig",[
     "test_collection_name"])
 
 ModelTrainerConfig = namedtuple("ModelTrainerConfig",[
-    "trained_model_file_path"
+    "trained_model_file_path",
+    "exported_model_dir",
+    "model_candidates",
+    "candidate_workers",
+    "search_mode",
+    "search_resource",
+    "search_cv",
+    "search_factor",
+    "search_time_budget",
+    "search_n_jobs",
+    "optuna_study_name",
+    "optuna_storage_file_path",
+    "optuna_n_trials",
+    "optuna_n_jobs",
+    "optuna_timeout",
+    "optuna_pruner"
 ])
 
-TrainingPipelineConfig = namedtuple("TrainingPipelineConfig",["artifact_dir"])
\ No newline at end of file
+PredictionConfig = namedtuple("PredictionConfig",[
+    "preprocessed_object_file_path",
+    "compiled_preprocessed_object_file_path",
+    "trained_model_file_path",
+    "exported_model_dir",
+    "target_encoder_object_file_path",
+    "drift_reference_file_path",
+    "prediction_dir",
+    "chunk_size",
+    "max_batch_size",
+    "max_batch_delay_ms"])
+
+TrainingPipelineConfig = namedtuple("TrainingPipelineConfig",["artifact_dir", "stage_cache_file_path", "profile",
+                                                               "profile_stages"])
\ No newline at end of file
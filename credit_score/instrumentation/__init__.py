@@ -0,0 +1,253 @@
+"""
+Instrumentation of the hot paths of the pipeline.
+
+Every measured call records its wall time, process CPU time, resident set size (at start, at
+end and the process peak) and the number of rows it processed. The records of a run are kept
+in the `metrics` registry and saved as a json metrics file and in the Prometheus text format.
+
+    @instrument("download_data")
+    def download_data(self): ...
+
+    with measure("fit_transform", rows=len(dataframe)) as record:
+        ...
+
+    set_rows(len(dataframe))    # rows of the innermost measured call of the thread
+
+cProfile and tracemalloc captures of every measured call are opt-in, see `MetricsRegistry.configure`.
+"""
+from credit_score.logger import logging
+from credit_score.utils.utils import get_peak_rss_mb
+import contextlib
+import functools
+import json
+import os, sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+PROFILE_MODES = ("none", "cprofile", "tracemalloc", "all")
+
+_local = threading.local()
+
+
+def get_rss_mb() -> float:
+    """
+    Returns the current resident set size of the process in MB, None where /proc isn't available
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MetricsRegistry:
+    """
+    Records of the measured calls of one run, thread safe
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profile_lock = threading.Lock()
+        self.configure()
+
+    def configure(self, run_id: str = None, profile: str = "none", profile_stages: list = None,
+                  profile_dir: str = None) -> None:
+        """
+        Starts a new run.
+        profile: none, cprofile, tracemalloc or all, the captures made for every measured call
+        profile_stages: names of the measured calls to profile, all of them when empty
+        profile_dir: where the .prof and tracemalloc files are written
+        """
+        if profile not in PROFILE_MODES:
+            raise ValueError(f"Profile mode: [{profile}] is not one of {PROFILE_MODES}")
+        with self.lock:
+            self.run_id = run_id if run_id is not None else uuid.uuid4().hex[:12]
+            self.started_at = datetime.now().isoformat(timespec="seconds")
+            self.records = []
+            self.profile = profile
+            self.profile_stages = set(profile_stages or [])
+            self.profile_dir = profile_dir
+
+    def add(self, record: dict) -> None:
+        with self.lock:
+            self.records.append(record)
+
+    def extend(self, records: list) -> None:
+        """
+        Adds records measured in another process, e.g. a search worker
+        """
+        with self.lock:
+            self.records.extend(records)
+
+    def is_profiled(self, name: str) -> bool:
+        return self.profile != "none" and (len(self.profile_stages) == 0 or name in self.profile_stages)
+
+    def get_summary(self) -> dict:
+        """
+        Returns the totals of every measured name: calls, wall and cpu seconds, rows and peak RSS
+        """
+        with self.lock:
+            records = list(self.records)
+        summary = {}
+        for record in records:
+            stage = summary.setdefault(record["name"], {"count": 0, "errors": 0, "wall_seconds": 0.0,
+                                                        "max_wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                                        "rows": 0, "peak_rss_mb": 0.0})
+            stage["count"] += 1
+            stage["errors"] += record["status"] != "ok"
+            stage["wall_seconds"] += record["wall_seconds"]
+            stage["max_wall_seconds"] = max(stage["max_wall_seconds"], record["wall_seconds"])
+            stage["cpu_seconds"] += record["cpu_seconds"]
+            stage["rows"] += record["rows"] or 0
+            stage["peak_rss_mb"] = max(stage["peak_rss_mb"], record["peak_rss_mb"])
+        return summary
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            records = list(self.records)
+        return {"run_id": self.run_id, "started_at": self.started_at,
+                "summary": self.get_summary(), "records": records}
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the summary in the Prometheus text exposition format
+        """
+        metric_lines = {
+            "credit_score_stage_calls_total": ("counter", "Number of measured calls", "count"),
+            "credit_score_stage_errors_total": ("counter", "Number of measured calls which raised", "errors"),
+            "credit_score_stage_wall_seconds_total": ("counter", "Wall time of the measured calls", "wall_seconds"),
+            "credit_score_stage_wall_seconds_max": ("gauge", "Longest measured call", "max_wall_seconds"),
+            "credit_score_stage_cpu_seconds_total": ("counter", "Process CPU time of the measured calls", "cpu_seconds"),
+            "credit_score_stage_rows_total": ("counter", "Rows processed by the measured calls", "rows"),
+            "credit_score_stage_peak_rss_bytes": ("gauge", "Process peak RSS at the end of the measured calls", "peak_rss_mb"),
+        }
+        summary = self.get_summary()
+        lines = []
+        for metric_name, (metric_type, description, key) in metric_lines.items():
+            lines.append(f"# HELP {metric_name} {description}")
+            lines.append(f"# TYPE {metric_name} {metric_type}")
+            for name, stage in summary.items():
+                value = stage[key] * 1024 * 1024 if key == "peak_rss_mb" else stage[key]
+                lines.append(f'{metric_name}{{run_id="{self.run_id}",stage="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def save(self, file_path: str) -> tuple:
+        """
+        Writes the metrics json to file_path and the Prometheus text next to it (.prom),
+        returns both file paths
+        """
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w") as metrics_file:
+            json.dump(self.to_dict(), metrics_file, indent=4, default=str)
+        prometheus_file_path = f"{os.path.splitext(file_path)[0]}.prom"
+        with open(prometheus_file_path, "w") as prometheus_file:
+            prometheus_file.write(self.to_prometheus())
+        logging.info(f"Run metrics saved at: [{file_path}] and [{prometheus_file_path}]")
+        return file_path, prometheus_file_path
+
+
+metrics = MetricsRegistry()
+
+
+@contextlib.contextmanager
+def _profile(record: dict, registry: MetricsRegistry):
+    """
+    cProfile and/or tracemalloc capture of a measured call, skipped when another
+    measured call is already being profiled (only one profiler can be active)
+    """
+    if not registry.is_profiled(record["name"]) or not registry.profile_lock.acquire(blocking=False):
+        yield
+        return
+    profiler, started_tracemalloc = None, False
+    try:
+        import tracemalloc
+
+        file_prefix = os.path.join(registry.profile_dir or os.getcwd(),
+                                   f"{record['name']}_{record['pid']}_{int(record['started_at'] * 1000)}")
+        os.makedirs(os.path.dirname(file_prefix), exist_ok=True)
+        if registry.profile in ("tracemalloc", "all") and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracemalloc = True
+        if registry.profile in ("cprofile", "all"):
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        yield
+    finally:
+        try:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(f"{file_prefix}.prof")
+                record["profile_file_path"] = f"{file_prefix}.prof"
+            if started_tracemalloc:
+                record["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                top_stats = tracemalloc.take_snapshot().statistics("lineno")[:25]
+                tracemalloc.stop()
+                with open(f"{file_prefix}_tracemalloc.txt", "w") as tracemalloc_file:
+                    tracemalloc_file.write("\n".join(str(stat) for stat in top_stats))
+                record["tracemalloc_file_path"] = f"{file_prefix}_tracemalloc.txt"
+        finally:
+            registry.profile_lock.release()
+
+
+@contextlib.contextmanager
+def measure(name: str, rows: int = None, collect: bool = True, registry: MetricsRegistry = None, **labels):
+    """
+    Measures the block and yields its record, whose "rows" can still be set inside the block.
+    collect: add the record to the registry, False when it is returned to another process instead
+    labels: extra json serializable values saved with the record
+    """
+    registry = metrics if registry is None else registry
+    record = {"name": name, "labels": labels, "status": "ok", "rows": rows, "pid": os.getpid(),
+              "thread": threading.current_thread().name, "started_at": time.time(),
+              "rss_start_mb": get_rss_mb()}
+    stack = getattr(_local, "records", None)
+    if stack is None:
+        stack = _local.records = []
+    stack.append(record)
+    start_time, start_cpu_time = time.perf_counter(), time.process_time()
+    try:
+        with _profile(record, registry):
+            yield record
+    except BaseException:
+        record["status"] = "error"
+        raise
+    finally:
+        stack.pop()
+        record["wall_seconds"] = time.perf_counter() - start_time
+        record["cpu_seconds"] = time.process_time() - start_cpu_time
+        record["rss_end_mb"] = get_rss_mb()
+        # ru_maxrss can lag behind the current RSS
+        record["peak_rss_mb"] = max(get_peak_rss_mb() or 0.0, record["rss_end_mb"] or 0.0)
+        if record["rows"] is not None and record["wall_seconds"] > 0:
+            record["rows_per_second"] = record["rows"] / record["wall_seconds"]
+        if collect:
+            registry.add(record)
+        logging.info("[%s] %s in %.3fs wall, %.3fs cpu, rows: %s, peak RSS: %.1f MB", name, record["status"],
+                     record["wall_seconds"], record["cpu_seconds"], record["rows"], record["peak_rss_mb"])
+
+
+def instrument(name: str = None, **labels):
+    """
+    Decorator measuring every call of the function, under `name` (its qualified name by default)
+    """
+    def decorator(function):
+        measure_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with measure(measure_name, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_rows(rows: int) -> None:
+    """
+    Sets the rows of the innermost measured call of the current thread, if any
+    """
+    stack = getattr(_local, "records", None)
+    if stack:
+        stack[-1]["rows"] = int(rows)
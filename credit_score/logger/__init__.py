@@ -1,6 +1,29 @@
+"""
+Logging backend of the package.
+
+Components keep using the standard library api (`from credit_score.logger import logging`).
+Records are put on an in-memory queue by the caller and written to the log file by a
+background thread (QueueHandler/QueueListener), so a call never waits on the disk:
+
+    format   : one json object per line, with the run id and stage of the record
+               (`set_log_context`, `log_context`), "text" keeps the previous line format
+    rotation : the log file is rotated every LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT files
+    sampling : a record logged with extra={"sample": n} is only kept once every n calls of
+               its call site, for high-frequency events such as served batches
+
+Messages given with %-style arguments (`logging.info("%d rows", n)`) are only formatted
+when the record is kept, unlike f-strings.
+"""
 import os
 import logging
+import logging.handlers
+import atexit
+import contextlib
+import contextvars
+import json
+import queue
 import sys
+import threading
 from datetime import datetime
 
 
@@ -8,6 +31,10 @@ LOG_DIR = "logs"
 
 LOG_DIR = os.path.join(os.getcwd(), LOG_DIR)
 
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+TEXT_LOG_FORMAT = '[%(asctime)s] %(name)s - %(levelname)s - %(message)s'
+
 # creating a log directory if it doesn't exist
 os.makedirs(LOG_DIR,exist_ok= True)
 
@@ -18,8 +45,189 @@ file_name = f"log_{CURRENT_TIME_STAMP}.log"
 #Creating file path for projects.
 log_file_path = os.path.join(LOG_DIR, file_name)
 
+# Run id and stage added to every record, the run id is shared by all the threads of the
+# process, the stage is kept per thread/task
+_run_id = None
+_stage = contextvars.ContextVar("stage", default=None)
+
+# Attributes every LogRecord has, anything else was passed with `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "run_id", "stage", "sample"}
+
+
+def set_log_context(run_id: str = None, stage: str = None) -> None:
+    """
+    Sets the run id of the process and/or the stage of the current thread
+    """
+    global _run_id
+    if run_id is not None:
+        _run_id = run_id
+    if stage is not None:
+        _stage.set(stage)
+
+
+def get_log_stage() -> str:
+    return _stage.get()
+
+
+def get_log_run_id() -> str:
+    return _run_id
+
+
+@contextlib.contextmanager
+def log_context(stage: str):
+    """
+    Records logged inside the block have the given stage
+    """
+    token = _stage.set(stage)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = _run_id
+        record.stage = _stage.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps one of every `sample` records of a call site, for records logged with extra={"sample": n}
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample = getattr(record, "sample", None)
+        if sample is None or sample <= 1:
+            return True
+        key = (record.pathname, record.lineno)
+        with self.lock:
+            count = self.counts.get(key, 0)
+            self.counts[key] = count + 1
+        return count % sample == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one json line, with the fields passed in `extra`
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "run_id": getattr(record, "run_id", None),
+            "stage": getattr(record, "stage", None),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the message is merged with its arguments in the calling thread (they could
+        # change afterwards), formatting to json or text is left to the writer thread.
+        # The record is only handled by this handler, it is changed in place
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener = None
+_handler = None
+_options = {}
+
+
+def get_file_handler(log_format: str = "json", max_bytes: int = LOG_MAX_BYTES,
+                     backup_count: int = LOG_BACKUP_COUNT, rotate: bool = True, file_path: str = None) -> logging.Handler:
+    file_path = log_file_path if file_path is None else file_path
+    if rotate:
+        file_handler = logging.handlers.RotatingFileHandler(file_path, mode="a", maxBytes=max_bytes,
+                                                            backupCount=backup_count, delay=True)
+    else:
+        file_handler = logging.FileHandler(file_path, mode="a", delay=True)
+    file_handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_LOG_FORMAT))
+    return file_handler
+
+
+def setup_logging(log_format: str = "json", level: int = logging.INFO, max_bytes: int = LOG_MAX_BYTES,
+                  backup_count: int = LOG_BACKUP_COUNT, use_queue: bool = True, file_path: str = None) -> None:
+    """
+    (Re)configures the root logger: queue handler in the calling threads and file writer
+    thread, or the file handler alone without use_queue.
+    file_path: log file, the timestamped file of the logs directory by default
+    """
+    global _listener, _handler
+    stop_logging()
+    _options.update(log_format=log_format, level=level, max_bytes=max_bytes, backup_count=backup_count,
+                    file_path=file_path)
+
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        handler = _QueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(
+            log_queue, get_file_handler(log_format, max_bytes, backup_count, file_path=file_path),
+            respect_handler_level=True)
+        _listener.start()
+    else:
+        handler = get_file_handler(log_format, rotate=False, file_path=file_path)
+    handler.addFilter(SamplingFilter())
+    handler.addFilter(ContextFilter())
+
+    root_logger = logging.getLogger()
+    if _handler is not None:
+        root_logger.removeHandler(_handler)
+    _handler = handler
+    root_logger.addHandler(handler)
+    root_logger.setLevel(level)
+
+
+def get_logging_options() -> dict:
+    """
+    Returns the options of setup_logging in effect, with the log file resolved, for a
+    spawned worker process to write to the same log file
+    """
+    return {**_options, "file_path": _options.get("file_path") or log_file_path}
+
+
+def stop_logging() -> None:
+    """
+    Writes the queued records and stops the writer thread
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_in_child() -> None:
+    # A forked process has the queue but not the writer thread of its parent, and worker
+    # processes exit without running atexit: it writes to the file itself, appending
+    # without rotating it (only the parent rotates)
+    global _listener
+    _listener = None
+    setup_logging(**_options, use_queue=False)
+
 
-logging.basicConfig(filename=log_file_path,
-                    filemode='w',
-                    format='[%(asctime)s] %(name)s - %(levelname)s - %(message)s',
-                    level=logging.INFO)
+setup_logging()
+atexit.register(stop_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_in_child)
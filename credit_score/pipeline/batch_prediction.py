@@ -0,0 +1,243 @@
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from credit_score.config.Configuration import Configuration
+from credit_score.entity.config_entity import PredictionConfig
+from credit_score.entity.config_entity import DataValidationConfig
+from credit_score.entity.artifact_entity import PredictionArtifact
+from credit_score.components.data_validation import Prediction_validator
+from credit_score.components.tree_export import TreeEnsemble
+from credit_score.utils.utils import read_yaml_file
+from credit_score.utils.utils import load_object
+from credit_score.utils.utils import apply_schema_dtypes
+from credit_score.utils.utils import get_schema_read_dtypes
+from credit_score.utils.utils import get_schema_columns
+from credit_score.constant import *
+import pandas as pd
+import numpy as np
+import os, sys
+import time
+import argparse
+
+
+class BatchPrediction:
+    """
+    Scores csv files with the preprocessing object, trained model and target encoder
+    saved by the training pipeline. The objects are loaded once, the input file is read
+    and scored in chunks of `chunk_size` rows and every scored chunk is appended to the
+    output file, so the memory used doesn't depend on the size of the input file.
+    """
+
+    def __init__(self,
+                 prediction_config: PredictionConfig,
+                 data_validation_config: DataValidationConfig):
+        try:
+            logging.info(f"\n{'*'*20} Batch Prediction log started {'*'*20}\n")
+            self.prediction_config = prediction_config
+            self.data_validation_config = data_validation_config
+            self.dataset_schema = read_yaml_file(file_path=data_validation_config.schema_file_path)
+            self.target_column_name = self.dataset_schema[TARGET_COLUMN_KEY]
+
+            logging.info("Loading preprocessing object, trained model and target encoder")
+            # The compiled preprocessor, exported model and its class labels only need numpy.
+            # The sklearn/xgboost pickles, slow to import and load, are the fallback.
+            self.preprocessing_obj = None
+            self.compiled_preprocessing_obj = None
+            if os.path.exists(prediction_config.compiled_preprocessed_object_file_path):
+                self.compiled_preprocessing_obj = load_object(
+                    file_path=prediction_config.compiled_preprocessed_object_file_path)
+            else:
+                self.preprocessing_obj = load_object(file_path=prediction_config.preprocessed_object_file_path)
+            self.input_buffer = None
+
+            if os.path.exists(prediction_config.exported_model_dir):
+                self.model = TreeEnsemble(prediction_config.exported_model_dir)
+            else:
+                self.model = load_object(file_path=prediction_config.trained_model_file_path)
+
+            if getattr(self.model, "class_labels_", None) is not None:
+                self.target_classes = self.model.class_labels_
+            else:
+                self.target_classes = load_object(file_path=prediction_config.target_encoder_object_file_path).classes_
+            self.feature_columns = self.get_feature_columns()
+            self.read_dtypes = get_schema_read_dtypes(self.dataset_schema[DATASET_SCHEMA_COLUMNS_KEY],
+                                                      columns=self.feature_columns)
+            self.numerical_feature_columns = [column for column in self.feature_columns
+                                              if self.dataset_schema[DATASET_SCHEMA_COLUMNS_KEY].get(column)
+                                              != "category"]
+
+            # Drift of the scored data against the train data, when the training run saved a reference
+            self.drift_monitor = None
+            if os.path.exists(prediction_config.drift_reference_file_path):
+                self.drift_monitor = load_object(file_path=prediction_config.drift_reference_file_path)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_feature_columns(self) -> list:
+        """
+        Returns the input columns of the preprocessing object, in the order it was fitted with
+        """
+        try:
+            preprocessing_obj = self.compiled_preprocessing_obj or self.preprocessing_obj
+            if hasattr(preprocessing_obj, "feature_names_in_"):
+                return list(preprocessing_obj.feature_names_in_)
+            drop_columns = get_schema_columns(self.dataset_schema, DROP_COLUMN_KEY)
+            return [column for column in self.dataset_schema[DATASET_SCHEMA_COLUMNS_KEY]
+                    if column not in drop_columns and column != self.target_column_name]
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def cast_record(self, record: dict) -> dict:
+        """
+        Returns the feature values of a single row record, numerical columns cast to float.
+        Raises ValueError naming the missing columns or the numerical columns whose value
+        isn't a number, missing values (null) are left to the preprocessing object.
+        """
+        missing_columns = [column for column in self.feature_columns if column not in record]
+        if len(missing_columns) > 0:
+            raise ValueError(f"Columns: {missing_columns} are missing")
+        casted_record = {column: record[column] for column in self.feature_columns}
+        invalid_columns = []
+        for column in self.numerical_feature_columns:
+            value = casted_record[column]
+            try:
+                casted_value = np.nan if isinstance(value, bool) else pd.to_numeric(value, errors="coerce")
+            except (TypeError, ValueError):
+                casted_value = np.nan
+            if np.ndim(casted_value) != 0 or (pd.isna(casted_value) and not pd.isna(value)):
+                invalid_columns.append(column)
+                continue
+            casted_record[column] = float(casted_value)
+        if len(invalid_columns) > 0:
+            raise ValueError(f"Columns: {invalid_columns} must be numbers")
+        return casted_record
+
+    def get_input_buffer(self, n_rows: int) -> np.ndarray:
+        """
+        Returns a float32 buffer for the transformed features of `n_rows` rows, reused between
+        calls and only reallocated when a larger batch comes in
+        """
+        try:
+            if self.input_buffer is None or len(self.input_buffer) < n_rows:
+                self.input_buffer = np.empty((max(n_rows, self.prediction_config.chunk_size),
+                                              self.compiled_preprocessing_obj.n_features_out), dtype=np.float32)
+            return self.input_buffer[:n_rows]
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def predict(self, dataframe: pd.DataFrame) -> np.ndarray:
+        """
+        Returns the predicted class labels of every row of the dataframe.
+        Not thread safe when the compiled preprocessor is used, the input buffer is shared.
+        """
+        try:
+            if self.compiled_preprocessing_obj is not None:
+                input_arr = self.compiled_preprocessing_obj.transform(
+                    dataframe, out=self.get_input_buffer(len(dataframe)))
+            else:
+                features = apply_schema_dtypes(dataframe[self.feature_columns],
+                                               self.dataset_schema[DATASET_SCHEMA_COLUMNS_KEY])
+                input_arr = np.ascontiguousarray(self.preprocessing_obj.transform(features), dtype=np.float32)
+            return self.target_classes[self.model.predict(input_arr)]
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_prediction_file_path(self, input_file_path: str) -> str:
+        try:
+            file_name = os.path.splitext(os.path.basename(input_file_path))[0]
+            return os.path.join(self.prediction_config.prediction_dir,
+                                f"{file_name}_prediction_{CURRENT_TIME_STAMP}.csv")
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def initiate_batch_prediction(self, input_file_path: str, prediction_file_path: str = None) -> PredictionArtifact:
+        try:
+            logging.info(f"Validating prediction file: [{input_file_path}]")
+            prediction_validator = Prediction_validator(path=input_file_path,
+                                                        data_validation_config=self.data_validation_config,
+                                                        chunk_size=self.prediction_config.chunk_size)
+            if not prediction_validator.validate_dataset_schema():
+                raise Exception(f"Prediction file: [{input_file_path}] is not as per the schema")
+
+            if prediction_file_path is None:
+                prediction_file_path = self.get_prediction_file_path(input_file_path)
+            os.makedirs(os.path.dirname(prediction_file_path), exist_ok=True)
+            # Written under a temporary name, so that a failed run doesn't leave a partial prediction file
+            partial_file_path = f"{prediction_file_path}.part"
+
+            prediction_column_name = f"Predicted_{self.target_column_name}"
+            if self.drift_monitor is not None:
+                self.drift_monitor.reset()
+            chunk_latencies = []
+            n_rows = 0
+            start_time = time.perf_counter()
+            try:
+                with open(partial_file_path, "w", newline="") as prediction_file:
+                    for chunk_number, chunk in enumerate(pd.read_csv(input_file_path,
+                                                                     chunksize=self.prediction_config.chunk_size,
+                                                                     dtype=self.read_dtypes)):
+                        chunk_start_time = time.perf_counter()
+                        chunk[prediction_column_name] = self.predict(chunk)
+                        chunk.to_csv(prediction_file, header=chunk_number == 0, index=False)
+                        chunk_latencies.append(time.perf_counter() - chunk_start_time)
+                        if self.drift_monitor is not None:
+                            self.drift_monitor.update(chunk)
+                        n_rows += len(chunk)
+                        logging.info("Scored chunk: [%d] of %d rows in %.1fms", chunk_number, len(chunk),
+                                     chunk_latencies[-1] * 1000)
+                os.replace(partial_file_path, prediction_file_path)
+            finally:
+                # Left behind only when scoring failed
+                if os.path.exists(partial_file_path):
+                    os.remove(partial_file_path)
+            elapsed = time.perf_counter() - start_time
+
+            drift_report_file_path = None
+            if self.drift_monitor is not None:
+                drift_report_file_path = f"{os.path.splitext(prediction_file_path)[0]}_drift.json"
+                self.drift_monitor.save_report(drift_report_file_path)
+
+            prediction_artifact = PredictionArtifact(
+                input_file_path=input_file_path,
+                prediction_file_path=prediction_file_path,
+                drift_report_file_path=drift_report_file_path,
+                n_rows=n_rows,
+                rows_per_second=n_rows / elapsed if elapsed > 0 else 0.0,
+                mean_chunk_latency_ms=float(np.mean(chunk_latencies)) * 1000 if chunk_latencies else 0.0,
+                max_chunk_latency_ms=float(np.max(chunk_latencies)) * 1000 if chunk_latencies else 0.0)
+            logging.info(f"Batch Prediction Artifact: {prediction_artifact}")
+            return prediction_artifact
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def __del__(self):
+        logging.info(f"\n{'*'*20} Batch Prediction log completed {'*'*20}\n")
+
+
+def main():
+    try:
+        parser = argparse.ArgumentParser(description="Scores a csv file with the last trained model")
+        parser.add_argument("input_file_path")
+        parser.add_argument("--output", dest="prediction_file_path", default=None)
+        parser.add_argument("--chunk-size", dest="chunk_size", type=int, default=None)
+        args = parser.parse_args()
+
+        config = Configuration()
+        prediction_config = config.get_prediction_config()
+        if args.chunk_size is not None:
+            prediction_config = prediction_config._replace(chunk_size=args.chunk_size)
+
+        batch_prediction = BatchPrediction(prediction_config=prediction_config,
+                                           data_validation_config=config.get_data_validation_config())
+        prediction_artifact = batch_prediction.initiate_batch_prediction(
+            input_file_path=args.input_file_path,
+            prediction_file_path=args.prediction_file_path)
+        print(prediction_artifact)
+    except Exception as e:
+        # A failed job exits with an error status, for the scheduler running it
+        logging.error(f"{e}")
+        print(e)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+from credit_score.logger import logging
+from credit_score.logger import log_context
+from credit_score.logger import get_log_stage
+from credit_score.logger import get_log_run_id
+from credit_score.logger import get_logging_options
+from credit_score.logger import set_log_context
+from credit_score.logger import setup_logging
+from credit_score.exception import CustomException
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import namedtuple
+import multiprocessing
+import os, sys
+import time
+
+
+Task = namedtuple("Task", ["name", "function", "dependencies", "executor"])
+
+
+def _init_process_worker(logging_options: dict, run_id: str) -> None:
+    """
+    Initializer of the spawned worker processes: logs to the log file of the parent, written
+    directly without the writer thread, with the run id of the parent
+    """
+    setup_logging(**logging_options, use_queue=False)
+    set_log_context(run_id=run_id)
+
+
+def _timed_call(function, kwargs: dict, stage: str = None):
+    """
+    Runs the task function, with `stage` as the log stage, and returns its result along
+    with its wall time. Module level, so that it can be sent to a process pool.
+    """
+    with log_context(stage):
+        start_time = time.perf_counter()
+        result = function(**kwargs)
+        return result, time.perf_counter() - start_time
+
+
+class TaskGraph:
+    """
+    Small local DAG executor.
+
+    Every task is a function called with the results of its dependencies as keyword
+    arguments (named after the dependency tasks), so loaded objects such as DataFrames are
+    shared between tasks instead of being reloaded. Tasks whose dependencies are done run
+    concurrently, on a thread pool by default or on a process pool for `executor="process"`
+    (function and arguments then need to be picklable). Worker processes are spawned, as
+    forking would copy the locks held by the other threads. Wall time of each task is kept
+    in `timings`.
+    """
+
+    def __init__(self, name: str, max_workers: int = None):
+        try:
+            self.name = name
+            self.max_workers = max_workers or os.cpu_count()
+            self.tasks = {}
+            self.results = {}
+            self.timings = {}
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def add_task(self, name: str, function, dependencies: list = None, executor: str = "thread") -> None:
+        try:
+            dependencies = list(dependencies or [])
+            for dependency in dependencies:
+                if dependency not in self.tasks:
+                    raise Exception(f"Dependency: [{dependency}] of task: [{name}] is not in the graph: [{self.name}]")
+            self.tasks[name] = Task(name=name, function=function, dependencies=dependencies, executor=executor)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def run(self) -> dict:
+        """
+        Runs every task of the graph and returns the dict of task name -> result
+        """
+        try:
+            pending = dict(self.tasks)
+            running = {}
+            uses_processes = any(task.executor == "process" for task in self.tasks.values())
+            process_pool = None
+            if uses_processes:
+                process_pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                   mp_context=multiprocessing.get_context("spawn"),
+                                                   initializer=_init_process_worker,
+                                                   initargs=(get_logging_options(), get_log_run_id()))
+            # Log stage of the tasks, nested under the stage running the graph if any
+            parent_stage = get_log_stage()
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as thread_pool:
+                try:
+                    while pending or running:
+                        ready = [task for task in pending.values()
+                                 if all(dependency in self.results for dependency in task.dependencies)]
+                        for task in ready:
+                            kwargs = {dependency: self.results[dependency] for dependency in task.dependencies}
+                            pool = process_pool if task.executor == "process" else thread_pool
+                            logging.info("[%s] starting task: [%s]", self.name, task.name)
+                            stage = task.name if parent_stage is None else f"{parent_stage}.{task.name}"
+                            running[pool.submit(_timed_call, task.function, kwargs, stage)] = task.name
+                            del pending[task.name]
+
+                        if not running:
+                            raise Exception(f"Tasks: {list(pending)} of graph: [{self.name}] have circular dependencies")
+
+                        done, _ = wait(running, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            task_name = running.pop(future)
+                            self.results[task_name], self.timings[task_name] = future.result()
+                            logging.info("[%s] task: [%s] completed in %.2fs", self.name, task_name,
+                                         self.timings[task_name])
+                except Exception:
+                    for future in running:
+                        future.cancel()
+                    raise
+                finally:
+                    if process_pool is not None:
+                        process_pool.shutdown(wait=True)
+
+            return self.results
+        except Exception as e:
+            raise CustomException(e, sys) from e
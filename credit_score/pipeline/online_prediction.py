@@ -0,0 +1,190 @@
+from credit_score.logger import logging
+from credit_score.logger import set_log_context
+from credit_score.exception import CustomException
+from concurrent.futures import Future
+from collections import deque
+import pandas as pd
+import numpy as np
+import os, sys
+import queue
+import threading
+import time
+
+
+class ServingMetrics:
+    """
+    Thread safe latency and batch size metrics of the online prediction server.
+    Latency percentiles are computed over the last `window_size` requests, batch sizes
+    are counted in power of two buckets.
+    """
+
+    def __init__(self, max_batch_size: int, window_size: int = 10000):
+        try:
+            self.lock = threading.Lock()
+            self.request_latencies = deque(maxlen=window_size)
+            self.batch_latencies = deque(maxlen=window_size)
+            self.n_requests = 0
+            self.n_batches = 0
+            self.batch_size_buckets = [2 ** i for i in range(int(np.ceil(np.log2(max(max_batch_size, 1)))) + 1)]
+            self.batch_size_counts = [0] * len(self.batch_size_buckets)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def add_request(self, latency: float) -> None:
+        with self.lock:
+            self.n_requests += 1
+            self.request_latencies.append(latency)
+
+    def add_batch(self, batch_size: int, latency: float) -> None:
+        with self.lock:
+            self.n_batches += 1
+            self.batch_latencies.append(latency)
+            bucket = int(np.searchsorted(self.batch_size_buckets, batch_size))
+            self.batch_size_counts[min(bucket, len(self.batch_size_counts) - 1)] += 1
+
+    @staticmethod
+    def get_percentiles_ms(latencies) -> dict:
+        if len(latencies) == 0:
+            return {"p50": None, "p99": None}
+        p50, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 99])
+        return {"p50": float(p50), "p99": float(p99)}
+
+    def to_dict(self) -> dict:
+        try:
+            with self.lock:
+                request_latencies = list(self.request_latencies)
+                batch_latencies = list(self.batch_latencies)
+                batch_size_histogram = {f"<={bucket}": count for bucket, count
+                                        in zip(self.batch_size_buckets, self.batch_size_counts)}
+                n_requests, n_batches = self.n_requests, self.n_batches
+            return {
+                "requests": n_requests,
+                "batches": n_batches,
+                "request_latency_ms": self.get_percentiles_ms(request_latencies),
+                "batch_latency_ms": self.get_percentiles_ms(batch_latencies),
+                "batch_size_histogram": batch_size_histogram
+            }
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+
+# One of every BATCH_LOG_SAMPLE scored micro-batches is logged
+BATCH_LOG_SAMPLE = 100
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single row prediction requests into micro-batches.
+
+    Every submitted row is put on a queue and a background thread builds a batch from the
+    first waiting row and the rows arriving within `max_batch_delay_ms` of it (at most
+    `max_batch_size` rows), then runs `predict_function` once on the batch dataframe and
+    resolves the future of every row with its own prediction.
+    `batch_callback`, when given, is called with every scored batch dataframe by its own
+    thread, so that it doesn't add to the latency of the requests queued behind the batch.
+    At most `max_pending_callbacks` batches wait for it, the batches arriving while it is
+    that far behind are skipped (counted in `n_skipped_callbacks`) rather than slowing
+    down scoring.
+    """
+
+    def __init__(self, predict_function, max_batch_size: int = 64, max_batch_delay_ms: float = 5,
+                 metrics: ServingMetrics = None, batch_callback=None, max_pending_callbacks: int = 64):
+        try:
+            self.predict_function = predict_function
+            self.max_batch_size = max_batch_size
+            self.max_batch_delay = max_batch_delay_ms / 1000
+            self.metrics = metrics or ServingMetrics(max_batch_size=max_batch_size)
+            self.batch_callback = batch_callback
+            self.requests = queue.Queue()
+            self.callback_batches = queue.Queue(maxsize=max_pending_callbacks)
+            self.n_skipped_callbacks = 0
+            if batch_callback is not None:
+                self.callback_worker = threading.Thread(target=self.run_callbacks, name="batch-callback",
+                                                        daemon=True)
+                self.callback_worker.start()
+            self.worker = threading.Thread(target=self.run, name="micro-batcher", daemon=True)
+            self.worker.start()
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def submit(self, record: dict) -> Future:
+        """
+        Queues one row for prediction and returns the future of its prediction
+        """
+        future = Future()
+        self.requests.put((record, future))
+        return future
+
+    def get_batch(self) -> list:
+        """
+        Waits for the first request and collects the ones arriving before the batch deadline
+        """
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_batch_delay
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def score_rows(self, batch: list) -> list:
+        """
+        Scores the rows of a failed batch one at a time, so that only the futures of the
+        rows failing on their own get the exception. Returns the records scored
+        """
+        scored_records = []
+        for record, future in batch:
+            try:
+                prediction = self.predict_function(pd.DataFrame.from_records([record]))[0]
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            future.set_result(prediction)
+            scored_records.append(record)
+        return scored_records
+
+    def run(self) -> None:
+        set_log_context(stage="serving")
+        while True:
+            batch = self.get_batch()
+            records = [record for record, _ in batch]
+            start_time = time.perf_counter()
+            try:
+                dataframe = pd.DataFrame.from_records(records)
+                predictions = self.predict_function(dataframe)
+                for (_, future), prediction in zip(batch, predictions):
+                    future.set_result(prediction)
+            except Exception as e:
+                logging.error("Prediction of a batch of %d rows failed, scoring its rows one at a time: %s",
+                              len(batch), e)
+                records = self.score_rows(batch)
+                dataframe = pd.DataFrame.from_records(records) if len(records) > 0 else None
+            finally:
+                batch_latency = time.perf_counter() - start_time
+                self.metrics.add_batch(len(batch), batch_latency)
+            logging.info("Scored micro-batch of %d rows in %.2fms", len(batch), batch_latency * 1000,
+                         extra={"sample": BATCH_LOG_SAMPLE})
+
+            if self.batch_callback is not None and dataframe is not None:
+                try:
+                    self.callback_batches.put_nowait(dataframe)
+                except queue.Full:
+                    self.n_skipped_callbacks += 1
+                    logging.warning("Batch callback is %d batches behind, skipped a batch of %d rows",
+                                    self.callback_batches.maxsize, len(dataframe),
+                                    extra={"sample": BATCH_LOG_SAMPLE})
+
+    def run_callbacks(self) -> None:
+        set_log_context(stage="serving")
+        while True:
+            dataframe = self.callback_batches.get()
+            try:
+                self.batch_callback(dataframe)
+            except Exception as e:
+                logging.error("Batch callback failed: %s", e)
+            finally:
+                self.callback_batches.task_done()
@@ -0,0 +1,73 @@
+from credit_score.logger import logging
+from credit_score.exception import CustomException
+from credit_score.utils.utils import get_file_hash
+import hashlib
+import importlib.util
+import json
+import os, sys
+
+
+class StageCache:
+    """
+    Content addressed cache of pipeline stage artifacts.
+
+    Every stage is keyed by the hash of its inputs (data file hashes, schema hash, its config
+    section and the source of the code that runs it). The artifact of the last run with the
+    same key is reused, as long as every file it points to still exists.
+    """
+
+    def __init__(self, cache_file_path: str):
+        try:
+            self.cache_file_path = cache_file_path
+            self.index = {}
+            if os.path.exists(cache_file_path):
+                with open(cache_file_path, "r") as cache_file:
+                    self.index = json.load(cache_file)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_code_hash(self, *module_names) -> str:
+        """
+        Returns a hash of the source files of the given modules, found without importing them
+        """
+        try:
+            sha256 = hashlib.sha256()
+            for module_name in module_names:
+                sha256.update(get_file_hash(importlib.util.find_spec(module_name).origin).encode())
+            return sha256.hexdigest()
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get_stage_key(self, inputs: dict) -> str:
+        try:
+            return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def get(self, stage_name: str, key: str, artifact_class):
+        """
+        Returns the cached artifact of the stage for the key, None on a cache miss
+        """
+        try:
+            cached = self.index.get(stage_name, {}).get(key)
+            if cached is None:
+                return None
+            if set(cached) != set(artifact_class._fields):
+                logging.info(f"Cached {stage_name} artifact has different fields than {artifact_class.__name__}")
+                return None
+            for field, value in cached.items():
+                if field.endswith(("_path", "_dir")) and isinstance(value, str) and not os.path.exists(value):
+                    logging.info(f"Cached {stage_name} artifact is stale, [{value}] does not exist anymore")
+                    return None
+            return artifact_class(**cached)
+        except Exception as e:
+            raise CustomException(e, sys) from e
+
+    def put(self, stage_name: str, key: str, artifact) -> None:
+        try:
+            self.index.setdefault(stage_name, {})[key] = artifact._asdict()
+            os.makedirs(os.path.dirname(self.cache_file_path), exist_ok=True)
+            with open(self.cache_file_path, "w") as cache_file:
+                json.dump(self.index, cache_file, indent=4)
+        except Exception as e:
+            raise CustomException(e, sys) from e
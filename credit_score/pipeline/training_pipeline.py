@@ -6,6 +6,7 @@ from typing import List
 from multiprocessing import Process
 from credit_score.config.Configuration import Configuration
 from credit_score.logger import logging
+from credit_score.logger import set_log_context
 from credit_score.exception import CustomException
 from credit_score.entity.config_entity import DataIngestionConfig
 from credit_score.entity.config_entity import DataValidationConfig
@@ -15,26 +16,106 @@ from credit_score.entity.artifact_entity import DataIngestionArtifact
 from credit_score.entity.artifact_entity import ModelTrainerArtifact
 from credit_score.entity.artifact_entity import DataValidationArtifact
 from credit_score.entity.artifact_entity import DataTransformationArtifact
-from credit_score.components.data_ingestion import DataIngestion
-from credit_score.components.data_validation import DataValidaton
-from credit_score.components.data_transformation import DataTransformation
-from credit_score.components.model_trainer import ModelTrainer
+from credit_score.pipeline.stage_cache import StageCache
+from credit_score.pipeline.executor import TaskGraph
+from credit_score.utils.utils import get_file_hash
+from credit_score.instrumentation import metrics
+from credit_score.constant import *
 import os, sys
+import json
+import shutil
 import pandas as pd
 
 class Pipeline():
 
-    def __init__(self,config: Configuration=Configuration())->None:
+    def __init__(self,config: Configuration=None, db=None)->None:
+        """
+        db: MongoDB used by the data ingestion, a connection to the configured server by default
+        """
         try:
             logging.info(f"\n{'*'*20} Initiating the Training Pipeline {'*'*20}\n\n")
-            self.config = config
+            # Built here instead of as default argument, not to read config.yaml at import time
+            self.config = Configuration() if config is None else config
+            self.db = db
+            self.data_ingestion = None
+
+            stage_cache_file_path = self.config.training_pipeline_config.stage_cache_file_path
+            self.stage_cache = None if stage_cache_file_path is None else StageCache(stage_cache_file_path)
+            self.schema_file_path = self.config.get_data_validation_config().schema_file_path
+
+            set_log_context(run_id=self.config.time_stamp)
+
+            # Measured calls of this run are saved next to the run summary
+            training_pipeline_config = self.config.training_pipeline_config
+            self.run_metrics_file_path = os.path.join(training_pipeline_config.artifact_dir, RUN_METRICS_DIR,
+                                                      f"{self.config.time_stamp}.json")
+            metrics.configure(run_id=self.config.time_stamp,
+                              profile=training_pipeline_config.profile,
+                              profile_stages=training_pipeline_config.profile_stages,
+                              profile_dir=os.path.join(training_pipeline_config.artifact_dir, RUN_METRICS_DIR,
+                                                       f"{self.config.time_stamp}_profile"))
+        except Exception as e:
+            raise CustomException(e,sys) from e
+
+    def run_cached_stage(self, stage_name:str, inputs:dict, artifact_class, run_stage):
+        """
+        Returns the cached artifact of the stage when its inputs are unchanged,
+        otherwise runs the stage and caches its artifact.
+
+        inputs: everything the stage output depends on, as returned by get_stage_inputs
+        run_stage: function running the stage and returning its artifact
+        """
+        try:
+            if self.stage_cache is None:
+                return run_stage()
+
+            key = self.stage_cache.get_stage_key(inputs)
+            artifact = self.stage_cache.get(stage_name, key, artifact_class)
+            if artifact is not None:
+                logging.info(f"Inputs of stage: [{stage_name}] unchanged, reusing cached artifact: {artifact}")
+                return artifact
+
+            artifact = run_stage()
+            self.stage_cache.put(stage_name, key, artifact)
+            return artifact
+        except Exception as e:
+            raise CustomException(e,sys) from e
+
+    def get_stage_inputs(self, config_key:str, file_paths:list, module_names:list) -> dict:
+        """
+        Returns the cache inputs of a stage: hashes of its data files and of the schema,
+        its config section from config.yaml and the hash of the code it runs (module_names).
+        Nothing is hashed when the stage cache is disabled.
+        """
+        try:
+            if self.stage_cache is None:
+                return {}
+            inputs = {
+                "data": [get_file_hash(file_path) for file_path in file_paths],
+                "schema": get_file_hash(self.schema_file_path),
+                "config": self.config.config_info[config_key],
+                "code": self.stage_cache.get_code_hash(*module_names, "credit_score.utils.utils"),
+            }
+            return inputs
         except Exception as e:
             raise CustomException(e,sys) from e
 
     def start_data_ingestion(self,data_ingestion_config:DataIngestionConfig)->DataIngestionArtifact:
         try:
-            data_ingestion = DataIngestion(data_ingestion_config = data_ingestion_config)
-            return data_ingestion.initiate_data_ingestion()
+            # Components are imported by the stage running them, each pulls in heavy libraries
+            from credit_score.components.data_ingestion import DataIngestion
+
+            data_ingestion = DataIngestion(data_ingestion_config = data_ingestion_config, db = self.db)
+            # Kept to wait for its background mirroring into the DB at the end of the run
+            self.data_ingestion = data_ingestion
+            # Downloading first, so that the downloaded archive is part of the cache key
+            tgz_file_path = data_ingestion.download_data()
+            inputs = self.get_stage_inputs(DATA_INGESTION_CONFIG_KEY, [tgz_file_path],
+                                           ["credit_score.components.data_ingestion",
+                                            "credit_score.components.archive_reader",
+                                            "credit_score.components.db_operation"])
+            return self.run_cached_stage("data_ingestion", inputs, DataIngestionArtifact,
+                                         lambda: data_ingestion.initiate_data_ingestion(tgz_file_path=tgz_file_path))
         except Exception as e:
             raise CustomException(e,sys) from e
 
@@ -42,49 +123,167 @@ class Pipeline():
     def start_data_validation(self, data_ingestion_config:DataIngestionConfig,
                                     data_ingestion_artifact:DataIngestionArtifact)->DataValidationArtifact:
         try:
+            from credit_score.components.data_validation import DataValidaton
+
             data_validation = DataValidaton(data_validation_config=self.config.get_data_validation_config(),
                                              data_ingestion_config = data_ingestion_config,
                                              data_ingestion_artifact=data_ingestion_artifact)
-            return data_validation.initiate_data_validation()
+            inputs = self.get_stage_inputs(DATA_VALIDATION_CONFIG_KEY,
+                                           [data_ingestion_artifact.train_file_path,
+                                            data_ingestion_artifact.test_file_path],
+                                           ["credit_score.components.data_validation",
+                                            "credit_score.components.drift_monitor",
+                                            "credit_score.components.archive_reader",
+                                            "credit_score.components.schema_validator"])
+            return self.run_cached_stage("data_validation", inputs, DataValidationArtifact,
+                                         data_validation.initiate_data_validation)
         except Exception as e:
             raise CustomException(e,sys) from e
         
     def start_data_transformation(self,data_ingestion_artifact: DataIngestionArtifact,
                                        data_validation_artifact: DataValidationArtifact) -> DataTransformationArtifact:
         try:
+            from credit_score.components.data_transformation import DataTransformation
+
             data_transformation = DataTransformation(
                 data_transformation_config = self.config.get_data_transformation_config(),
                 data_ingestion_artifact = data_ingestion_artifact,
                 data_validation_artifact = data_validation_artifact)
 
-            return data_transformation.initiate_data_transformation()
+            inputs = self.get_stage_inputs(DATA_TRANSFORMATION_CONFIG_KEY,
+                                           [data_ingestion_artifact.train_file_path,
+                                            data_ingestion_artifact.test_file_path],
+                                           ["credit_score.components.data_transformation",
+                                            "credit_score.components.compiled_transformer",
+                                            "credit_score.components.rebalancing",
+                                            "credit_score.components.streaming_preprocessor"])
+            return self.run_cached_stage("data_transformation", inputs, DataTransformationArtifact,
+                                         data_transformation.initiate_data_transformation)
         except Exception as e:
             raise CustomException(e,sys) from e
         
     def start_model_training(self,data_transformation_artifact: DataTransformationArtifact) -> ModelTrainerArtifact:
         try:
+            from credit_score.components.model_trainer import ModelTrainer
+
             model_trainer = ModelTrainer(model_trainer_config=self.config.get_model_trainer_config(),
                                         data_transformation_artifact=data_transformation_artifact)   
 
-            return model_trainer.initiate_model_training()
+            inputs = self.get_stage_inputs(MODEL_TRAINER_CONFIG_KEY,
+                                           [data_transformation_artifact.transformed_train_file_path,
+                                            data_transformation_artifact.transformed_test_file_path,
+                                            data_transformation_artifact.transformed_train_target_file_path,
+                                            data_transformation_artifact.transformed_test_target_file_path],
+                                           ["credit_score.components.model_trainer",
+                                            "credit_score.components.hyperparameter_search",
+                                            "credit_score.components.tree_export"])
+            return self.run_cached_stage("model_training", inputs, ModelTrainerArtifact,
+                                         model_trainer.initiate_model_training)
         except Exception as e:
             raise CustomException(e,sys) from e  
 
      
 
+    def publish_prediction_files(self, artifacts:dict) -> None:
+        """
+        Copies the objects used for prediction from the final artifacts of the run to
+        prediction_files, once every stage succeeded. Stages reused from the stage cache
+        publish their cached objects, so the preprocessing, drift reference and model
+        served always come from the same run. Every file is replaced at once.
+        """
+        try:
+            prediction_config = self.config.get_prediction_config()
+            data_validation_artifact = artifacts["data_validation"]
+            data_transformation_artifact = artifacts["data_transformation"]
+            model_trainer_artifact = artifacts["model_training"]
+
+            published_files = [
+                (data_validation_artifact.drift_reference_file_path, prediction_config.drift_reference_file_path),
+                (data_transformation_artifact.preprocessed_object_file_path,
+                 prediction_config.preprocessed_object_file_path),
+                (data_transformation_artifact.compiled_preprocessed_object_file_path,
+                 prediction_config.compiled_preprocessed_object_file_path),
+                (data_transformation_artifact.target_encoder_object_file_path,
+                 prediction_config.target_encoder_object_file_path),
+                (model_trainer_artifact.trained_model_object_file_path, prediction_config.trained_model_file_path)]
+            for source_file_path, prediction_file_path in published_files:
+                os.makedirs(os.path.dirname(prediction_file_path), exist_ok=True)
+                shutil.copyfile(source_file_path, f"{prediction_file_path}.tmp")
+                os.replace(f"{prediction_file_path}.tmp", prediction_file_path)
+
+            # The export is published with its model, an older export must not stay next to a new model
+            exported_model_dir = prediction_config.exported_model_dir
+            shutil.rmtree(f"{exported_model_dir}.tmp", ignore_errors=True)
+            if model_trainer_artifact.exported_model_dir is not None:
+                shutil.copytree(model_trainer_artifact.exported_model_dir, f"{exported_model_dir}.tmp")
+            shutil.rmtree(exported_model_dir, ignore_errors=True)
+            if model_trainer_artifact.exported_model_dir is not None:
+                os.replace(f"{exported_model_dir}.tmp", exported_model_dir)
+            logging.info(f"Prediction files published to: [{os.path.dirname(prediction_config.trained_model_file_path)}]")
+        except Exception as e:
+            raise CustomException(e,sys) from e
+
+    def save_run_summary(self, artifacts:dict, timings:dict) -> dict:
+        """
+        Logs the wall time of every stage and writes the run summary, with the stage
+        timings and artifacts, to <artifact_dir>/run_summary/<time stamp>.json and the
+        run metrics to <artifact_dir>/run_metrics/<time stamp>.json and .prom
+        """
+        try:
+            metrics_file_path, prometheus_file_path = metrics.save(self.run_metrics_file_path)
+            summary = {
+                "time_stamp": self.config.time_stamp,
+                "total_seconds": sum(timings.values()),
+                "metrics_file_path": metrics_file_path,
+                "prometheus_file_path": prometheus_file_path,
+                "stages": {stage_name: {"seconds": timings[stage_name],
+                                        "artifact": artifacts[stage_name]._asdict()}
+                           for stage_name in timings}
+            }
+            for stage_name, seconds in timings.items():
+                logging.info(f"Stage: [{stage_name}] took {seconds:.2f}s")
+
+            run_summary_file_path = os.path.join(self.config.training_pipeline_config.artifact_dir,
+                                                 RUN_SUMMARY_DIR, f"{self.config.time_stamp}.json")
+            os.makedirs(os.path.dirname(run_summary_file_path), exist_ok=True)
+            with open(run_summary_file_path, "w") as run_summary_file:
+                json.dump(summary, run_summary_file, indent=4, default=str)
+            logging.info(f"Run summary saved at: [{run_summary_file_path}]")
+            return summary
+        except Exception as e:
+            raise CustomException(e,sys) from e
+
     def run_pipeline(self):
         try:
             data_ingestion_config=self.config.get_data_ingestion_config()
 
-            data_ingestion_artifact = self.start_data_ingestion(data_ingestion_config)
+            pipeline_graph = TaskGraph(name="training_pipeline")
+            pipeline_graph.add_task("data_ingestion",
+                                    lambda: self.start_data_ingestion(data_ingestion_config))
+            pipeline_graph.add_task("data_validation",
+                                    lambda data_ingestion: self.start_data_validation(
+                                        data_ingestion_config=data_ingestion_config,
+                                        data_ingestion_artifact=data_ingestion),
+                                    dependencies=["data_ingestion"])
+            pipeline_graph.add_task("data_transformation",
+                                    lambda data_ingestion, data_validation: self.start_data_transformation(
+                                        data_ingestion_artifact=data_ingestion,
+                                        data_validation_artifact=data_validation),
+                                    dependencies=["data_ingestion", "data_validation"])
+            pipeline_graph.add_task("model_training",
+                                    lambda data_transformation: self.start_model_training(
+                                        data_transformation_artifact=data_transformation),
+                                    dependencies=["data_transformation"])
 
-            data_validation_artifact = self.start_data_validation(data_ingestion_config=data_ingestion_config,
-                                                            data_ingestion_artifact=data_ingestion_artifact)
-            
-            data_transformation_artifact = self.start_data_transformation(data_ingestion_artifact=data_ingestion_artifact,
-                                                             data_validation_artifact=data_validation_artifact)
-            
-            model_trainer_artifact = self.start_model_training(data_transformation_artifact=data_transformation_artifact)
+            try:
+                artifacts = pipeline_graph.run()
+            finally:
+                # The mirroring thread runs alongside the later stages, it is joined here
+                # so that the run doesn't end before its DB writes
+                if self.data_ingestion is not None:
+                    self.data_ingestion.wait_for_mirror()
+            self.publish_prediction_files(artifacts)
+            return self.save_run_summary(artifacts, pipeline_graph.timings)
         except Exception as e:
             raise CustomException(e, sys) from e
         
@@ -1,6 +1,7 @@
 import yaml
 from credit_score.exception import CustomException
 import os,sys
+import hashlib
 import dill
 import pandas as pd
 import numpy as np
@@ -34,6 +35,22 @@ def read_yaml_file(file_path:str)->dict:
     except Exception as e:
         raise CustomException(e,sys) from e
     
+def get_schema_columns(dataset_schema:dict, key:str) -> list:
+    """
+    Returns the list of column names stored under `key` in the schema.
+    Column groups in schema.yaml are written as plain multi-line scalars,
+    which yaml loads as one space separated string.
+    """
+    try:
+        columns = dataset_schema.get(key)
+        if columns is None:
+            return []
+        if isinstance(columns, str):
+            return columns.split()
+        return list(columns)
+    except Exception as e:
+        raise CustomException(e,sys) from e
+
 def save_numpy_array_data(file_path: str, array: np.array):
     """
     Save numpy array data to file
@@ -57,35 +74,204 @@ def save_object(file_path:str,obj):
     except Exception as e:
         raise CustomException(e,sys) from e
     
-def load_data(file_path: str, schema_file_path: str) -> pd.DataFrame:
+def get_schema_read_dtypes(schema_columns: dict, columns: list = None) -> dict:
+    """
+    Returns the `read_csv` dtype map of the `Columns` section of the schema: category columns are
+    parsed straight into categoricals and float columns into float64. int columns are left to
+    the parser, as they can have missing values.
+    columns: only these columns are put in the map
+    """
+    try:
+        read_dtypes = {}
+        for column, column_type in schema_columns.items():
+            if columns is not None and column not in columns:
+                continue
+            if column_type == "category":
+                read_dtypes[column] = "category"
+            elif column_type in ("float", "float64"):
+                read_dtypes[column] = "float64"
+        return read_dtypes
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+def downcast_numeric_dtypes(dataframe: pd.DataFrame, columns: list = None) -> pd.DataFrame:
+    """
+    Downcasts the numeric columns of the dataframe where no value changes:
+    integer columns to int32 when their range fits and float columns to float32 when
+    every value is exactly representable in float32.
+    columns: only these columns are downcast, all the numeric ones by default
+    """
+    try:
+        dtypes = {}
+        for column in (dataframe.columns if columns is None else columns):
+            values = dataframe[column]
+            if pd.api.types.is_integer_dtype(values.dtype) and values.dtype.itemsize > 4:
+                if len(values) == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max):
+                    dtypes[column] = np.int32
+            elif pd.api.types.is_float_dtype(values.dtype) and values.dtype.itemsize > 4:
+                array = values.to_numpy()
+                if np.array_equal(array.astype(np.float32).astype(array.dtype), array, equal_nan=True):
+                    dtypes[column] = np.float32
+        return dataframe.astype(dtypes) if len(dtypes) > 0 else dataframe
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+def apply_schema_dtypes(dataframe: pd.DataFrame, schema_columns: dict, downcast: bool = False) -> pd.DataFrame:
+    """
+    Casts the columns of the dataframe to the types defined in the `Columns` section of the schema.
+    int columns having missing values are kept as float64.
+    downcast: numeric schema columns are then downcast to 32 bits wherever it is lossless
+    """
+    try:
+        dtypes = {}
+        for column in dataframe.columns:
+            column_type = schema_columns.get(column)
+            if column_type is None:
+                continue
+            if column_type == "int" and dataframe[column].isna().any():
+                column_type = "float64"
+            # Columns of the right kind are kept as they are, they can already be downcast
+            dtype = dataframe[column].dtype
+            if (column_type == "category" and isinstance(dtype, pd.CategoricalDtype)) or \
+               (column_type in ("int", "int32", "int64") and pd.api.types.is_integer_dtype(dtype)) or \
+               (column_type in ("float", "float32", "float64") and pd.api.types.is_float_dtype(dtype)):
+                continue
+            dtypes[column] = column_type
+        dataframe = dataframe.astype(dtypes) if len(dtypes) > 0 else dataframe
+        if downcast:
+            dataframe = downcast_numeric_dtypes(dataframe, columns=[column for column in dataframe.columns
+                                                                    if schema_columns.get(column) != "category"])
+        return dataframe
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+def get_dataframe_columns(file_path: str) -> list:
+    """
+    Returns the column names of a saved dataframe by reading only its header/metadata
+    """
+    try:
+        file_format = os.path.splitext(file_path)[1]
+        if file_format == ".parquet":
+            import pyarrow.parquet as pq
+            return pq.read_schema(file_path).names
+        if file_format == ".feather":
+            # Feather v2 files are Arrow IPC files, so the schema can be read without the data
+            import pyarrow as pa
+            with pa.memory_map(file_path) as source:
+                return pa.ipc.open_file(source).schema.names
+        return list(pd.read_csv(file_path, nrows=0).columns)
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+def save_dataframe(file_path: str, dataframe: pd.DataFrame):
+    """
+    Saves the dataframe in the format given by the file extension (.parquet, .feather or .csv)
+    """
+    try:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        file_format = os.path.splitext(file_path)[1]
+        if file_format == ".parquet":
+            dataframe.to_parquet(file_path, index=False)
+        elif file_format == ".feather":
+            dataframe.reset_index(drop=True).to_feather(file_path)
+        else:
+            dataframe.to_csv(file_path, index=False)
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+def read_dataframe(file_path: str, columns: list = None, dtype: dict = None) -> pd.DataFrame:
+    """
+    Reads a dataframe saved by `save_dataframe`.
+    columns: only these columns are read from the file, columns missing in the file are ignored
+    dtype: `read_csv` dtype map of csv files, parquet and feather files keep their saved types
+    """
+    try:
+        file_format = os.path.splitext(file_path)[1]
+        if columns is not None:
+            wanted_columns = set(columns)
+            columns = [column for column in get_dataframe_columns(file_path) if column in wanted_columns]
+        if file_format == ".parquet":
+            return pd.read_parquet(file_path, columns=columns)
+        if file_format == ".feather":
+            return pd.read_feather(file_path, columns=columns)
+        return pd.read_csv(file_path, usecols=columns, dtype=dtype)
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+def iter_dataframe_chunks(file_path: str, chunk_size: int, columns: list = None, dtype: dict = None):
+    """
+    Yields a dataframe saved by `save_dataframe` as dataframes of at most chunk_size rows,
+    without reading the whole file. columns and dtype as in `read_dataframe`
+    """
+    try:
+        file_format = os.path.splitext(file_path)[1]
+        if columns is not None:
+            wanted_columns = set(columns)
+            columns = [column for column in get_dataframe_columns(file_path) if column in wanted_columns]
+        if file_format == ".parquet":
+            import pyarrow.parquet as pq
+            for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size, columns=columns):
+                yield batch.to_pandas()
+        elif file_format == ".feather":
+            import pyarrow as pa
+            with pa.memory_map(file_path) as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    batch = batch.select(columns) if columns is not None else batch
+                    for start in range(0, batch.num_rows, chunk_size):
+                        yield batch.slice(start, chunk_size).to_pandas()
+        else:
+            yield from pd.read_csv(file_path, usecols=columns, dtype=dtype, chunksize=chunk_size)
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+def get_dataframe_n_rows(file_path: str) -> int:
+    """
+    Returns the number of rows of a saved dataframe, from the metadata of parquet and feather files
+    """
+    try:
+        file_format = os.path.splitext(file_path)[1]
+        if file_format == ".parquet":
+            import pyarrow.parquet as pq
+            return pq.ParquetFile(file_path).metadata.num_rows
+        if file_format == ".feather":
+            import pyarrow as pa
+            with pa.memory_map(file_path) as source:
+                reader = pa.ipc.open_file(source)
+                return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+        return sum(len(chunk) for chunk in pd.read_csv(file_path, usecols=[0], chunksize=1000000))
+    except Exception as e:
+        raise CustomException(e, sys) from e
+
+def load_data(file_path: str, schema_file_path: str, columns: list = None) -> pd.DataFrame:
     try:
         dataset_schema = read_yaml_file(schema_file_path)
 
         schema = dataset_schema[DATASET_SCHEMA_COLUMNS_KEY]
 
-        dataframe = pd.read_csv(file_path )
-
-        error_message = ""
+        dataframe = read_dataframe(file_path, columns=columns, dtype=get_schema_read_dtypes(schema))
 
-        for column in dataframe.columns:
-            if column in list(schema.keys()):
-                dataframe[column].astype(schema[column])
-            else:
-                error_message = f"{error_message} \nColumn: [{column}] is not in the schema."
+        # Value types are checked by the schema validator, only the column names are checked here
+        error_message = "".join(f" \nColumn: [{column}] is not in the schema."
+                                for column in dataframe.columns if column not in schema)
         if len(error_message) > 0:
             raise Exception(error_message)
-        return dataframe
+        return apply_schema_dtypes(dataframe, schema, downcast=True)
 
     except Exception as e:
         raise CustomException(e, sys) from e
     
-def load_numpy_array_data(file_path: str) -> np.array:
+def load_numpy_array_data(file_path: str, mmap_mode: str = None) -> np.array:
     """
     load numpy array data from file
     file_path: str location of file to load
+    mmap_mode: when given (e.g. 'r'), the .npy file is memory-mapped instead of read into memory
     return: np.array data loaded
     """
     try:
+        if mmap_mode is not None:
+            return np.load(file_path, mmap_mode=mmap_mode)
         with open(file_path, 'rb') as file_obj:
             return np.load(file_obj, allow_pickle=True)
     except Exception as e:
@@ -106,5 +292,36 @@ def save_data(file_path:str, data:pd.DataFrame):
         dir_path = os.path.dirname(file_path)
         os.makedirs(dir_path, exist_ok=True)
         data.to_csv(file_path,index = None)
+    except Exception as e:
+        raise CustomException(e,sys) from e
+
+def get_peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of the current process in MB, None where the
+    resource module isn't available (Windows)
+    """
+    try:
+        try:
+            import resource
+        except ImportError:
+            return None
+        # ru_maxrss is reported in KB on linux and in bytes on macOS
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            return peak_rss / (1024 * 1024)
+        return peak_rss / 1024
+    except Exception as e:
+        raise CustomException(e,sys) from e
+
+def get_file_hash(file_path:str, block_size:int = 1024 * 1024) -> str:
+    """
+    Returns the sha256 hex digest of the file content, read in blocks of `block_size` bytes
+    """
+    try:
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as file_obj:
+            for block in iter(lambda: file_obj.read(block_size), b""):
+                sha256.update(block)
+        return sha256.hexdigest()
     except Exception as e:
         raise CustomException(e,sys) from e
\ No newline at end of file
@@ -0,0 +1,130 @@
+from credit_score.components.compiled_transformer import CompiledTransformer
+from credit_score.components.compiled_transformer import SMALL_BATCH_SIZE
+from credit_score.exception import CustomException
+from sklearn.compose import ColumnTransformer
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import MinMaxScaler
+from sklearn.preprocessing import OneHotEncoder
+from sklearn.preprocessing import OrdinalEncoder
+from sklearn.preprocessing import PowerTransformer
+from sklearn.preprocessing import StandardScaler
+import numpy as np
+import pandas as pd
+import pytest
+import warnings
+
+
+def make_dataframe(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    random = np.random.default_rng(seed)
+    dataframe = pd.DataFrame({
+        "Age": random.integers(18, 60, n_rows).astype(np.float64),
+        "Annual_Income": random.lognormal(10, 1, n_rows),
+        "Interest_Rate": random.integers(1, 30, n_rows).astype(np.float64),
+        "Occupation": pd.Categorical(random.choice(["Engineer", "Doctor", "Lawyer"], n_rows)),
+        "Credit_Mix": pd.Categorical(random.choice(["Bad", "Standard", "Good"], n_rows)),
+    })
+    # Missing values in every column, so that the imputation is checked too
+    for column in dataframe.columns:
+        dataframe.loc[random.random(n_rows) < 0.1, column] = np.nan
+    return dataframe
+
+
+def make_preprocessor(dataframe: pd.DataFrame) -> ColumnTransformer:
+    # Same kind of pipelines as DataTransformation.get_data_transformer_object
+    preprocessor = ColumnTransformer([
+        ("num_pipeline", Pipeline(steps=[
+            ("imputer", SimpleImputer(strategy="median")),
+            ("scaler", MinMaxScaler())
+        ]), ["Age", "Annual_Income"]),
+        ("onehot_pipeline", Pipeline(steps=[
+            ("imputer", SimpleImputer(strategy="most_frequent")),
+            ("one_hot_encoder", OneHotEncoder(handle_unknown="ignore", sparse_output=False)),
+            ("scaler", StandardScaler(with_mean=False))
+        ]), ["Occupation"]),
+        ("ordinal_pipeline", Pipeline(steps=[
+            ("imputer", SimpleImputer(strategy="most_frequent")),
+            ("ordinal_encoder", OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1)),
+            ("scaler", StandardScaler(with_mean=False))
+        ]), ["Credit_Mix"]),
+        ("power_transformer", Pipeline(steps=[
+            ("imputer", SimpleImputer(strategy="median")),
+            ("scaler", MinMaxScaler()),
+            ("transformer", PowerTransformer())
+        ]), ["Interest_Rate"])
+    ], remainder="passthrough")
+    return preprocessor.fit(dataframe)
+
+
+@pytest.fixture(scope="module")
+def fitted():
+    preprocessor = make_preprocessor(make_dataframe(500))
+    return preprocessor, CompiledTransformer(preprocessor)
+
+
+@pytest.mark.parametrize("n_rows", [1, 2, SMALL_BATCH_SIZE, SMALL_BATCH_SIZE + 1, 300])
+def test_transform_matches_sklearn(fitted, n_rows):
+    # Up to SMALL_BATCH_SIZE rows categories are looked up with a dict, above it with pandas
+    preprocessor, compiled = fitted
+    dataframe = make_dataframe(n_rows, seed=n_rows)
+    np.testing.assert_allclose(compiled.transform(dataframe), preprocessor.transform(dataframe),
+                               rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.parametrize("n_rows", [1, SMALL_BATCH_SIZE + 1])
+def test_transform_of_unknown_and_missing_categories(fitted, n_rows):
+    preprocessor, compiled = fitted
+    dataframe = make_dataframe(n_rows, seed=1)
+    dataframe["Occupation"] = dataframe["Occupation"].cat.add_categories(["Pilot"])
+    dataframe["Credit_Mix"] = dataframe["Credit_Mix"].cat.add_categories(["Unknown"])
+    dataframe.loc[dataframe.index[0], ["Occupation", "Credit_Mix"]] = ["Pilot", "Unknown"]
+    if n_rows > 1:
+        dataframe.loc[dataframe.index[1], ["Occupation", "Credit_Mix"]] = np.nan
+    np.testing.assert_allclose(compiled.transform(dataframe), preprocessor.transform(dataframe),
+                               rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.parametrize("categorical", [True, False])
+def test_large_batch_unknown_categories_without_warnings(fitted, categorical):
+    # pandas deprecated building a Categorical from values outside of its categories,
+    # warnings are errors here so that the large batch lookup can't rely on it
+    preprocessor, compiled = fitted
+    dataframe = make_dataframe(SMALL_BATCH_SIZE + 1, seed=5)
+    dataframe["Occupation"] = dataframe["Occupation"].astype(object)
+    dataframe.loc[dataframe.index[:3], "Occupation"] = ["Pilot", "Pilot", np.nan]
+    dataframe["Credit_Mix"] = pd.Series(np.nan, index=dataframe.index, dtype=object)
+    if categorical:
+        dataframe["Occupation"] = dataframe["Occupation"].astype("category")
+        dataframe["Credit_Mix"] = dataframe["Credit_Mix"].astype("category")
+    expected = preprocessor.transform(dataframe)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        actual = compiled.transform(dataframe)
+    np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-4)
+
+
+def test_transform_into_buffer(fitted):
+    preprocessor, compiled = fitted
+    dataframe = make_dataframe(10, seed=2)
+    buffer = np.empty((10, compiled.n_features_out), dtype=np.float32)
+    assert compiled.transform(dataframe, out=buffer) is buffer
+    np.testing.assert_allclose(buffer, preprocessor.transform(dataframe), rtol=1e-4, atol=1e-4)
+
+
+def test_check_parity(fitted):
+    preprocessor, compiled = fitted
+    assert compiled.check_parity(preprocessor, make_dataframe(200, seed=3)) < 1e-4
+
+
+def test_check_parity_raises_on_small_batch_mismatch(fitted, monkeypatch):
+    # A bug of the dict lookup alone must be caught, even though the whole dataframe matches
+    preprocessor, compiled = fitted
+    encode = compiled.encode
+
+    def broken_encode(values, output):
+        codes = encode(values, output)
+        return codes[::-1].copy() if len(values) <= SMALL_BATCH_SIZE else codes
+
+    monkeypatch.setattr(compiled, "encode", broken_encode)
+    with pytest.raises(CustomException):
+        compiled.check_parity(preprocessor, make_dataframe(200, seed=4))
@@ -0,0 +1,53 @@
+from credit_score.components.db_operation import MongoDB
+from credit_score.benchmark.in_memory_mongo import InMemoryMongoClient
+import numpy as np
+import pandas as pd
+import pytest
+
+
+COLUMNS = {"ID": "category", "Month": "int", "Age": "int", "Income": "float",
+           "Occupation": "category", "Empty": "float", "Empty_Category": "category"}
+
+
+@pytest.fixture
+def db():
+    db = MongoDB(client=InMemoryMongoClient())
+    db.create_and_check_collection()
+    db.insert_dataframe(pd.DataFrame({
+        "ID": ["a", "b", "c"],
+        "Month": [1, 2, 3],
+        "Age": [20, np.nan, 40],
+        "Income": [1.5, np.nan, 3.5],
+        "Occupation": ["Doctor", None, "Lawyer"],
+        "Empty": [np.nan] * 3,
+        "Empty_Category": [None] * 3,
+    }), batch_size=2, n_threads=1)
+    return db
+
+
+def test_fetch_columnar_df_types(db):
+    dataframe = db.fetch_columnar_df(COLUMNS, drop_columns=["ID"], batch_size=2)
+
+    assert list(dataframe.columns) == [column for column in COLUMNS if column != "ID"]
+    assert dataframe["Month"].dtype == np.int64
+    # An int column with a missing value comes back as float, missing values as NaN
+    assert dataframe["Age"].dtype == np.float64
+    assert dataframe["Age"].isna().tolist() == [False, True, False]
+    assert isinstance(dataframe["Occupation"].dtype, pd.CategoricalDtype)
+    assert dataframe["Occupation"].tolist()[0] == "Doctor" and pd.isna(dataframe["Occupation"][1])
+
+
+def test_fetch_columnar_df_keeps_all_missing_columns(db):
+    dataframe = db.fetch_columnar_df({**COLUMNS, "Not_Inserted": "int"}, drop_columns=["ID"])
+
+    for column in ("Empty", "Empty_Category", "Not_Inserted"):
+        assert len(dataframe[column]) == 3
+        assert dataframe[column].isna().all()
+
+
+def test_fetch_columnar_df_of_empty_collection():
+    db = MongoDB(client=InMemoryMongoClient())
+    dataframe = db.fetch_columnar_df(COLUMNS, drop_columns=["ID"], coll_name="Training")
+
+    assert len(dataframe) == 0
+    assert list(dataframe.columns) == [column for column in COLUMNS if column != "ID"]
@@ -0,0 +1,117 @@
+from credit_score.components.download_cache import DownloadCache
+from credit_score.benchmark.http_server import serve_directory
+from credit_score.exception import CustomException
+import hashlib
+import os
+import pytest
+import time
+
+
+FILE_SIZE = 3 * 1024 * 1024
+
+
+@pytest.fixture
+def served_file(tmp_path):
+    """
+    Directory to serve with one random file, returns (directory, file name, content)
+    """
+    directory = tmp_path / "served"
+    directory.mkdir()
+    content = os.urandom(FILE_SIZE)
+    (directory / "dataset.zip").write_bytes(content)
+    return str(directory), "dataset.zip", content
+
+
+@pytest.fixture(autouse=True)
+def no_retry_wait(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+
+
+def read_bytes(file_path: str) -> bytes:
+    with open(file_path, "rb") as file_obj:
+        return file_obj.read()
+
+
+def test_file_url_and_cache_hit(tmp_path, served_file):
+    directory, file_name, content = served_file
+    url = f"file://{os.path.join(directory, file_name)}"
+    cache = DownloadCache(str(tmp_path / "cache"), parallel_min_bytes=1024 * 1024)
+
+    file_path = cache.get(url)
+    assert read_bytes(file_path) == content
+    assert os.path.basename(file_path) == f"{hashlib.sha256(content).hexdigest()}.zip"
+    mtime_ns = os.stat(file_path).st_mtime_ns
+    assert cache.get(url) == file_path
+    assert os.stat(file_path).st_mtime_ns == mtime_ns
+
+
+def test_resume_after_interrupted_download(tmp_path, served_file):
+    directory, file_name, content = served_file
+    with serve_directory(directory, fail_after_bytes=500 * 1024, failures=2) as server:
+        cache = DownloadCache(str(tmp_path / "cache"), n_segments=1)
+        file_path = cache.get(f"{server.base_url}/{file_name}")
+        # Two interrupted requests, then one for the rest of the file
+        assert server.n_requests == 3
+    assert read_bytes(file_path) == content
+    assert not any(".part" in file_name for file_name in os.listdir(tmp_path / "cache"))
+
+
+def test_parallel_segments(tmp_path, served_file):
+    directory, file_name, content = served_file
+    with serve_directory(directory, fail_after_bytes=100 * 1024, failures=3) as server:
+        cache = DownloadCache(str(tmp_path / "cache"), n_segments=4, parallel_min_bytes=1024 * 1024)
+        file_path = cache.get(f"{server.base_url}/{file_name}")
+        # One request per segment, plus one per interrupted request
+        assert server.n_requests == 4 + 3
+    assert read_bytes(file_path) == content
+
+
+def test_server_without_ranges(tmp_path, served_file):
+    directory, file_name, content = served_file
+    with serve_directory(directory, accept_ranges=False, fail_after_bytes=1024 * 1024, failures=1) as server:
+        cache = DownloadCache(str(tmp_path / "cache"), n_segments=4, parallel_min_bytes=1)
+        file_path = cache.get(f"{server.base_url}/{file_name}")
+        # No segments, and the interrupted download starts over
+        assert server.n_requests == 2
+    assert read_bytes(file_path) == content
+
+
+def test_sha256_mismatch(tmp_path, served_file):
+    directory, file_name, content = served_file
+    cache = DownloadCache(str(tmp_path / "cache"))
+    with serve_directory(directory) as server:
+        url = f"{server.base_url}/{file_name}"
+        with pytest.raises(CustomException, match="expected"):
+            cache.get(url, expected_sha256="0" * 64)
+        assert os.listdir(tmp_path / "cache" / "files") == []
+
+        file_path = cache.get(url, expected_sha256=hashlib.sha256(content).hexdigest().upper())
+    assert read_bytes(file_path) == content
+    # A file with the expected sha256 is used without reaching the server
+    assert cache.get("http://127.0.0.1:1/dataset.zip", expected_sha256=hashlib.sha256(content).hexdigest()) \
+        == file_path
+
+
+def test_cache_hit_when_validator_unchanged(tmp_path, served_file):
+    directory, file_name, content = served_file
+    cache = DownloadCache(str(tmp_path / "cache"))
+    with serve_directory(directory) as server:
+        url = f"{server.base_url}/{file_name}"
+        file_path = cache.get(url)
+        assert server.n_requests == 1
+        assert cache.get(url) == file_path
+        assert server.n_requests == 1
+
+        # A new version of the file has another ETag and is downloaded again
+        new_content = os.urandom(1024)
+        with open(os.path.join(directory, file_name), "wb") as file_obj:
+            file_obj.write(new_content)
+        new_file_path = cache.get(url)
+        assert server.n_requests == 2
+    assert new_file_path != file_path
+    assert read_bytes(new_file_path) == new_content
+
+
+def test_unreachable_url_without_cached_file(tmp_path):
+    with pytest.raises(CustomException):
+        DownloadCache(str(tmp_path / "cache"), retries=0).get("http://127.0.0.1:1/dataset.zip")
@@ -0,0 +1,38 @@
+from credit_score.components.hyperparameter_search import HyperparameterSearch
+from credit_score.exception import CustomException
+from sklearn.datasets import make_classification
+from sklearn.ensemble import RandomForestClassifier
+import pytest
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return make_classification(n_samples=300, n_features=8, n_informative=4, n_classes=3, random_state=0)
+
+
+@pytest.mark.parametrize("mode", ["grid", "halving"])
+@pytest.mark.parametrize("resource", ["n_samples", "n_estimators"])
+def test_search_modes_and_resources(dataset, mode, resource):
+    x, y = dataset
+    param_grid = {"n_estimators": [10, 30], "max_depth": [2, 4, 6]}
+    search = HyperparameterSearch(estimator=RandomForestClassifier(random_state=0, n_jobs=1),
+                                  param_grid=param_grid, mode=mode, resource=resource,
+                                  cv=3, factor=3, n_jobs=1).fit(x, y)
+
+    assert search.n_trials_ >= 1
+    assert 0 < search.best_score_ <= 1
+    assert search.best_params_["max_depth"] in param_grid["max_depth"]
+    if resource == "n_estimators":
+        # The number of trees is the budget, the best candidate gets the one of the last rung
+        assert search.best_params_["n_estimators"] == 30
+        assert all(result["params"]["n_estimators"] == result["resource"] for result in search.cv_results_)
+    if mode == "grid":
+        # Every candidate once, n_estimators is no longer a searched parameter when it is the resource
+        n_candidates = 6 if resource == "n_samples" else 3
+        assert search.n_trials_ == len(search.cv_results_) == n_candidates
+
+
+@pytest.mark.parametrize("arguments", [{"mode": "random"}, {"resource": "max_depth"}])
+def test_unsupported_mode_or_resource(arguments):
+    with pytest.raises(CustomException):
+        HyperparameterSearch(estimator=RandomForestClassifier(), param_grid={"max_depth": [2]}, **arguments)
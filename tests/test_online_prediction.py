@@ -0,0 +1,73 @@
+from credit_score.pipeline.online_prediction import MicroBatcher
+import numpy as np
+import threading
+import time
+
+
+def double(dataframe):
+    if (dataframe["x"] < 0).any():
+        raise ValueError("negative value")
+    return np.asarray(dataframe["x"] * 2)
+
+
+def get_results(futures: list) -> list:
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result(timeout=10))
+        except ValueError as e:
+            results.append(str(e))
+    return results
+
+
+def test_rows_are_scored_in_batches():
+    batches = []
+    batcher = MicroBatcher(lambda dataframe: batches.append(len(dataframe)) or double(dataframe),
+                           max_batch_size=8, max_batch_delay_ms=100)
+    futures = [batcher.submit({"x": i}) for i in range(8)]
+    assert get_results(futures) == [2 * i for i in range(8)]
+    assert batches == [8]
+
+
+def test_failing_row_only_fails_its_own_request():
+    batcher = MicroBatcher(double, max_batch_size=8, max_batch_delay_ms=100)
+    futures = [batcher.submit({"x": -1 if i == 3 else i}) for i in range(8)]
+    assert get_results(futures) == [0, 2, 4, "negative value", 8, 10, 12, 14]
+
+
+def test_batch_callback_runs_on_its_own_thread():
+    scored = []
+    callback_done = threading.Event()
+
+    def batch_callback(dataframe):
+        scored.append((threading.current_thread().name, dataframe["x"].tolist()))
+        callback_done.set()
+
+    batcher = MicroBatcher(double, max_batch_size=8, max_batch_delay_ms=100, batch_callback=batch_callback)
+    futures = [batcher.submit({"x": -1 if i == 3 else i}) for i in range(8)]
+    get_results(futures)
+    assert callback_done.wait(timeout=10)
+    # Only the rows scored are passed on
+    assert scored == [("batch-callback", [0, 1, 2, 4, 5, 6, 7])]
+
+
+def test_batches_are_skipped_while_callback_is_behind():
+    started, release = threading.Event(), threading.Event()
+
+    def batch_callback(dataframe):
+        started.set()
+        release.wait(timeout=10)
+
+    batcher = MicroBatcher(double, max_batch_size=1, max_batch_delay_ms=0,
+                           batch_callback=batch_callback, max_pending_callbacks=1)
+    assert get_results([batcher.submit({"x": 0})]) == [0]
+    assert started.wait(timeout=10)
+    # The callback blocks on the first batch: the next one waits for it and the two after are
+    # skipped, while scoring goes on
+    assert get_results([batcher.submit({"x": i}) for i in range(1, 4)]) == [2, 4, 6]
+    deadline = time.perf_counter() + 10
+    while batcher.n_skipped_callbacks < 2 and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert batcher.n_skipped_callbacks == 2
+    release.set()
+    batcher.callback_batches.join()
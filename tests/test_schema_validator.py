@@ -0,0 +1,80 @@
+from credit_score.components.schema_validator import SchemaValidator
+from credit_score.exception import CustomException
+import io
+import pytest
+
+
+DATASET_SCHEMA = {
+    "Columns": {"ID": "category", "Age": "int", "Income": "float", "Occupation": "category",
+                "Credit_Score": "category"},
+    "NumberOfColumns": 5,
+    "target_column": "Credit_Score",
+    "drop_columns": "ID",
+}
+HEADER = "ID,Age,Income,Occupation,Credit_Score\n"
+
+
+def validate(csv: str, validator: SchemaValidator = None, chunk_size: int = 2) -> list:
+    validator = validator or SchemaValidator(DATASET_SCHEMA, check_number_of_columns=True, chunk_size=chunk_size)
+    return [(error.column, error.check) for error in validator.validate(io.BytesIO(csv.encode()))]
+
+
+def test_valid_file():
+    validator = SchemaValidator(DATASET_SCHEMA, check_number_of_columns=True, chunk_size=2)
+    csv = HEADER + "a,20,1.5,Doctor,Good\nb,,2.5,,Poor\nc,40,,Lawyer,Standard\n"
+    assert validate(csv, validator) == []
+    assert validator.n_rows_ == 3
+
+
+def test_unknown_column():
+    csv = "ID,Age,Income,Occupation,Credit_Score,Extra\na,20,1.5,Doctor,Good,1\n"
+    assert validate(csv) == [(None, "number_of_columns"), ("Extra", "unknown_column")]
+
+
+def test_missing_column():
+    csv = "ID,Age,Income,Credit_Score\na,20,1.5,Good\n"
+    assert validate(csv) == [(None, "number_of_columns"), ("Occupation", "missing_column")]
+
+
+def test_missing_optional_columns_of_features():
+    # Files to predict on need the feature columns only
+    validator = SchemaValidator.for_features(DATASET_SCHEMA)
+    assert validate("Age,Income,Occupation\n20,1.5,Doctor\n", validator) == []
+    assert validate("Age,Occupation\n20,Doctor\n", validator) == [("Income", "missing_column")]
+
+
+def test_bad_float():
+    # The invalid value is in a later chunk than the first one
+    csv = HEADER + "a,20,1.5,Doctor,Good\nb,30,2.5,Doctor,Good\nc,40,abc,Lawyer,Poor\n"
+    validator = SchemaValidator(DATASET_SCHEMA, chunk_size=2)
+    errors = validator.validate(io.BytesIO(csv.encode()))
+    assert [(error.column, error.check) for error in errors] == [("Income", "invalid_type")]
+    assert "1 values" in errors[0].message and "[abc]" in errors[0].message
+
+
+def test_non_integer_int():
+    csv = HEADER + "a,20,1.5,Doctor,Good\nb,20.5,2.5,Doctor,Good\nc,x,2.5,Doctor,Good\n"
+    errors = SchemaValidator(DATASET_SCHEMA, chunk_size=10).validate(io.BytesIO(csv.encode()))
+    assert [(error.column, error.check) for error in errors] == [("Age", "invalid_type")]
+    assert "2 values" in errors[0].message
+
+
+def test_all_missing_column():
+    csv = HEADER + "a,20,,Doctor,Good\nb,30,,Lawyer,Poor\nc,40,,Lawyer,Poor\n"
+    assert validate(csv) == [("Income", "all_missing")]
+
+
+def test_header_only_file():
+    validator = SchemaValidator(DATASET_SCHEMA, check_number_of_columns=True)
+    errors = validate(HEADER, validator)
+    assert sorted(errors) == sorted((column, "all_missing") for column in DATASET_SCHEMA["Columns"])
+    assert validator.n_rows_ == 0
+
+
+def test_check_raises_with_every_error():
+    csv = "ID,Age,Credit_Score,Extra\na,abc,Good,1\n"
+    with pytest.raises(CustomException) as error:
+        SchemaValidator(DATASET_SCHEMA).check(io.BytesIO(csv.encode()))
+    message = str(error.value)
+    for text in ("Extra", "Income", "Occupation", "Age"):
+        assert text in message
@@ -0,0 +1,123 @@
+from credit_score.components.tree_export import TreeEnsemble
+from credit_score.components.tree_export import export_tree_model
+from credit_score.components.tree_export import check_export_equivalence
+from credit_score.exception import CustomException
+from sklearn.datasets import make_classification
+from sklearn.ensemble import ExtraTreesClassifier
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from xgboost import XGBClassifier
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    x, y = make_classification(n_samples=600, n_features=8, n_informative=5, n_classes=3, random_state=0)
+    x = x.astype(np.float32)
+    x_missing = x.copy()
+    x_missing[np.random.default_rng(0).random(x.shape) < 0.15] = np.nan
+    return x, x_missing, y
+
+
+def export_and_load(model, tmp_path, **kwargs) -> TreeEnsemble:
+    return TreeEnsemble(export_tree_model(model, str(tmp_path / "export"), **kwargs))
+
+
+def assert_same_predictions(model, ensemble: TreeEnsemble, x: np.ndarray):
+    np.testing.assert_allclose(ensemble.predict_proba(x), model.predict_proba(x), atol=1e-5)
+    np.testing.assert_array_equal(ensemble.predict(x), model.predict(x))
+    assert check_export_equivalence(model, ensemble, x) <= 1e-5
+
+
+@pytest.mark.parametrize("model_class", [RandomForestClassifier, ExtraTreesClassifier])
+def test_sklearn_forest(dataset, tmp_path, model_class):
+    x, _, y = dataset
+    model = model_class(n_estimators=20, max_depth=6, random_state=0).fit(x, y)
+    ensemble = export_and_load(model, tmp_path)
+    assert ensemble.meta["n_trees"] == 20
+    assert_same_predictions(model, ensemble, x)
+
+
+def test_random_forest_with_missing_values(dataset, tmp_path):
+    # Splits learnt with missing values send them to the side stored in default_left
+    _, x_missing, y = dataset
+    model = RandomForestClassifier(n_estimators=20, max_depth=6, random_state=0).fit(x_missing, y)
+    ensemble = export_and_load(model, tmp_path)
+    assert ensemble.default_left.any()
+    assert_same_predictions(model, ensemble, x_missing)
+
+
+@pytest.mark.parametrize("booster", ["gbtree", "dart"])
+def test_xgboost_with_missing_values(dataset, tmp_path, booster):
+    _, x_missing, y = dataset
+    model = XGBClassifier(n_estimators=20, max_depth=4, booster=booster, random_state=0).fit(x_missing, y)
+    ensemble = export_and_load(model, tmp_path)
+    assert ensemble.meta["n_trees"] == 20 * 3
+    assert ensemble.default_left.any() and not ensemble.default_left.all()
+    assert_same_predictions(model, ensemble, x_missing)
+
+
+def test_xgboost_early_stopping(dataset, tmp_path):
+    # Only the trees up to the best iteration are exported, as the sklearn wrapper predicts with them
+    x, x_missing, y = dataset
+    model = XGBClassifier(n_estimators=300, max_depth=6, learning_rate=0.5, early_stopping_rounds=3,
+                          random_state=0)
+    model.fit(x_missing[:300], y[:300], eval_set=[(x_missing[300:], y[300:])], verbose=False)
+    assert model.best_iteration < 299
+    ensemble = export_and_load(model, tmp_path)
+    assert ensemble.meta["n_trees"] == (model.best_iteration + 1) * 3
+    assert_same_predictions(model, ensemble, x_missing)
+
+
+def test_class_labels(dataset, tmp_path):
+    x, _, y = dataset
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(x, y)
+    ensemble = export_and_load(model, tmp_path, class_labels=["Good", "Poor", "Standard"])
+    assert ensemble.class_labels_.tolist() == ["Good", "Poor", "Standard"]
+
+
+def test_export_replaces_previous_export(dataset, tmp_path):
+    x, _, y = dataset
+    export_and_load(XGBClassifier(n_estimators=5).fit(x, y), tmp_path)
+    model = RandomForestClassifier(n_estimators=5, random_state=0).fit(x, y)
+    ensemble = export_and_load(model, tmp_path)
+    assert ensemble.meta["model_type"] == "random_forest"
+    assert_same_predictions(model, ensemble, x)
+
+
+def test_equivalence_check_fails_for_another_model(dataset, tmp_path):
+    x, _, y = dataset
+    ensemble = export_and_load(RandomForestClassifier(n_estimators=5, random_state=0).fit(x, y), tmp_path)
+    other_model = RandomForestClassifier(n_estimators=5, random_state=1).fit(x, y)
+    with pytest.raises(CustomException):
+        check_export_equivalence(other_model, ensemble, x)
+
+
+def test_unsupported_model_type(dataset, tmp_path):
+    x, _, y = dataset
+    with pytest.raises(NotImplementedError, match="LogisticRegression"):
+        export_tree_model(LogisticRegression().fit(x, y), str(tmp_path / "export"))
+
+
+def test_unsupported_xgboost_booster(dataset, tmp_path):
+    x, _, y = dataset
+    with pytest.raises(NotImplementedError, match="gblinear"):
+        export_tree_model(XGBClassifier(n_estimators=5, booster="gblinear").fit(x, y), str(tmp_path / "export"))
+
+
+def test_unsupported_xgboost_objective(dataset, tmp_path):
+    x, _, y = dataset
+    binary_y = (y > 0).astype(int)
+    with pytest.raises(NotImplementedError, match="binary:logistic"):
+        export_tree_model(XGBClassifier(n_estimators=5).fit(x, binary_y), str(tmp_path / "export"))
+
+
+def test_unsupported_xgboost_categorical_splits(dataset, tmp_path):
+    x, _, y = dataset
+    features = pd.DataFrame(x[:, :2], columns=["a", "b"])
+    features["category"] = pd.Categorical(np.where(y == 0, "x", np.where(y == 1, "y", "z")))
+    model = XGBClassifier(n_estimators=5, enable_categorical=True, tree_method="hist").fit(features, y)
+    with pytest.raises(NotImplementedError, match="categorical"):
+        export_tree_model(model, str(tmp_path / "export"))